@@ -0,0 +1,75 @@
+"""
+Measure the log throughput, in records per second, through the QueueHandler
+pipeline configured by setup_logging.
+
+    python benchmarks/bench_logging.py --records 100000
+"""
+
+import argparse
+import json
+import logging
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, override
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
+
+from log.logger import JSONFormatter, setup_logging, stop_logging  # noqa: E402
+
+
+class StdlibJSONFormatter(JSONFormatter):
+    """The formatter as it was before msgspec, for comparison."""
+
+    @override
+    def format(self, record: logging.LogRecord) -> str:
+        return json.dumps(self._prepare_log_dict(record), default=str)
+
+
+def run(records: int, logger_name: str, *, baseline: bool) -> tuple[float, int]:
+    """Log records through the pipeline, return the rate and how many were written."""
+    with tempfile.TemporaryDirectory() as log_dir:
+        setup_logging(log_dir)
+        if baseline:
+            file_handler: logging.Handler = logging.getHandlerByName("file_json")
+            file_handler.setFormatter(
+                StdlibJSONFormatter(fmt_keys=file_handler.formatter.fmt_keys),
+            )
+        logger: logging.Logger = logging.getLogger(logger_name)
+
+        start: float = time.perf_counter()
+        for i in range(records):
+            logger.info("Downloaded %.2f%% of %s", i / records * 100, "Some title")
+        # Stopping the listener waits until the queue is drained.
+        stop_logging()
+        elapsed: float = time.perf_counter() - start
+        logging.shutdown()
+        with (Path(log_dir) / "pymusicterm.log.jsonl").open("rb") as f:
+            written: int = sum(1 for _ in f)
+    return records / elapsed, written
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--records", type=int, default=50_000)
+    args: argparse.Namespace = parser.parse_args()
+
+    results: dict[str, Any] = {
+        "stdlib_json": run(args.records, "bench", baseline=True),
+        "msgspec": run(args.records, "bench", baseline=False),
+    }
+    for name, (rate, _) in results.items():
+        print(f"{name:>18}: {rate:>12,.0f} records/s")
+
+    # The downloader logger rate limits its progress records, most of them are
+    # dropped by the filter and never reach the formatter.
+    rate, written = run(args.records, "api.downloader", baseline=False)
+    print(
+        f"\nhot path (rate limited): {rate:,.0f} records/s logged, "
+        f"{written:,} of {args.records:,} written",
+    )
+
+
+if __name__ == "__main__":
+    main()
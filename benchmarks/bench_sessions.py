@@ -0,0 +1,180 @@
+"""
+Load test of server.py: open N browser sessions at once and report the
+startup time and the memory of each one.
+
+The startup time runs from the websocket connection to the first screen
+sent by the app. The memory is the resident set of each app process, read
+from /proc, so this benchmark runs on Linux only. The server runs with an
+empty HOME, pass --music-dir to serve an existing library instead of an
+empty one. One more session than the cap is opened last, to check that it
+is refused.
+
+    python benchmarks/bench_sessions.py --sessions 4 --music-dir ~/.pymusicterm/musics
+"""
+
+import argparse
+import asyncio
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import aiohttp
+
+ROOT_DIR: Path = Path(__file__).resolve().parents[1]
+STARTUP_TIMEOUT = 60
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def descendants(pid: int) -> list[int]:
+    children: dict[int, list[int]] = {}
+    for entry in Path("/proc").iterdir():
+        if not entry.name.isdigit():
+            continue
+        try:
+            stat: str = (entry / "stat").read_text()
+        except OSError:
+            continue
+        # The name of the process is in parentheses and may hold spaces
+        parent = int(stat.rsplit(")", 1)[1].split()[1])
+        children.setdefault(parent, []).append(int(entry.name))
+    found: list[int] = []
+    stack: list[int] = [pid]
+    while stack:
+        for child in children.get(stack.pop(), []):
+            found.append(child)
+            stack.append(child)
+    return found
+
+
+def rss_mb(pid: int) -> float:
+    for line in Path(f"/proc/{pid}/status").read_text().splitlines():
+        if line.startswith("VmRSS:"):
+            return int(line.split()[1]) / 1024
+    return 0.0
+
+
+def app_processes(server_pid: int) -> list[int]:
+    pids: list[int] = []
+    for pid in descendants(server_pid):
+        try:
+            cmdline: bytes = Path(f"/proc/{pid}/cmdline").read_bytes()
+        except OSError:
+            continue
+        if cmdline.startswith(sys.executable.encode()) and b"main.py" in cmdline:
+            pids.append(pid)
+    return pids
+
+
+async def wait_for_server(port: int) -> None:
+    deadline: float = time.monotonic() + STARTUP_TIMEOUT
+    while time.monotonic() < deadline:
+        try:
+            _, writer = await asyncio.open_connection("127.0.0.1", port)
+        except OSError:
+            await asyncio.sleep(0.1)
+            continue
+        writer.close()
+        return
+    msg = "The server did not start"
+    raise TimeoutError(msg)
+
+
+async def open_session(
+    http: aiohttp.ClientSession,
+    url: str,
+) -> tuple[aiohttp.ClientWebSocketResponse, float]:
+    """Open a session and return it with its time to first screen in ms."""
+    start: float = time.perf_counter()
+    websocket: aiohttp.ClientWebSocketResponse = await http.ws_connect(url)
+    async with asyncio.timeout(STARTUP_TIMEOUT):
+        async for message in websocket:
+            if message.type == aiohttp.WSMsgType.BINARY:
+                return websocket, (time.perf_counter() - start) * 1000
+    msg = "The session closed before its first screen"
+    raise ConnectionError(msg)
+
+
+async def refused(http: aiohttp.ClientSession, url: str) -> bool:
+    try:
+        websocket: aiohttp.ClientWebSocketResponse = await http.ws_connect(url)
+    except aiohttp.WSServerHandshakeError as e:
+        return e.status == 503  # noqa: PLR2004
+    await websocket.close()
+    return False
+
+
+async def run(args: argparse.Namespace, home: str) -> None:
+    app_dir = Path(home) / ".pymusicterm"
+    app_dir.mkdir()
+    if args.music_dir:
+        music_dir: str = str(Path(args.music_dir).expanduser().resolve())
+        (app_dir / "setting.toml").write_text(f"music_dir = {music_dir!r}\n")
+    port: int = free_port()
+    server = subprocess.Popen(  # noqa: S603
+        [
+            sys.executable,
+            str(ROOT_DIR / "server.py"),
+            "--port",
+            str(port),
+            "--max-sessions",
+            str(args.sessions),
+        ],
+        cwd=ROOT_DIR,
+        env={**os.environ, "HOME": home},
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    url: str = f"ws://127.0.0.1:{port}/ws?width=120&height=40"
+    try:
+        start: float = time.perf_counter()
+        await wait_for_server(port)
+        print(f"server ready in {(time.perf_counter() - start) * 1000:.0f} ms")
+        async with aiohttp.ClientSession() as http:
+            opened = await asyncio.gather(
+                *(open_session(http, url) for _ in range(args.sessions)),
+            )
+            startups: list[float] = [startup for _, startup in opened]
+            # Let the sessions settle before measuring them
+            await asyncio.sleep(args.settle)
+            memory: list[float] = [rss_mb(pid) for pid in app_processes(server.pid)]
+            over_cap: bool = await refused(http, url)
+            for websocket, _ in opened:
+                await websocket.close()
+    finally:
+        server.terminate()
+        server.wait()
+
+    print(f"{'session':<10}{'startup ms':>12}{'rss MB':>10}")
+    for index, startup in enumerate(startups):
+        rss: str = f"{memory[index]:.1f}" if index < len(memory) else "-"
+        print(f"{index:<10}{startup:>12.0f}{rss:>10}")
+    print(
+        f"\n{args.sessions} sessions: startup median "
+        f"{statistics.median(startups):.0f} ms, max {max(startups):.0f} ms, "
+        f"memory {sum(memory):.0f} MB in total",
+    )
+    print(f"session over the cap refused: {'yes' if over_cap else 'NO'}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sessions", type=int, default=4)
+    parser.add_argument("--music-dir")
+    parser.add_argument("--settle", type=float, default=2)
+    args: argparse.Namespace = parser.parse_args()
+    with tempfile.TemporaryDirectory() as home:
+        asyncio.run(run(args, home))
+
+
+if __name__ == "__main__":
+    main()
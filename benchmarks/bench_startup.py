@@ -0,0 +1,100 @@
+"""
+Measure the startup of the app: the import time of its slowest modules and
+the time from launching the interpreter to the first frame.
+
+Each run is a fresh interpreter with an empty HOME, so the user's settings
+and library are not touched. Exits with status 1 when the median time to
+first frame is over the threshold.
+
+    python benchmarks/bench_startup.py --runs 5 --max-first-frame-ms 1000
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+SRC_DIR: Path = Path(__file__).resolve().parents[1] / "src"
+
+FIRST_FRAME_SCRIPT = """
+import asyncio
+import time
+
+import main
+from setting import SettingManager
+
+
+async def run() -> None:
+    app = main.PyMusicTerm(SettingManager())
+    async with app.run_test() as pilot:
+        await pilot.pause()
+        print(time.time())
+    app.lyrics_service.shutdown()
+
+
+asyncio.run(run())
+"""
+
+
+def run_python(args: list[str], home: str) -> subprocess.CompletedProcess[str]:
+    return subprocess.run(  # noqa: S603
+        [sys.executable, *args],
+        cwd=SRC_DIR,
+        env={**os.environ, "HOME": home},
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+
+
+def import_times(home: str) -> dict[str, float]:
+    """Cumulative import time in ms of each module imported by main."""
+    result = run_python(["-X", "importtime", "-c", "import main"], home)
+    times: dict[str, float] = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line.removeprefix("import time:").split("|")
+        times[name.strip()] = int(cumulative) / 1000
+    return times
+
+
+def first_frame(home: str) -> float:
+    """Time in ms from starting the interpreter to the first frame."""
+    start: float = time.time()
+    result = run_python(["-c", FIRST_FRAME_SCRIPT], home)
+    return (float(result.stdout.split()[-1]) - start) * 1000
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=15)
+    parser.add_argument("--max-first-frame-ms", type=float, default=1000)
+    args: argparse.Namespace = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as home:
+        # The first run creates the app folders, keep it out of the results
+        first_frame(home)
+        times: dict[str, float] = import_times(home)
+        frames: list[float] = [first_frame(home) for _ in range(args.runs)]
+
+    print(f"{'module':<40}{'cumulative ms':>14}")
+    for name, ms in sorted(times.items(), key=lambda item: -item[1])[: args.top]:
+        print(f"{name:<40}{ms:>14.1f}")
+    median: float = statistics.median(frames)
+    print(
+        f"\ntime to first frame: median {median:.0f} ms, "
+        f"min {min(frames):.0f} ms, max {max(frames):.0f} ms",
+    )
+    if median > args.max_first_frame_ms:
+        print(f"REGRESSION: over the {args.max_first_frame_ms:.0f} ms threshold")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+"""
+Measure the throughput of the streaming server with concurrent clients.
+
+A library of random files is served from a temporary folder. Each client
+downloads whole tracks, then random 256 KiB ranges like a player seeking in
+them, and the aggregate throughput is reported with and without sendfile.
+
+    python benchmarks/bench_streaming.py --clients 8 --tracks 16 --track-mb 8
+"""
+
+import argparse
+import http.client
+import os
+import random
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from collections.abc import Callable
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
+
+from api.protocols import SongData  # noqa: E402
+from api.streaming import StreamServer  # noqa: E402
+
+RANGE_SIZE = 256 * 1024
+CHUNK_SIZE = 1024 * 1024
+
+
+class Library:
+    """Just what the server reads from the player."""
+
+    def __init__(self, songs: list[SongData]) -> None:
+        self.list_of_downloaded_songs: list[SongData] = songs
+
+    def add_listener(self, listener: Callable[[str], None]) -> None:
+        pass
+
+
+def make_library(folder: Path, tracks: int, track_mb: int) -> Library:
+    songs: list[SongData] = []
+    for index in range(tracks):
+        path: Path = folder / f"track{index:04}.mp3"
+        path.write_bytes(os.urandom(track_mb * 1024 * 1024))
+        songs.append(
+            SongData(
+                title=f"Track {index}",
+                artist=["Artist"],
+                duration="3:00",
+                video_id=path.stem,
+                thumbnail=None,
+                album="Album",
+                path=str(path),
+            ),
+        )
+    return Library(songs)
+
+
+def client(
+    port: int,
+    library: Library,
+    args: argparse.Namespace,
+    seed: int,
+    results: list[tuple[int, list[float]]],
+) -> None:
+    rng = random.Random(seed)
+    connection = http.client.HTTPConnection("127.0.0.1", port)
+    received = 0
+    latencies: list[float] = []
+    songs: list[SongData] = library.list_of_downloaded_songs
+    for _ in range(args.downloads):
+        song: SongData = rng.choice(songs)
+        connection.request("GET", f"/tracks/{song.video_id}")
+        response = connection.getresponse()
+        while chunk := response.read(CHUNK_SIZE):
+            received += len(chunk)
+    for _ in range(args.ranges):
+        song = rng.choice(songs)
+        start: int = rng.randrange(args.track_mb * 1024 * 1024 - RANGE_SIZE)
+        request_start: float = time.perf_counter()
+        connection.request(
+            "GET",
+            f"/tracks/{song.video_id}",
+            headers={"Range": f"bytes={start}-{start + RANGE_SIZE - 1}"},
+        )
+        response = connection.getresponse()
+        received += len(response.read())
+        latencies.append((time.perf_counter() - request_start) * 1000)
+    connection.close()
+    results.append((received, latencies))
+
+
+def run(library: Library, args: argparse.Namespace, use_sendfile: bool) -> None:  # noqa: FBT001
+    server = StreamServer(library, "", "127.0.0.1", 0, use_sendfile=use_sendfile)
+    server.start()
+    port: int = server.server_address[1]
+    results: list[tuple[int, list[float]]] = []
+    threads: list[threading.Thread] = [
+        threading.Thread(target=client, args=(port, library, args, seed, results))
+        for seed in range(args.clients)
+    ]
+    start: float = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed: float = time.perf_counter() - start
+    server.stop()
+
+    received: int = sum(count for count, _ in results)
+    latencies: list[float] = sorted(ms for _, times in results for ms in times)
+    name: str = "sendfile" if use_sendfile else "read/write"
+    print(
+        f"{name:<12}{received / elapsed / 1024 / 1024:>10.0f} MB/s"
+        f"{statistics.median(latencies):>12.2f} ms"
+        f"{latencies[int(len(latencies) * 0.99)]:>12.2f} ms",
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--clients", type=int, default=8)
+    parser.add_argument("--tracks", type=int, default=16)
+    parser.add_argument("--track-mb", type=int, default=8)
+    parser.add_argument("--downloads", type=int, default=4, help="per client")
+    parser.add_argument("--ranges", type=int, default=200, help="per client")
+    args: argparse.Namespace = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as folder:
+        library: Library = make_library(Path(folder), args.tracks, args.track_mb)
+        print(f"{args.clients} clients, {args.tracks} tracks of {args.track_mb} MB")
+        print(f"{'':<12}{'throughput':>15}{'range p50':>15}{'range p99':>15}")
+        for use_sendfile in (True, False):
+            run(library, args, use_sendfile)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,383 @@
+"""
+Measure the hot paths of the app on synthetic libraries of growing size.
+
+For each size, a fresh interpreter with an empty HOME reads the library with
+get_downloaded_songs, then drives the app headless to time redraw_playlist,
+search_playlist for each keystroke of a query, a YouTube Music search and the
+rendering of its results, and update_time while long synced lyrics play.
+parse_lyrics, the lyrics sidecar and LRCLib lookups are measured once.
+
+Searches and lyrics lookups go to a local server answering like YouTube Music
+and LRCLib, so runs neither need the network nor depend on it. The tracks are
+kept in --cache between runs, and the results are written as JSON to compare
+them across commits:
+
+    python benchmarks/bench_suite.py --sizes 100,1000,10000,50000 --output HEAD.json
+    python benchmarks/bench_suite.py --output new.json --compare HEAD.json
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from collections.abc import Callable
+from pathlib import Path
+
+from synthetic import FakeServer, make_library, make_lrc, video_id
+
+ROOT: Path = Path(__file__).resolve().parents[1]
+SRC_DIR: Path = ROOT / "src"
+DEFAULT_CACHE: Path = Path(tempfile.gettempdir()) / "pymusicterm-bench"
+# Typed in the playlist input one character at a time
+PLAYLIST_QUERY = "night"
+SEARCH_QUERIES: list[str] = ["daft punk", "lofi beats", "jazz piano", "summer hits"]
+
+
+def summary(samples: list[float]) -> dict[str, float]:
+    """Timings in ms of several runs of a measure."""
+    ordered: list[float] = sorted(samples)
+    return {
+        "median_ms": statistics.median(ordered),
+        "min_ms": ordered[0],
+        "max_ms": ordered[-1],
+        "p95_ms": ordered[min(int(len(ordered) * 0.95), len(ordered) - 1)],
+    }
+
+
+def timed(function: Callable[[], object], runs: int) -> list[float]:
+    samples: list[float] = []
+    for _ in range(runs):
+        start: float = time.perf_counter()
+        function()
+        samples.append((time.perf_counter() - start) * 1000)
+    return samples
+
+
+# The workers run in a fresh interpreter, in src with HOME set by run_worker
+
+
+def fake_ytmusic(url: str) -> "YTMusic":  # noqa: F821
+    """A YTMusic whose ytmusicapi client gets its results from the fake server."""
+    import requests  # noqa: PLC0415
+
+    from api.ytmusic import YTMusic  # noqa: PLC0415
+
+    class Client:
+        def search(self, query: str, filter: str) -> list[dict]:  # noqa: A002
+            response = requests.get(  # noqa: S113
+                f"{url}/search",
+                params={"q": query, "filter": filter},
+            )
+            return response.json()
+
+    # Skip the ytmusicapi client and its requests to YouTube Music
+    ytm: YTMusic = YTMusic.__new__(YTMusic)
+    ytm.client = Client()
+    return ytm
+
+
+async def measure_library(args: argparse.Namespace) -> dict:
+    from textual.widgets import Input, ListView, TabbedContent  # noqa: PLC0415
+
+    import main  # noqa: PLC0415
+    from setting import SettingManager  # noqa: PLC0415
+
+    setting = SettingManager()
+    app = main.PyMusicTerm(setting)
+    player = app.player
+    results: dict = {
+        "tracks": len(player.list_of_downloaded_songs),
+        "get_downloaded_songs": summary(timed(player.get_downloaded_songs, args.runs)),
+    }
+    if not args.ui:
+        app.lyrics_service.shutdown()
+        return results
+
+    player.ytm_ready.set_result(fake_ytmusic(args.server))
+    async with app.run_test(size=(160, 48)) as pilot:
+        # The library scan and the covers written after it
+        await app.workers.wait_for_complete()
+        tabs: TabbedContent = app.query_one("#tabbed_content")
+        tabs.active = "playlist"
+        await pilot.pause()
+        playlist_results: ListView = app.query_one("#playlist_results")
+
+        samples: list[float] = []
+        for _ in range(args.runs):
+            await playlist_results.clear()
+            await pilot.pause()
+            start: float = time.perf_counter()
+            await app.redraw_playlist()
+            await pilot.pause()
+            samples.append((time.perf_counter() - start) * 1000)
+        results["redraw_playlist"] = summary(samples)
+
+        playlist_input: Input = app.query_one("#playlist_input")
+        keystrokes: dict[str, dict] = {}
+        for length in range(1, len(PLAYLIST_QUERY) + 1):
+            prefix: str = PLAYLIST_QUERY[:length]
+            with app.prevent(Input.Changed):
+                playlist_input.value = prefix
+            start = time.perf_counter()
+            await app.search_playlist()
+            await pilot.pause()
+            keystrokes[prefix] = {
+                "ms": (time.perf_counter() - start) * 1000,
+                "matches": len(playlist_results.children),
+            }
+        results["search_playlist"] = {
+            **summary([keystroke["ms"] for keystroke in keystrokes.values()]),
+            "keystrokes": keystrokes,
+        }
+        with app.prevent(Input.Changed):
+            playlist_input.value = ""
+        await app.redraw_playlist()
+        await pilot.pause()
+
+        query_samples: list[float] = []
+        render_samples: list[float] = []
+        for query in SEARCH_QUERIES:
+            start = time.perf_counter()
+            songs = await asyncio.to_thread(player.query, query, "songs")
+            query_samples.append((time.perf_counter() - start) * 1000)
+            start = time.perf_counter()
+            await app.update_search_results(songs)
+            await pilot.pause()
+            render_samples.append((time.perf_counter() - start) * 1000)
+        results["search_query"] = summary(query_samples)
+        results["search_render"] = summary(render_samples)
+
+        # The first track is the only one long enough to play the lyrics
+        lrc: str = make_lrc(args.lrc_lines, 600)
+        (Path(setting.lyrics_dir) / f"{video_id(0)}.lrc").write_text(lrc)
+        index: int = next(
+            i
+            for i, song in enumerate(player.list_of_downloaded_songs)
+            if song.video_id == video_id(0)
+        )
+        player.play_from_list(index)
+        await app.update_lyrics_view()
+        await pilot.pause()
+        samples = []
+        for tick in range(args.ticks):
+            # Lyrics lines move on at each tick, like a fast song
+            player.seek_to(1 + tick * 590 / args.ticks)
+            start = time.perf_counter()
+            await app.update_time()
+            samples.append((time.perf_counter() - start) * 1000)
+        results["update_time"] = {
+            **summary(samples),
+            "lyrics_lines": args.lrc_lines,
+            "playing": player.playing,
+        }
+        player.stop()
+    app.lyrics_service.shutdown()
+    return results
+
+
+def measure_lyrics(args: argparse.Namespace) -> dict:
+    from api import lyrics  # noqa: PLC0415
+    from setting import SettingManager  # noqa: PLC0415
+
+    # Creates the lyrics folder
+    SettingManager()
+    results: dict = {}
+    for lines in sorted({100, 1000, args.lrc_lines}):
+        text: str = make_lrc(lines, 600)
+        samples: list[float] = timed(lambda text=text: lyrics.parse_lyrics(text), args.runs)
+        # Written first, a sidecar older than its lyrics is compiled again
+        (lyrics.LYRICS_DIR / f"{video_id(0)}.lrc").write_text(text)
+        compiled: list[float] = timed(
+            lambda text=text: lyrics.compile_lyrics(video_id(0), text),
+            args.runs,
+        )
+        loaded: list[float] = timed(lambda: lyrics.load_lyrics(video_id(0)), args.runs)
+        results[str(lines)] = {
+            "parse_lyrics": summary(samples),
+            "lines_per_second": lines / (statistics.median(samples) / 1000),
+            "compile_lyrics": summary(compiled),
+            "load_lyrics": summary(loaded),
+        }
+
+    # Each lookup is a new song, as the lyrics service never asks twice
+    samples = []
+    for index in range(args.runs):
+        start: float = time.perf_counter()
+        found: bool = lyrics.download_lyrics(
+            f"fetch{index:06}",
+            track=f"Track {index}",
+            album="Album",
+            artist="Artist",
+            duration=600,
+        )
+        samples.append((time.perf_counter() - start) * 1000)
+        if not found:
+            msg = "The fake LRCLib server returned no lyrics"
+            raise RuntimeError(msg)
+    results["download_lyrics"] = {**summary(samples), "lyrics_lines": args.lrc_lines}
+    return results
+
+
+def worker(args: argparse.Namespace) -> None:
+    sys.path.insert(0, str(SRC_DIR))
+    settings: Path = Path.home() / ".pymusicterm" / "setting.toml"
+    settings.parent.mkdir(parents=True, exist_ok=True)
+    # No prefetching, it would search and download the results
+    settings.write_text(f'music_dir = "{args.library}"\nprefetch = false\n')
+    if args.worker == "library":
+        results: dict = asyncio.run(measure_library(args))
+    else:
+        results = measure_lyrics(args)
+    print(json.dumps(results))
+
+
+def run_worker(args: argparse.Namespace, server: FakeServer, *extra: str) -> dict:
+    with tempfile.TemporaryDirectory() as home:
+        result = subprocess.run(  # noqa: S603
+            [
+                sys.executable,
+                str(Path(__file__).resolve()),
+                "--runs",
+                str(args.runs),
+                "--ticks",
+                str(args.ticks),
+                "--lrc-lines",
+                str(args.lrc_lines),
+                "--server",
+                server.url,
+                *extra,
+            ],
+            cwd=SRC_DIR,
+            env={
+                **os.environ,
+                "HOME": home,
+                "PYMUSICTERM_LRCLIB_URL": f"{server.url}/api/",
+            },
+            capture_output=True,
+            text=True,
+            check=False,
+        )
+    if result.returncode != 0:
+        sys.exit(f"{' '.join(extra)} failed:\n{result.stderr}")
+    return json.loads(result.stdout.splitlines()[-1])
+
+
+def git_commit() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"],  # noqa: S607
+            cwd=ROOT,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def flatten(results: dict, prefix: str = "") -> dict[str, float]:
+    """The median of each measure, by its path in the results."""
+    medians: dict[str, float] = {}
+    for key, value in results.items():
+        if not isinstance(value, dict):
+            continue
+        if "median_ms" in value:
+            medians[f"{prefix}{key}"] = value["median_ms"]
+        medians.update(flatten(value, f"{prefix}{key}."))
+    return medians
+
+
+def report(results: dict, baseline: dict | None) -> None:
+    medians: dict[str, float] = flatten(results["results"])
+    before: dict[str, float] = flatten(baseline["results"]) if baseline else {}
+    print(f"{'measure':<48}{'median ms':>12}{'baseline':>12}{'ratio':>8}")
+    for name, median in medians.items():
+        line: str = f"{name:<48}{median:>12.2f}"
+        if name in before:
+            line += f"{before[name]:>12.2f}{median / before[name]:>8.2f}"
+        print(line)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    parser.add_argument("--sizes", default="100,1000,10000,50000")
+    parser.add_argument(
+        "--ui-max-size",
+        type=int,
+        default=10000,
+        help="drive the app for the libraries up to this size only",
+    )
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--ticks", type=int, default=200, help="of update_time")
+    parser.add_argument("--lrc-lines", type=int, default=5000)
+    parser.add_argument("--cache", type=Path, default=DEFAULT_CACHE)
+    parser.add_argument("--output", type=Path, help="write the results as JSON")
+    parser.add_argument("--compare", type=Path, help="results of an earlier run")
+    parser.add_argument("--worker", choices=["library", "lyrics"], help=argparse.SUPPRESS)
+    parser.add_argument("--library", type=Path, help=argparse.SUPPRESS)
+    parser.add_argument("--ui", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--server", help=argparse.SUPPRESS)
+    args: argparse.Namespace = parser.parse_args()
+    if args.worker:
+        worker(args)
+        return
+
+    sizes: list[int] = sorted(int(size) for size in args.sizes.split(","))
+    server = FakeServer(args.lrc_lines)
+    server.start()
+    results: dict = {"lyrics": {}, "libraries": {}}
+    try:
+        for size in sizes:
+            start: float = time.perf_counter()
+            library: Path = make_library(args.cache, size)
+            print(f"library of {size} tracks ready in {time.perf_counter() - start:.1f} s")
+            extra: list[str] = ["--worker", "library", "--library", str(library)]
+            if size <= args.ui_max_size:
+                extra.append("--ui")
+            results["libraries"][str(size)] = run_worker(args, server, *extra)
+        library = make_library(args.cache, sizes[0])
+        results["lyrics"] = run_worker(
+            args,
+            server,
+            "--worker",
+            "lyrics",
+            "--library",
+            str(library),
+        )
+    finally:
+        server.stop()
+
+    run: dict = {
+        "commit": git_commit(),
+        "date": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "args": {
+            "sizes": sizes,
+            "ui_max_size": args.ui_max_size,
+            "runs": args.runs,
+            "ticks": args.ticks,
+            "lrc_lines": args.lrc_lines,
+        },
+        "results": results,
+    }
+    baseline: dict | None = (
+        json.loads(args.compare.read_text()) if args.compare else None
+    )
+    report(run, baseline)
+    if args.output:
+        args.output.write_text(json.dumps(run, indent=2))
+        print(f"\nresults written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
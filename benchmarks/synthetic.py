@@ -0,0 +1,238 @@
+"""
+Synthetic data for the benchmarks: tagged mp3 libraries, long LRC lyrics and
+a local server standing in for YouTube Music and LRCLib.
+
+The mp3 files are silent MPEG-1 Layer III frames behind the same ID3 tags as
+the files of the downloader. Their first frame is an Info header declaring
+the length of a real song, so they are read like real songs while holding a
+few frames of audio only.
+"""
+
+import io
+import json
+import os
+import random
+import struct
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qs, urlparse
+
+from mutagen.id3 import APIC, ID3, TALB, TIT2, TPE1
+from PIL import Image
+
+# MPEG-1 Layer III, no CRC, 32 kbps, 32 kHz, mono: 144 bytes per frame
+FRAME_HEADER = b"\xff\xfb\x18\xc0"
+FRAME_SIZE = 144
+SAMPLES_PER_FRAME = 1152
+SAMPLE_RATE = 32000
+# Side information of a mono MPEG-1 frame, the Info header follows it
+SIDE_INFO_SIZE = 17
+SILENT_FRAME: bytes = FRAME_HEADER + bytes(FRAME_SIZE - len(FRAME_HEADER))
+# Like the thumbnails[0] of a YouTube Music search result
+COVER_SIZE = 60
+
+WORDS: list[str] = (
+    "love night heart dream fire rain summer light dance blue gold "
+    "city road river star wild home time shadow echo silver ocean "
+    "storm paper ghost neon velvet honey thunder glass moon"
+).split()
+
+VIDEO_ID_LENGTH = 11
+
+
+def video_id(index: int) -> str:
+    return f"bench{index:06}"
+
+
+def frame_count(seconds: float) -> int:
+    return max(round(seconds * SAMPLE_RATE / SAMPLES_PER_FRAME), 1)
+
+
+def info_frame(frames: int) -> bytes:
+    """First frame of the file, telling its number of frames to the readers."""
+    frame = bytearray(SILENT_FRAME)
+    # Flag 1: the number of frames is present
+    header: bytes = b"Info" + struct.pack(">II", 1, frames)
+    start: int = len(FRAME_HEADER) + SIDE_INFO_SIZE
+    frame[start : start + len(header)] = header
+    return bytes(frame)
+
+
+def cover(rng: random.Random) -> bytes:
+    image: Image.Image = Image.new(
+        "RGB",
+        (COVER_SIZE, COVER_SIZE),
+        (rng.randrange(256), rng.randrange(256), rng.randrange(256)),
+    )
+    buffer = io.BytesIO()
+    image.save(buffer, format="JPEG")
+    return buffer.getvalue()
+
+
+def title(rng: random.Random) -> str:
+    return " ".join(rng.choice(WORDS) for _ in range(rng.randint(1, 4))).title()
+
+
+def write_track(
+    path: Path,
+    rng: random.Random,
+    seconds: float,
+    *,
+    audio_frames: int = 8,
+) -> None:
+    """Write a tagged mp3 of seconds, holding audio_frames of silence."""
+    frames: int = frame_count(seconds)
+    audio_frames = min(audio_frames, frames)
+    path.write_bytes(info_frame(frames) + SILENT_FRAME * audio_frames)
+    tags = ID3()
+    tags.add(TIT2(encoding=3, text=title(rng)))
+    tags.add(
+        TPE1(
+            encoding=3,
+            text=[title(rng) for _ in range(rng.choice((1, 1, 1, 2, 3)))],
+        ),
+    )
+    tags.add(TALB(encoding=3, text=title(rng)))
+    tags.add(APIC(encoding=3, mime="image/jpeg", type=3, desc="", data=cover(rng)))
+    tags.save(path)
+
+
+def make_tracks(folder: Path, count: int, *, playable: int = 0) -> list[Path]:
+    """
+    Write count tracks in folder, keeping the ones already written.
+
+    The first playable tracks are ten minutes of real audio, for the
+    benchmarks that play them.
+    """
+    folder.mkdir(parents=True, exist_ok=True)
+    paths: list[Path] = []
+    for index in range(count):
+        path: Path = folder / f"{video_id(index)}.mp3"
+        paths.append(path)
+        if path.exists():
+            continue
+        rng = random.Random(index)
+        if index < playable:
+            write_track(path, rng, 600, audio_frames=frame_count(600))
+        else:
+            write_track(path, rng, rng.randint(120, 420))
+    return paths
+
+
+def make_library(cache: Path, size: int, *, playable: int = 1) -> Path:
+    """
+    A music folder of size tracks, hard links to the tracks of the cache.
+
+    The libraries of every size share the same tracks, which are written
+    once and kept between runs.
+    """
+    tracks: list[Path] = make_tracks(cache / "tracks", size, playable=playable)
+    library: Path = cache / f"library-{size}"
+    library.mkdir(exist_ok=True)
+    for track in tracks:
+        link: Path = library / track.name
+        if not link.exists():
+            os.link(track, link)
+    return library
+
+
+def make_lrc(lines: int, seconds: float, seed: int | str = 0) -> str:
+    """Synced lyrics of lines evenly spread over seconds."""
+    rng = random.Random(seed)
+    step: float = seconds / lines
+    out: list[str] = []
+    for index in range(lines):
+        minutes, rest = divmod(index * step, 60)
+        words: str = " ".join(rng.choice(WORDS) for _ in range(rng.randint(3, 9)))
+        out.append(f"[{int(minutes):02}:{rest:05.2f}] {words}")
+    return "\n".join(out) + "\n"
+
+
+class FakeServer(ThreadingHTTPServer):
+    """
+    Answers like LRCLib and like the YouTube Music search, from 127.0.0.1.
+
+    /api/get                    LRCLib lyrics of lrc_lines lines
+    /search?q=&filter=          search results as parsed by ytmusicapi
+    /thumbnails/<video_id>.jpg  the thumbnails of the results
+    """
+
+    daemon_threads = True
+
+    def __init__(self, lrc_lines: int, results: int = 20) -> None:
+        super().__init__(("127.0.0.1", 0), FakeHandler)
+        self.lrc_lines: int = lrc_lines
+        self.results: int = results
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        self.shutdown()
+        self.server_close()
+
+    def search(self, query: str) -> list[dict]:
+        rng = random.Random(query)
+        results: list[dict] = []
+        for _ in range(self.results):
+            result_id: str = "".join(
+                rng.choice("abcdefghijklmnopqrstuvwxyz0123456789")
+                for _ in range(VIDEO_ID_LENGTH)
+            )
+            results.append(
+                {
+                    "videoId": result_id,
+                    "title": title(rng),
+                    "artists": [{"name": title(rng)}],
+                    "album": {"name": title(rng)},
+                    "duration": f"{rng.randint(2, 6)}:{rng.randint(0, 59):02}",
+                    "thumbnails": [{"url": f"{self.url}/thumbnails/{result_id}.jpg"}],
+                },
+            )
+        return results
+
+
+class FakeHandler(BaseHTTPRequestHandler):
+    server: FakeServer
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format: str, *args: object) -> None:  # noqa: A002
+        pass
+
+    def send(self, body: bytes, content_type: str) -> None:
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self) -> None:  # noqa: N802
+        url = urlparse(self.path)
+        query: dict[str, list[str]] = parse_qs(url.query)
+        if url.path == "/api/get":
+            track: str = query.get("track_name", [""])[0]
+            lyrics: str = make_lrc(self.server.lrc_lines, 600, seed=track)
+            body: dict = {
+                "id": 1,
+                "trackName": track,
+                "artistName": query.get("artist_name", [""])[0],
+                "albumName": query.get("album_name", [""])[0],
+                "duration": 600,
+                "instrumental": False,
+                "plainLyrics": None,
+                "syncedLyrics": lyrics,
+            }
+            self.send(json.dumps(body).encode(), "application/json")
+        elif url.path == "/search":
+            results: list[dict] = self.server.search(query.get("q", [""])[0])
+            self.send(json.dumps(results).encode(), "application/json")
+        elif url.path.startswith("/thumbnails/"):
+            self.send(cover(random.Random(url.path)), "image/jpeg")
+        else:
+            self.send_error(404)
@@ -1,11 +1,113 @@
 # RUN THIS FILE AND GO TO LOCALHOST:8000 to use the app
+"""
+Serve the app to browsers, one app process per browser session.
+
+The app of each session is a client of the player daemon, started here
+unless one is running, so the library is scanned once and the downloads and
+caches are shared whatever the number of sessions. Sessions write their
+settings to a file of their own, named after --session and removed when
+they end.
+"""
+
+import argparse
+import logging
+import shlex
+import sys
+from pathlib import Path
+from typing import Any
+
+import textual_serve.server
+from aiohttp import web
+from textual_serve.app_service import AppService
 from textual_serve.server import Server
 
-# TODO MAKE IT COMPATIBLE WITH WINDOWS AND GLOBAL INSTALLATION
+SRC_DIR: Path = Path(__file__).resolve().parent / "src"
+sys.path.insert(0, str(SRC_DIR))
+
+from daemon.client import PlayerClient, connect  # noqa: E402
+from setting import SESSION_DIR, SettingManager  # noqa: E402
+
+logger: logging.Logger = logging.getLogger(__name__)
+
+MAX_SESSIONS = 4
+
+
+class SessionAppService(AppService):
+    """The app process of one browser session."""
+
+    def __init__(self, command: str, **kwargs: Any) -> None:
+        super().__init__(command, **kwargs)
+        self.command = f"{command} --session {self.app_service_id}"
+
+    async def start(self, width: int, height: int) -> None:
+        await super().start(width, height)
+        logger.info("Session %s started", self.app_service_id)
+
+    async def stop(self) -> None:
+        await super().stop()
+        # Stopped twice by the server, the second time finds no file
+        (SESSION_DIR / f"{self.app_service_id}.toml").unlink(missing_ok=True)
+
+
+# The handler of textual-serve starts the app of each session with this class
+textual_serve.server.AppService = SessionAppService
+
+
+class SessionServer(Server):
+    """A textual-serve server with a cap on the sessions running at once."""
+
+    def __init__(self, command: str, max_sessions: int, **kwargs: Any) -> None:
+        super().__init__(command, **kwargs)
+        self.max_sessions: int = max_sessions
+        self.sessions = 0
+
+    async def handle_websocket(self, request: web.Request) -> web.StreamResponse:
+        if self.sessions >= self.max_sessions:
+            logger.warning("Refusing a session, %d are running", self.sessions)
+            return web.Response(status=503, text="Too many sessions, retry later")
+        self.sessions += 1
+        try:
+            # Returns once the app process of the session is stopped
+            return await super().handle_websocket(request)
+        finally:
+            self.sessions -= 1
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(prog="pymusicterm-server")
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument(
+        "--max-sessions",
+        type=int,
+        default=MAX_SESSIONS,
+        help="browser sessions running at once, the next ones are refused",
+    )
+    return parser.parse_args()
+
+
+def main() -> None:
+    args: argparse.Namespace = parse_args()
+    setting = SettingManager()
+    # Held until the server stops, a daemon started here stops along with it
+    try:
+        client: PlayerClient = connect(setting.app_dir)
+    except OSError as e:
+        sys.exit(f"Could not reach the player daemon: {e}")
+    songs: int = len(client.library().songs)
+    logger.info("Library of %d songs ready for the sessions", songs)
+    server = SessionServer(
+        f"{shlex.quote(sys.executable)} {shlex.quote(str(SRC_DIR / 'main.py'))}",
+        max_sessions=args.max_sessions,
+        host=args.host,
+        port=args.port,
+        title="PyMusicTerm",
+    )
+    try:
+        server.serve()
+    finally:
+        client.close()
 
-server = Server(
-    ".venv/bin/python src/main.py",
-)
 
 if __name__ == "__main__":
-    server.serve()
+    main()
@@ -0,0 +1,37 @@
+"""Cover art of the library written to disk, for the OS media controls."""
+
+import io
+import logging
+from pathlib import Path
+
+from api.protocols import SongData
+from player.util import write_atomic
+
+logger: logging.Logger = logging.getLogger(__name__)
+
+
+def cover_path(cover_dir: str, video_id: str) -> Path:
+    return Path(cover_dir) / f"{video_id}_cover.png"
+
+
+def ensure_cover(song: SongData, cover_dir: str) -> Path | None:
+    """
+    Write the thumbnail of a song, unless it already is on disk.
+
+    Returns:
+        Path | None: The cover file, None if the song has no thumbnail
+
+    """
+    path: Path = cover_path(cover_dir, song.video_id)
+    if path.exists():
+        return path
+    if song.thumbnail is None:
+        return None
+    buffer = io.BytesIO()
+    try:
+        song.thumbnail.save(buffer, format="PNG")
+        write_atomic(path, buffer.getvalue())
+    except OSError as e:
+        logger.warning("Could not write the cover of %s: %s", song.video_id, e)
+        return None
+    return path
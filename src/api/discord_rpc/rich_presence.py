@@ -1,14 +1,16 @@
 import asyncio
 import logging
 import time
-
-from pypresence import ActivityType, AioPresence, DiscordNotFound
+from dataclasses import dataclass
 
 from api.protocols import PyMusicTermPlayer, SongData
 
 CLIENT_ID = "1275918029565464608"
-UPDATE_INTERVAL = 0.7
-NO_SONG_SLEEP_INTERVAL = 5
+# Discord accepts 5 presence updates every 20 seconds
+MIN_UPDATE_INTERVAL = 20 / 5
+# Player events that change what is shown, the others would only use up the
+# update budget
+PRESENCE_EVENTS: frozenset[str] = frozenset({"track", "playpause", "seek"})
 MAX_RETRIES = 3
 RETRY_DELAY = 5
 
@@ -19,67 +21,99 @@ class RichPresenceError(Exception):
     """Custom exception for Rich Presence errors."""
 
 
-def create_progress_bar(percentage: int) -> str:
-    """Create a text-based progress bar."""
-    percentage = max(0, min(percentage, 100))
-    total_segments = 8
-    completed_segments: int = round((percentage / 100) * total_segments)
-    return "▰" * completed_segments + "▱" * (total_segments - completed_segments)
-
-
-def format_time(seconds: float) -> str:
-    """Format seconds into MM:SS string."""
-    return time.strftime("%M:%S", time.gmtime(seconds))
+@dataclass(frozen=True)
+class Presence:
+    """What is shown on Discord, read from the player when it changes."""
+
+    details: str
+    state: str
+    playing: bool
+    start: int | None
+    end: int | None
+
+
+def capture(player: PyMusicTermPlayer) -> Presence | None:
+    """Snapshot the player, to be called on the thread that changed it."""
+    song: SongData | None = player.current_song
+    if song is None:
+        return None
+    playing: bool = player.playing
+    start: int | None = None
+    end: int | None = None
+    if playing:
+        # Discord counts the time itself from the timestamps
+        started: float = time.time() - player.music_player.position
+        start = round(started)
+        if not player.music_player.loop_at_end:
+            end = round(started + player.music_player.song_length)
+    return Presence(
+        details=f"{song.title} - {song.get_formatted_artists()}",
+        state=f"Album: {song.album}",
+        playing=playing,
+        start=start,
+        end=end,
+    )
+
+
+async def rich_presence(player: PyMusicTermPlayer) -> None:
+    """Update the Rich Presence when the playback changes."""
+    # Imported here to keep pypresence out of the startup path
+    from pypresence import ActivityType, AioPresence, DiscordNotFound  # noqa: PLC0415
 
-
-async def rich_presence(player: PyMusicTermPlayer, start: int) -> None:
-    """Main function to run the Rich Presence update loop."""
     rpc = None
     retry_count = 0
+    loop: asyncio.AbstractEventLoop = asyncio.get_running_loop()
+    changed = asyncio.Event()
+    latest: Presence | None = capture(player)
+    sent: Presence | None = None
+    last_update: float = -MIN_UPDATE_INTERVAL
+
+    def publish(presence: Presence | None) -> None:
+        nonlocal latest
+        latest = presence
+        changed.set()
+
+    def on_player_event(event: str) -> None:
+        if event in PRESENCE_EVENTS:
+            loop.call_soon_threadsafe(publish, capture(player))
 
     try:
         rpc = AioPresence(CLIENT_ID)
         await rpc.connect()
         logger.info("Discord Rich Presence connected successfully")
+        player.add_listener(on_player_event)
+        if latest is not None:
+            changed.set()
 
         while True:
             try:
-                song: SongData | None = player.current_song
-                if song is None:
-                    logger.debug("No song is playing")
-                    await asyncio.sleep(NO_SONG_SLEEP_INTERVAL)
+                await changed.wait()
+                # Coalesce the events of a burst, e.g. skipping through
+                # tracks, into the last one once the rate limit allows it.
+                delay: float = last_update + MIN_UPDATE_INTERVAL - time.monotonic()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                changed.clear()
+                presence: Presence | None = latest
+                if presence is None or presence == sent:
                     continue
 
                 try:
-                    artist_name: str = song.get_formatted_artists()
-                    song_name: str = song.title
-                    album_name: str = song.album
-                    track_length: int = player.music_player.song_length
-                    track_time: int = player.music_player.position
-
-                    current_time: str = format_time(track_time)
-                    song_length: str = format_time(track_length)
-                    try:
-                        progress_percentage = int((track_time / track_length) * 100)
-                    except ZeroDivisionError:
-                        progress_percentage = 0
-
                     await rpc.update(
                         activity_type=ActivityType.LISTENING,
-                        large_text=f"{current_time} {create_progress_bar(progress_percentage)} {song_length}",
-                        details=f"{song_name} - {artist_name}",
-                        large_image="play" if player.playing else "pause",
-                        state=f"Album: {album_name}",
-                        start=start,
+                        details=presence.details,
+                        state=presence.state,
+                        large_image="play" if presence.playing else "pause",
+                        large_text="Playing" if presence.playing else "Paused",
+                        start=presence.start,
+                        end=presence.end,
                     )
+                    last_update = time.monotonic()
+                    sent = presence
 
                     # if succes reset retry count
                     retry_count = 0
 
-                except KeyError as e:
-                    logger.warning(f"Missing key in song data: {e}")
-                    await asyncio.sleep(UPDATE_INTERVAL)
-                    continue
                 except Exception as e:
                     logger.warning(f"Failed to update rich presence: {e}")
                     retry_count += 1
@@ -87,20 +121,13 @@ async def rich_presence(player: PyMusicTermPlayer, start: int) -> None:
                         logger.error("Max retries exceeded for Rich Presence updates")
                         return  # end
                     await asyncio.sleep(RETRY_DELAY)
+                    # try again with the latest snapshot
+                    changed.set()
                     continue
 
-                await asyncio.sleep(UPDATE_INTERVAL)
-
             except asyncio.CancelledError:
                 logger.info("Rich Presence task cancelled")
                 break
-            except Exception as e:
-                logger.warning(f"Unexpected error in Rich Presence update loop: {e}")
-                retry_count += 1
-                if retry_count >= MAX_RETRIES:
-                    logger.error("Too many errors in Rich Presence, stopping")
-                    return
-                await asyncio.sleep(RETRY_DELAY)
 
     except DiscordNotFound:
         logger.info("Discord not found - Rich Presence disabled")
@@ -1,17 +1,27 @@
 import io
 import logging
+import shutil
+import threading
+import time
 from collections.abc import Callable
+from concurrent.futures import Future, ThreadPoolExecutor
 from pathlib import Path
+from typing import TYPE_CHECKING, Any
 
-import music_tag
-import yt_dlp
 from PIL import Image
 
-from api.lyrics import download_lyrics
-from player.util import string_to_seconds
+from api.lyrics import delete_lyrics
+from log.metrics import metrics
+from log.tracing import NoopSpan, Span, is_enabled, span
+from player.util import FileLock, string_to_seconds
 
+from .quality import TIERS, BandwidthEstimator, QualityPolicy, QualityTier
 from .ytmusic import SongData
 
+if TYPE_CHECKING:
+    from .lyrics import LyricsService
+    from .prefetch import Prefetcher
+
 logger: logging.Logger = logging.getLogger(__name__)
 
 
@@ -25,6 +35,13 @@ def image_to_byte(image: Image.Image) -> bytes:
     return img_byte_arr_bytes
 
 
+def _duration(song: SongData) -> int | None:
+    try:
+        return string_to_seconds(song.duration)
+    except ValueError:
+        return None
+
+
 class ProgressHook:
     """Progress hook for yt-dlp to track download progress"""
 
@@ -32,9 +49,12 @@ class ProgressHook:
         self,
         song: SongData,
         callback: Callable[[int, int], None] | None = None,
+        estimator: BandwidthEstimator | None = None,
     ):
         self.song = song
         self.callback = callback
+        self.estimator = estimator
+        self._last_sample: tuple[float, int] | None = None
 
     def __call__(self, d: dict) -> None:
         if d["status"] == "downloading":
@@ -47,49 +67,99 @@ class ProgressHook:
             else:
                 return
 
-            percent = (downloaded / total) * 100
-            logger.info(f"Downloaded {percent:.2f}% of {self.song.title}")
+            if self.estimator is not None:
+                now: float = time.monotonic()
+                if self._last_sample is not None:
+                    last_time, last_downloaded = self._last_sample
+                    self.estimator.add_sample(
+                        downloaded - last_downloaded,
+                        now - last_time,
+                    )
+                self._last_sample = (now, downloaded)
+
+            logger.info(
+                "Downloaded %.2f%% of %s",
+                downloaded / total * 100,
+                self.song.title,
+            )
 
             if self.callback:
                 self.callback(downloaded, total)
 
         elif d["status"] == "finished":
-            logger.info(f"Download finished for {self.song.title}")
+            logger.info("Download finished for %s", self.song.title)
+
+
+class DownloadTrace:
+    """yt-dlp hooks timing the extraction, transfer and transcode of a download."""
+
+    def __init__(self, video_id: str) -> None:
+        self.video_id: str = video_id
+        self.extract: Span | NoopSpan = span("download.extract", video_id=video_id)
+        self.transfer: Span | NoopSpan | None = None
+        self.transcode: Span | NoopSpan | None = None
+
+    def progress_hook(self, d: dict) -> None:
+        if self.transfer is None:
+            self.extract.end()
+            self.transfer = span("download.transfer", video_id=self.video_id)
+        if d["status"] == "finished":
+            self.transfer.end(size=d.get("total_bytes"))
+
+    def postprocessor_hook(self, d: dict) -> None:
+        if d.get("postprocessor") != "ExtractAudio":
+            return
+        if d["status"] == "started":
+            self.transcode = span("download.transcode", video_id=self.video_id)
+        elif d["status"] == "finished" and self.transcode is not None:
+            self.transcode.end()
 
 
 def _download_from_yt(
     song: SongData,
     download_path: str,
     callback: Callable[[int, int], None] | None = None,
+    info: dict[str, Any] | None = None,
+    tier: QualityTier = TIERS["high"],
+    estimator: BandwidthEstimator | None = None,
 ) -> str | None:
-    """Download audio from YouTube using yt-dlp"""
+    """Download audio from YouTube using yt-dlp, reusing resolved info if given"""
+    import yt_dlp  # noqa: PLC0415
+
     try:
         output_template = str(Path(download_path) / f"{song.video_id}.%(ext)s")
 
         ydl_opts = {
-            "format": "bestaudio/best",
+            "format": tier.format,
             "postprocessors": [
                 {
                     "key": "FFmpegExtractAudio",
                     "preferredcodec": "mp3",
-                    "preferredquality": "192",
+                    "preferredquality": tier.bitrate,
                 },
             ],
             "outtmpl": output_template,
-            "progress_hooks": [ProgressHook(song, callback)],
+            "progress_hooks": [ProgressHook(song, callback, estimator)],
             "quiet": True,
             "no_warnings": True,
         }
+        if is_enabled():
+            trace = DownloadTrace(song.video_id)
+            ydl_opts["progress_hooks"].append(trace.progress_hook)
+            ydl_opts["postprocessor_hooks"] = [trace.postprocessor_hook]
 
         with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-            url: str = f"https://www.youtube.com/watch?v={song.video_id}"
-            ydl.download([url])
+            if info is not None:
+                ydl.process_ie_result(info, download=True)
+            else:
+                url: str = f"https://www.youtube.com/watch?v={song.video_id}"
+                ydl.download([url])
 
         output_file: Path = Path(download_path) / f"{song.video_id}.mp3"
 
         if output_file.exists():
             return str(output_file)
-        logger.error(f"Downloaded file not found: {output_file}")
+        logger.error("Downloaded file not found: %s", output_file)
         return None
 
     except Exception:
@@ -102,56 +172,206 @@ class Downloader:
         self,
         download_path: str,
         callback: Callable[[int, int], None] | None = None,
+        prefetcher: "Prefetcher | None" = None,
+        quality: str = "auto",
+        upgrade: bool = False,
+        lyrics_service: "LyricsService | None" = None,
     ) -> None:
         self.download_path: str = download_path
+        # Downloads are written and tagged here, then renamed into download_path
+        # so the library scanner never sees a half-written mp3.
+        self.partial_path: Path = Path(download_path) / ".partial"
+        self.partial_path.mkdir(parents=True, exist_ok=True)
         self.on_progress_callback: Callable[[int, int], None] | None = callback
+        self.prefetcher: Prefetcher | None = prefetcher
+        self.lyrics_service: LyricsService | None = lyrics_service
+        self._in_flight: dict[str, Future[str | None]] = {}
+        self._in_flight_lock = threading.Lock()
+        self.estimator = BandwidthEstimator()
+        self.policy = QualityPolicy(self.estimator, quality)
+        self.upgrade: bool = upgrade
+        self._upgrade_executor = ThreadPoolExecutor(
+            max_workers=1,
+            thread_name_prefix="quality-upgrade",
+        )
+        self.upgrade_path: Path = self.partial_path / "upgrade"
+        # The song loaded by the player: its upgrade waits until it is unloaded,
+        # replacing a file held open by the player fails on Windows.
+        self._loaded: Path | None = None
+        self._deferred: dict[str, tuple[SongData, Path]] = {}
+        self._upgrade_lock = threading.Lock()
 
     def download(self, song: SongData) -> str | None:
+        """
+        Download a song, or wait for the download already running for it.
+
+        Concurrent calls for the same video_id share a single download.
+        """
+        with self._in_flight_lock:
+            future: Future[str | None] | None = self._in_flight.get(song.video_id)
+            owner: bool = future is None
+            if owner:
+                future = Future()
+                self._in_flight[song.video_id] = future
+
+        if not owner:
+            logger.info("Waiting on in-flight download of %s", song.video_id)
+            return future.result()
+
+        metrics.incr("downloads.active")
+        try:
+            path: str | None = self._download(song)
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(path)
+            return path
+        finally:
+            metrics.incr("downloads.active", -1)
+            with self._in_flight_lock:
+                del self._in_flight[song.video_id]
+
+    def _download(self, song: SongData) -> str | None:
         self.song: SongData = song
         song_path = Path(f"{self.download_path}/{song.video_id}.mp3")
 
         if song_path.exists():
             return str(song_path)
 
-        converted_path: str | None = _download_from_yt(
-            song,
-            self.download_path,
-            self.on_progress_callback,
-        )
+        # The browser sessions share the music folder: the first process
+        # downloads the song, the others wait for it and find it on disk.
+        with self._song_lock(song):
+            if song_path.exists():
+                return str(song_path)
+            return self._fetch(song, song_path)
+
+    def _song_lock(self, song: SongData) -> FileLock:
+        return FileLock(self.partial_path / f"{song.video_id}.lock")
+
+    def _fetch(self, song: SongData, song_path: Path) -> str | None:
+        prefetched: Path | None = None
+        info: dict[str, Any] | None = None
+        if self.prefetcher is not None:
+            prefetched, info = self.prefetcher.claim(song.video_id)
+
+        tier: QualityTier = TIERS["high"]
+        if prefetched is not None:
+            # The prefetch cache may sit on another filesystem than the music
+            # folder, where a plain rename fails with EXDEV.
+            converted_path: str | None = str(
+                shutil.move(prefetched, self.partial_path / song_path.name),
+            )
+        else:
+            tier = self.policy.choose(_duration(song))
+            converted_path = _download_from_yt(
+                song,
+                str(self.partial_path),
+                self.on_progress_callback,
+                info,
+                tier,
+                self.estimator,
+            )
 
         if converted_path is None:
             return None
 
-        # Add metadata tags
+        self._tag(converted_path, song)
+        Path(converted_path).replace(song_path)
+
+        # A pinned quality is what the user asked for, keep it
+        if self.upgrade and self.policy.pinned == "auto" and tier is not TIERS["high"]:
+            self._upgrade_executor.submit(self._upgrade, song)
+
+        # Lyrics are fetched in the background, the song can play without them
+        if self.lyrics_service is not None:
+            self.lyrics_service.request(song)
+
+        return str(song_path)
+
+    def _tag(self, path: str, song: SongData) -> None:
+        """Add metadata tags"""
+        import music_tag  # noqa: PLC0415
+
         try:
-            file_path = music_tag.load_file(converted_path)
-            file_path["title"] = song.title
-            file_path["artist"] = list(song.artist)
-            file_path["artwork"] = image_to_byte(song.thumbnail)
-            file_path["album"] = song.album
-            file_path.save()
+            with span("tag", video_id=song.video_id):
+                file_path = music_tag.load_file(path)
+                file_path["title"] = song.title
+                file_path["artist"] = list(song.artist)
+                # Songs looked up by id may come without a thumbnail
+                if song.thumbnail is not None:
+                    file_path["artwork"] = image_to_byte(song.thumbnail)
+                file_path["album"] = song.album
+                file_path.save()
         except Exception:
             logger.exception("Failed to add metadata tags")
 
-        # Download lyrics
+    def set_loaded(self, path: str | None) -> None:
+        """Track the song loaded by the player and install the upgrades it held."""
+        with self._upgrade_lock:
+            self._loaded = Path(path) if path is not None else None
+            ready: list[tuple[SongData, Path]] = [
+                self._deferred.pop(video_id)
+                for video_id, (song, _) in list(self._deferred.items())
+                if self._song_path(song) != self._loaded
+            ]
+        for song, converted_path in ready:
+            self._upgrade_executor.submit(self._install_upgrade, song, converted_path)
+
+    def _song_path(self, song: SongData) -> Path:
+        return Path(f"{self.download_path}/{song.video_id}.mp3")
+
+    def _upgrade(self, song: SongData) -> None:
+        """Replace a song downloaded in a lower quality by its best quality."""
+        self.upgrade_path.mkdir(exist_ok=True)
+        with self._song_lock(song):
+            self._fetch_upgrade(song)
+
+    def _fetch_upgrade(self, song: SongData) -> None:
         try:
-            download_lyrics(
-                video_id=song.video_id,
-                track=song.title,
-                artist=song.artist[0] if song.artist else "Unknown Artist",
-                album=None,
-                duration=string_to_seconds(song.duration),
+            converted_path: str | None = _download_from_yt(
+                song,
+                str(self.upgrade_path),
+                estimator=self.estimator,
             )
+            if converted_path is None:
+                self._cleanup_upgrade(song.video_id)
+                return
+            self._tag(converted_path, song)
+            self._install_upgrade(song, Path(converted_path))
         except Exception:
-            logger.exception("Failed to download lyrics")
+            logger.exception("Failed to upgrade %s", song.video_id)
+            self._cleanup_upgrade(song.video_id)
+
+    def _install_upgrade(self, song: SongData, converted_path: Path) -> None:
+        song_path: Path = self._song_path(song)
+        with self._upgrade_lock:
+            if song_path == self._loaded:
+                logger.info("Upgrade of %s deferred, it is playing", song.video_id)
+                self._deferred[song.video_id] = (song, converted_path)
+                return
+            if not song_path.exists():
+                # Deleted while it was upgraded
+                self._cleanup_upgrade(song.video_id)
+                return
+            try:
+                converted_path.replace(song_path)
+            except OSError:
+                logger.exception("Failed to install the upgrade of %s", song.video_id)
+                self._cleanup_upgrade(song.video_id)
+                return
+        logger.info("Upgraded %s to the best quality", song.video_id)
 
-        return str(converted_path)
+    def _cleanup_upgrade(self, video_id: str) -> None:
+        for leftover in self.upgrade_path.glob(f"{video_id}.*"):
+            leftover.unlink(missing_ok=True)
 
     def delete(self, song: SongData) -> None:
         song_path: Path = Path(f"{self.download_path}/{song.video_id}.mp3")
         if song_path.exists():
             song_path.unlink()
+        with self._upgrade_lock:
+            if self._deferred.pop(song.video_id, None) is not None:
+                self._cleanup_upgrade(song.video_id)
 
-        lyric_path: Path = Path(f"{self.download_path}/{song.video_id}.lrc")
-        if lyric_path.exists():
-            lyric_path.unlink()
+        delete_lyrics(song.video_id)
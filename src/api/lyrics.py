@@ -1,17 +1,172 @@
+import atexit
 import logging
+import os
 import re
+import sys
+import threading
+import time
+from array import array
+from bisect import bisect_right
+from collections.abc import Callable, Iterable, Iterator
+from concurrent.futures import Future, ThreadPoolExecutor
 from pathlib import Path
+from typing import TYPE_CHECKING
 
-from lrcup import LRCLib
-from lrcup.controller import Track
+import msgspec
 
-from setting import Setting
+from log.metrics import metrics
+from log.tracing import span
+from player.util import string_to_seconds, write_atomic
+from setting import LYRICS_DIR
+
+if TYPE_CHECKING:
+    from lrcup import LRCLib
+    from lrcup.controller import Track
+
+    from api.protocols import SongData
 
 logger: logging.Logger = logging.getLogger(__name__)
 
-setting = Setting()
+_lrclib: "LRCLib | None" = None
+_lrclib_lock = threading.Lock()
+
+# Backoff before looking up lyrics that were not found again.
+MISS_RETRY_AFTER = 24 * 3600
+MISS_MAX_RETRY_AFTER = 30 * 24 * 3600
+ERROR_RETRY_AFTER = 3600
+
+# Negative cache changes are written at most this often (in seconds).
+SAVE_DELAY = 5.0
+
+# Another LRCLib instance to query, like a mirror or the fake server of the benchmarks
+LRCLIB_URL: str = os.environ.get("PYMUSICTERM_LRCLIB_URL", "https://lrclib.net/api/")
+
+
+class Miss(msgspec.Struct):
+    retry_after: float
+    attempts: int = 1
+
+
+class NegativeCache:
+    """Remember the lyrics lookups that failed and when they are worth retrying."""
+
+    def __init__(self, path: Path) -> None:
+        self.path: Path = path
+        self._misses: dict[str, Miss] | None = None
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._dirty = False
+        self._save_timer: threading.Timer | None = None
+        atexit.register(self.flush)
+
+    def _load(self) -> dict[str, Miss]:
+        if self._misses is None:
+            try:
+                self._misses = msgspec.json.decode(
+                    self.path.read_bytes(),
+                    type=dict[str, Miss],
+                )
+            except FileNotFoundError:
+                self._misses = {}
+            except Exception:
+                logger.exception("Failed to load the lyrics negative cache")
+                self._misses = {}
+        return self._misses
+
+    def _mark_dirty(self) -> None:
+        """Schedule a save, coalescing the misses of a whole backfill."""
+        self._dirty = True
+        if self._save_timer is None:
+            self._save_timer = threading.Timer(SAVE_DELAY, self.flush)
+            self._save_timer.daemon = True
+            self._save_timer.start()
+
+    def flush(self) -> None:
+        """Save the cache now if it changed since the last save."""
+        with self._write_lock:
+            with self._lock:
+                if self._save_timer is not None:
+                    self._save_timer.cancel()
+                    self._save_timer = None
+                if not self._dirty:
+                    return
+                self._dirty = False
+                encoded: bytes = msgspec.json.encode(self._misses)
+            try:
+                write_atomic(self.path, encoded)
+            except OSError:
+                logger.exception("Failed to save the lyrics negative cache")
+                with self._lock:
+                    self._dirty = True
+
+    def is_due(self, video_id: str) -> bool:
+        """Return True if the lyrics of video_id may be looked up now."""
+        with self._lock:
+            miss: Miss | None = self._load().get(video_id)
+        return miss is None or miss.retry_after <= time.time()
+
+    def record_miss(self, video_id: str, *, transient: bool = False) -> None:
+        with self._lock:
+            misses: dict[str, Miss] = self._load()
+            attempts: int = misses[video_id].attempts + 1 if video_id in misses else 1
+            delay: float = (
+                ERROR_RETRY_AFTER
+                if transient
+                else min(MISS_RETRY_AFTER * 2 ** (attempts - 1), MISS_MAX_RETRY_AFTER)
+            )
+            misses[video_id] = Miss(time.time() + delay, attempts)
+            self._mark_dirty()
+
+    def clear(self, video_id: str) -> None:
+        with self._lock:
+            if self._load().pop(video_id, None) is not None:
+                self._mark_dirty()
+
 
-lrclib = LRCLib()
+negative_cache = NegativeCache(LYRICS_DIR / "negative_cache.json")
+
+
+def get_lrclib() -> "LRCLib":
+    """Create the LRCLib client on first use, lrcup is slow to import."""
+    global _lrclib  # noqa: PLW0603
+    with _lrclib_lock:
+        if _lrclib is None:
+            from lrcup import LRCLib  # noqa: PLC0415
+
+            _lrclib = LRCLib(LRCLIB_URL)
+        return _lrclib
+
+
+class RateLimiter:
+    """Space out calls made from several threads by at least an interval."""
+
+    def __init__(self, per_second: float) -> None:
+        self.interval: float = 1 / per_second
+        self._next: float = 0.0
+        self._lock = threading.Lock()
+
+    def wait(self) -> None:
+        with self._lock:
+            now: float = time.monotonic()
+            delay: float = self._next - now
+            self._next = max(now, self._next) + self.interval
+        if delay > 0:
+            time.sleep(delay)
+
+
+def has_lyrics(video_id: str) -> bool:
+    """Return True if non-empty lyrics were downloaded for video_id."""
+    path: Path = LYRICS_DIR / f"{video_id}.lrc"
+    try:
+        return path.stat().st_size > 0
+    except FileNotFoundError:
+        return False
+
+
+def delete_lyrics(video_id: str) -> None:
+    """Delete the lyrics of a song and their sidecar."""
+    for suffix in (".lrc", ".lrcb"):
+        (LYRICS_DIR / f"{video_id}{suffix}").unlink(missing_ok=True)
 
 
 def download_lyrics(
@@ -20,26 +175,136 @@ def download_lyrics(
     album: str | None = None,
     artist: str | None = None,
     duration: int | None = None,
-) -> None:
+) -> bool:
+    """Download the lyrics of a song, return True if some were found."""
     logger.info(f"Lyrics search by {track}, {album}, {artist}, {duration}")  # noqa: G004
     try:
-        result: Track = lrclib.get(
-            track,
-            artist,
-            album,
-            duration,
-        )
+        with span("lyrics", video_id=video_id):
+            result: Track = get_lrclib().get(
+                track,
+                artist,
+                album,
+                duration,
+            )
         logger.info("Result: %s", result)
-        result_path: Path = Path(setting.lyrics_dir) / f"{video_id}.lrc"
+        result_path: Path = LYRICS_DIR / f"{video_id}.lrc"
+        # Instrumentals are found with neither synced nor plain lyrics
+        lyrics: str | None = None
         if result:
-            result_path.write_text(
-                result.syncedLyrics if result.syncedLyrics else result.plainLyrics,
-                encoding="utf-8",
-            )
-        else:
-            result_path.touch()
+            lyrics = result.syncedLyrics or result.plainLyrics
+        if lyrics:
+            write_atomic(result_path, lyrics.encode("utf-8"))
+            compile_lyrics(video_id, lyrics)
+            negative_cache.clear(video_id)
+            return True
+        negative_cache.record_miss(video_id)
     except Exception:
         logger.exception("EXCEPTION when downloading lyrics for song %s", video_id)
+        negative_cache.record_miss(video_id, transient=True)
+    return False
+
+
+class LyricsService:
+    """
+    Fetch lyrics on a worker pool so neither downloads nor the UI wait on LRCLib.
+
+    Listeners are called from a worker thread with the video_id and whether
+    lyrics were found once a request completes.
+    """
+
+    def __init__(self, max_workers: int = 2, requests_per_second: float = 4) -> None:
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers,
+            thread_name_prefix="lyrics",
+        )
+        self._rate_limiter = RateLimiter(requests_per_second)
+        self._pending: dict[str, Future[bool]] = {}
+        self._lock = threading.Lock()
+        self._listeners: list[Callable[[str, bool], None]] = []
+
+    def add_listener(self, listener: Callable[[str, bool], None]) -> None:
+        self._listeners.append(listener)
+
+    def request(self, song: "SongData") -> Future[bool]:
+        """Queue a lyrics lookup for a song, sharing the one already queued."""
+        if not negative_cache.is_due(song.video_id):
+            future: Future[bool] = Future()
+            future.set_result(False)
+            return future
+        with self._lock:
+            future = self._pending.get(song.video_id)
+            if future is None:
+                future = self._executor.submit(self._fetch, song)
+                self._pending[song.video_id] = future
+        return future
+
+    def _fetch(self, song: "SongData") -> bool:
+        try:
+            duration: int | None = string_to_seconds(song.duration)
+        except ValueError:
+            duration = None
+        self._rate_limiter.wait()
+        found: bool = download_lyrics(
+            video_id=song.video_id,
+            track=song.title,
+            album=song.album,
+            artist=song.artist[0] if song.artist else "Unknown Artist",
+            duration=duration,
+        )
+        with self._lock:
+            self._pending.pop(song.video_id, None)
+        for listener in self._listeners:
+            try:
+                listener(song.video_id, found)
+            except Exception:
+                logger.exception("Lyrics listener failed")
+        return found
+
+    def backfill(
+        self,
+        songs: Iterable["SongData"],
+        on_progress: Callable[[int, int], None] | None = None,
+    ) -> int:
+        """
+        Look up the lyrics of every song that has none and whose lookup is due.
+
+        Args:
+            songs: The songs of the library
+            on_progress: Called with (done, total) each time a lookup completes
+
+        Returns:
+            int: The number of lookups queued
+
+        """
+        due: list[SongData] = []
+        for song in songs:
+            if has_lyrics(song.video_id):
+                continue
+            # Empty files were the old way of recording a miss
+            (LYRICS_DIR / f"{song.video_id}.lrc").unlink(missing_ok=True)
+            if negative_cache.is_due(song.video_id):
+                due.append(song)
+
+        total: int = len(due)
+        done: int = 0
+        done_lock = threading.Lock()
+
+        def completed(_: Future[bool]) -> None:
+            nonlocal done
+            with done_lock:
+                done += 1
+                current: int = done
+            if on_progress is not None:
+                on_progress(current, total)
+
+        logger.info("Backfilling lyrics for %d songs", total)
+        for song in due:
+            self.request(song).add_done_callback(completed)
+        return total
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        negative_cache.flush()
 
 
 def time_to_seconds(t: str) -> float:
@@ -59,7 +324,103 @@ def time_to_seconds(t: str) -> float:
     return parts[0]
 
 
-def parse_lyrics(lyrics: str) -> list[tuple[int, str]]:
+def parse_lyrics(lyrics: str) -> list[tuple[float, str]]:
     pattern = r"\[(\d{1,2}:\d{2}(?::\d{2})?(?:\.\d+)?)]\s*(.*)"
     parsed = re.findall(pattern, lyrics)
     return [(time_to_seconds(t), text.strip()) for t, text in parsed]
+
+
+SIDECAR_VERSION = 1
+
+
+class CompiledLyrics(msgspec.Struct, array_like=True):
+    """
+    On-disk form of parsed lyrics (.lrcb sidecar).
+
+    times is an array("d") of timestamps and offsets an array("I") of
+    len(times) + 1 character offsets of each line into text, both in native
+    byte order.
+    """
+
+    version: int
+    byteorder: str
+    times: bytes
+    offsets: bytes
+    text: str
+
+
+class Lyrics:
+    """Timestamped lyrics lines, indexable as (time, line) tuples."""
+
+    def __init__(self, times: array, lines: list[str]) -> None:
+        self.times: array = times
+        self.lines: list[str] = lines
+
+    def __len__(self) -> int:
+        return len(self.lines)
+
+    def __getitem__(self, index: int) -> tuple[float, str]:
+        return self.times[index], self.lines[index]
+
+    def __iter__(self) -> Iterator[tuple[float, str]]:
+        return zip(self.times, self.lines, strict=True)
+
+    def index_at(self, position: float) -> int:
+        """Return the index of the line being sung at position (in seconds)."""
+        return max(bisect_right(self.times, position) - 1, 0)
+
+
+def _sidecar_path(video_id: str) -> Path:
+    return LYRICS_DIR / f"{video_id}.lrcb"
+
+
+def compile_lyrics(video_id: str, lyrics: str) -> Lyrics:
+    """Parse lrc lyrics once and store them in a binary sidecar."""
+    parsed: list[tuple[float, str]] = parse_lyrics(lyrics)
+    times = array("d", (t for t, _ in parsed))
+    lines: list[str] = [line for _, line in parsed]
+    offsets = array("I", [0])
+    for line in lines:
+        offsets.append(offsets[-1] + len(line))
+    compiled = CompiledLyrics(
+        SIDECAR_VERSION,
+        sys.byteorder,
+        times.tobytes(),
+        offsets.tobytes(),
+        "".join(lines),
+    )
+    try:
+        write_atomic(_sidecar_path(video_id), msgspec.msgpack.encode(compiled))
+    except OSError:
+        logger.exception("Failed to write the lyrics sidecar of %s", video_id)
+    return Lyrics(times, lines)
+
+
+def load_lyrics(video_id: str) -> Lyrics:
+    """Load the lyrics of a song from its sidecar, compiling it if needed."""
+    lrc_path: Path = LYRICS_DIR / f"{video_id}.lrc"
+    path: Path = _sidecar_path(video_id)
+    try:
+        if path.stat().st_mtime >= lrc_path.stat().st_mtime:
+            compiled: CompiledLyrics = msgspec.msgpack.decode(
+                path.read_bytes(),
+                type=CompiledLyrics,
+            )
+            if (
+                compiled.version == SIDECAR_VERSION
+                and compiled.byteorder == sys.byteorder
+            ):
+                times = array("d")
+                times.frombytes(compiled.times)
+                offsets = array("I")
+                offsets.frombytes(compiled.offsets)
+                text: str = compiled.text
+                metrics.incr("lyrics.sidecar_hit")
+                return Lyrics(
+                    times,
+                    [text[offsets[i] : offsets[i + 1]] for i in range(len(times))],
+                )
+    except (OSError, msgspec.DecodeError, ValueError):
+        logger.debug("Recompiling the lyrics sidecar of %s", video_id)
+    metrics.incr("lyrics.sidecar_miss")
+    return compile_lyrics(video_id, lrc_path.read_text(encoding="utf-8"))
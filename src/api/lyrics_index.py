@@ -0,0 +1,217 @@
+import logging
+import re
+import threading
+from bisect import bisect_left
+from collections.abc import Iterator
+from dataclasses import dataclass
+from pathlib import Path
+
+import msgspec
+
+from api.lyrics import Lyrics, load_lyrics
+from player.util import write_atomic
+
+logger: logging.Logger = logging.getLogger(__name__)
+
+INDEX_VERSION = 1
+TOKEN = re.compile(r"\w+")
+
+
+def _tokenize(text: str) -> list[str]:
+    return TOKEN.findall(text.lower())
+
+
+def _normalize(text: str) -> str:
+    return " ".join(_tokenize(text))
+
+
+class Document(msgspec.Struct, array_like=True):
+    mtime: float
+    times_ms: list[int]
+    lines: list[str]
+
+
+class IndexFile(msgspec.Struct, array_like=True):
+    version: int
+    documents: dict[str, Document]
+    postings: dict[str, dict[str, list[int]]]
+
+
+@dataclass
+class LyricsHit:
+    video_id: str
+    time_ms: int
+    line: str
+
+
+class LyricsIndex:
+    """Inverted index over the lyrics of every downloaded song."""
+
+    def __init__(self, lyrics_dir: str) -> None:
+        self.lyrics_dir = Path(lyrics_dir)
+        self.path: Path = self.lyrics_dir / "lyrics_index.msgpack"
+        self._documents: dict[str, Document] = {}
+        # token -> video_id -> indexes of the lines containing it
+        self._postings: dict[str, dict[str, list[int]]] = {}
+        # The tokens of _postings in order, to find a prefix with bisect.
+        # Rebuilt by the first search after a token was added or removed.
+        self._tokens: list[str] | None = None
+        self._lock = threading.Lock()
+        self._dirty = False
+
+    def load(self) -> None:
+        """Load the persisted index, if any."""
+        try:
+            index: IndexFile = msgspec.msgpack.decode(
+                self.path.read_bytes(),
+                type=IndexFile,
+            )
+        except FileNotFoundError:
+            return
+        except (OSError, msgspec.DecodeError):
+            logger.exception("Failed to load the lyrics index, rebuilding it")
+            return
+        if index.version != INDEX_VERSION:
+            return
+        with self._lock:
+            self._documents = index.documents
+            self._postings = index.postings
+            self._tokens = None
+
+    def save(self) -> None:
+        """
+        Persist the index if it changed since the last save.
+
+        Raises:
+            OSError: If the index could not be written, it stays dirty
+
+        """
+        with self._lock:
+            if not self._dirty:
+                return
+            encoded: bytes = msgspec.msgpack.encode(
+                IndexFile(INDEX_VERSION, self._documents, self._postings),
+            )
+            self._dirty = False
+        try:
+            write_atomic(self.path, encoded)
+        except OSError:
+            with self._lock:
+                self._dirty = True
+            raise
+
+    def refresh(self) -> None:
+        """Index the lyrics added or changed on disk and drop the deleted ones."""
+        on_disk: dict[str, float] = {}
+        for path in self.lyrics_dir.glob("*.lrc"):
+            stat = path.stat()
+            if stat.st_size > 0:
+                on_disk[path.stem] = stat.st_mtime
+        with self._lock:
+            removed: list[str] = [v for v in self._documents if v not in on_disk]
+        for video_id in removed:
+            self.remove(video_id)
+        for video_id, mtime in on_disk.items():
+            document: Document | None = self._documents.get(video_id)
+            if document is None or document.mtime != mtime:
+                self.add(video_id)
+        try:
+            self.save()
+        except OSError:
+            logger.exception("Failed to save the lyrics index")
+
+    def add(self, video_id: str) -> None:
+        """(Re)index the lyrics of a song."""
+        path: Path = self.lyrics_dir / f"{video_id}.lrc"
+        try:
+            mtime: float = path.stat().st_mtime
+            lyrics: Lyrics = load_lyrics(video_id)
+        except OSError:
+            logger.exception("Failed to index the lyrics of %s", video_id)
+            return
+        document = Document(
+            mtime,
+            [int(t * 1000) for t in lyrics.times],
+            lyrics.lines,
+        )
+        self.remove(video_id)
+        with self._lock:
+            for i, line in enumerate(document.lines):
+                for token in set(_tokenize(line)):
+                    if token not in self._postings:
+                        self._tokens = None
+                    self._postings.setdefault(token, {}).setdefault(
+                        video_id,
+                        [],
+                    ).append(i)
+            self._documents[video_id] = document
+            self._dirty = True
+
+    def remove(self, video_id: str) -> None:
+        with self._lock:
+            document: Document | None = self._documents.pop(video_id, None)
+            if document is None:
+                return
+            for token in {t for line in document.lines for t in _tokenize(line)}:
+                songs: dict[str, list[int]] | None = self._postings.get(token)
+                if songs is None:
+                    continue
+                songs.pop(video_id, None)
+                if not songs:
+                    del self._postings[token]
+                    self._tokens = None
+            self._dirty = True
+
+    def search(self, phrase: str, limit: int = 50) -> list[LyricsHit]:
+        """
+        Find the lines containing a phrase.
+
+        The last word is matched as a prefix so results show up while typing.
+        The search stops at the first `limit` matching lines.
+        """
+        tokens: list[str] = _tokenize(phrase)
+        if not tokens:
+            return []
+        # Spaces around the phrase so its first word isn't matched mid-word
+        needle: str = f" {_normalize(phrase)}"
+        hits: list[LyricsHit] = []
+        seen: set[tuple[str, int]] = set()
+        with self._lock:
+            for video_id, i in self._candidates(tokens):
+                if (video_id, i) in seen:
+                    continue
+                seen.add((video_id, i))
+                document: Document = self._documents[video_id]
+                if needle in f" {_normalize(document.lines[i])}":
+                    hits.append(
+                        LyricsHit(video_id, document.times_ms[i], document.lines[i]),
+                    )
+                    if len(hits) >= limit:
+                        break
+        hits.sort(key=lambda hit: (hit.video_id, hit.time_ms))
+        return hits
+
+    def _candidates(self, tokens: list[str]) -> Iterator[tuple[str, int]]:
+        """Yield the lines that may contain the tokens, lazily (lock held)."""
+        if len(tokens) > 1:
+            # Walk the rarest whole word, checking the others line by line
+            postings: list[dict[str, list[int]]] = sorted(
+                (self._postings.get(token, {}) for token in set(tokens[:-1])),
+                key=len,
+            )
+            rarest: dict[str, list[int]] = postings[0]
+            for video_id, indexes in rarest.items():
+                for i in indexes:
+                    if all(i in songs.get(video_id, ()) for songs in postings[1:]):
+                        yield video_id, i
+            return
+        if self._tokens is None:
+            self._tokens = sorted(self._postings)
+        prefix: str = tokens[0]
+        for j in range(bisect_left(self._tokens, prefix), len(self._tokens)):
+            token: str = self._tokens[j]
+            if not token.startswith(prefix):
+                return
+            for video_id, indexes in self._postings[token].items():
+                for i in indexes:
+                    yield video_id, i
@@ -1,16 +1,59 @@
 import asyncio
 import logging
+import queue
 import threading
+from collections.abc import Callable
+from concurrent.futures import Future
+from pathlib import Path
+from typing import Any
 
 from dbus_next import BusType, Variant
 from dbus_next.aio import MessageBus
-from dbus_next.service import PropertyAccess, ServiceInterface, dbus_property, method
-
-from api.protocols import PyMusicTermPlayer
+from dbus_next.service import (
+    PropertyAccess,
+    ServiceInterface,
+    dbus_property,
+    method,
+    signal,
+)
+
+from api.covers import ensure_cover
+from api.protocols import Dispatch, PyMusicTermPlayer
 from api.ytmusic import SongData
 
 logger: logging.Logger = logging.getLogger(__name__)
 
+TRACK_PATH = "/org/mpris/MediaPlayer2/Track/"
+NO_TRACK = "/org/mpris/MediaPlayer2/TrackList/NoTrack"
+# Tracks exposed in the TrackList on each side of the current one, the whole
+# library would make every TrackListReplaced as large as the library.
+TRACKLIST_WINDOW = 25
+
+
+def track_id(video_id: str) -> str:
+    """Object path of a track, hex encoded as video ids may contain '-'"""
+    return TRACK_PATH + video_id.encode().hex()
+
+
+def video_id_from_track_id(path: str) -> str | None:
+    if not path.startswith(TRACK_PATH):
+        return None
+    try:
+        return bytes.fromhex(path.removeprefix(TRACK_PATH)).decode()
+    except ValueError:
+        return None
+
+
+def duration_to_us(duration: str) -> int:
+    """Convert a "m:ss" or "h:mm:ss" duration to microseconds"""
+    seconds = 0
+    try:
+        for part in duration.split(":"):
+            seconds = seconds * 60 + int(part)
+    except (AttributeError, ValueError):
+        return 0
+    return seconds * 1000000
+
 
 class MPRISInterface(ServiceInterface):
     """MPRIS2 Root Interface"""
@@ -40,7 +83,7 @@ class MPRISInterface(ServiceInterface):
 
     @dbus_property(access=PropertyAccess.READ)
     def HasTrackList(self) -> "b":
-        return False
+        return True
 
     @dbus_property(access=PropertyAccess.READ)
     def Identity(self) -> "s":
@@ -73,77 +116,73 @@ class MPRISPlayerInterface(ServiceInterface):
     def __init__(self, adapter: "DBusAdapter") -> None:
         super().__init__("org.mpris.MediaPlayer2.Player")
         self.adapter = adapter
-        self._rate = 1.0
-        self._volume = 1.0
-        self._loop_status = "None"
-        self._shuffle = False
+
+    # The methods and setters below run on the D-Bus thread, they hand the
+    # work to the thread that drives the player, through the dispatcher of
+    # its owner, so a slow track load never stalls the bus.
 
     @method()
     def Next(self) -> None:
         """Skip to next track"""
         logger.info("MPRIS: Next called")
-        if self.adapter.player:
-            self.adapter.player.next()
-            self.adapter.schedule_update()
+        self.adapter.submit(lambda player: player.next())
 
     @method()
     def Previous(self) -> None:
         """Skip to previous track"""
         logger.info("MPRIS: Previous called")
-        if self.adapter.player:
-            self.adapter.player.previous()
-            self.adapter.schedule_update()
+        self.adapter.submit(lambda player: player.previous())
 
     @method()
     def Pause(self) -> None:
         """Pause playback"""
         logger.info("MPRIS: Pause called")
-        if self.adapter.player:
-            self.adapter.player.pause_song()
-            self.adapter.schedule_update()
+        self.adapter.submit(lambda player: player.pause_song())
 
     @method()
     def PlayPause(self) -> None:
         """Toggle play/pause"""
         logger.info("MPRIS: PlayPause called")
-        if self.adapter.player:
-            if self.adapter.player.playing:
-                self.adapter.player.pause_song()
+
+        def play_pause(player: PyMusicTermPlayer) -> None:
+            if player.playing:
+                player.pause_song()
             else:
-                self.adapter.player.resume_song()
-            self.adapter.schedule_update()
+                player.resume_song()
+
+        self.adapter.submit(play_pause)
 
     @method()
     def Stop(self) -> None:
         """Stop playback"""
         logger.info("MPRIS: Stop called")
-        if self.adapter.player:
-            self.adapter.player.stop()
-            self.adapter.schedule_update()
+        self.adapter.submit(lambda player: player.stop())
 
     @method()
     def Play(self) -> None:
         """Start or resume playback"""
         logger.info("MPRIS: Play called")
-        if self.adapter.player:
-            self.adapter.player.resume_song()
-            self.adapter.schedule_update()
+        self.adapter.submit(lambda player: player.resume_song())
 
     @method()
     def Seek(self, offset: "x") -> None:
         """Seek forward or backward (microseconds)"""
         logger.info(f"MPRIS: Seek called with offset {offset}")
-        if self.adapter.player:
-            current = self.adapter.player.position
-            new_pos = current + (offset / 1000000)
-            self.adapter.player.seek_to(max(0, new_pos))
+        self.adapter.submit(
+            lambda player: player.seek_to(max(0, player.position + offset / 1000000)),
+        )
 
     @method()
     def SetPosition(self, track_id: "o", position: "x") -> None:
         """Set absolute position (microseconds)"""
         logger.info(f"MPRIS: SetPosition called with position {position}")
-        if self.adapter.player:
-            self.adapter.player.seek_to(position / 1000000)
+        current: Variant | None = self.adapter.state.get("Metadata", {}).get(
+            "mpris:trackid",
+        )
+        # Stale requests for a previous track must be ignored
+        if current is None or current.value != track_id:
+            return
+        self.adapter.submit(lambda player: player.seek_to(position / 1000000))
 
     @method()
     def OpenUri(self, uri: "s") -> None:
@@ -152,44 +191,17 @@ class MPRISPlayerInterface(ServiceInterface):
     @dbus_property(access=PropertyAccess.READ)
     def PlaybackStatus(self) -> "s":
         """Current playback status: Playing, Paused, or Stopped"""
-        if not self.adapter.player:
-            return "Stopped"
-        return "Playing" if self.adapter.player.playing else "Paused"
+        return self.adapter.state.get("PlaybackStatus", "Stopped")
 
     @dbus_property(access=PropertyAccess.READ)
     def Metadata(self) -> "a{sv}":
         """Current track metadata"""
-        if not self.adapter.player or not self.adapter.player.list_of_downloaded_songs:
-            return {}
+        return self.adapter.state.get("Metadata", {})
 
-        try:
-            song_data: SongData = self.adapter.player.list_of_downloaded_songs[
-                self.adapter.player.current_song_index
-            ]
-
-            track_id = f"/org/mpris/MediaPlayer2/Track/{self.adapter.player.current_song_index}"
-            length = int(self.adapter.player.song_length * 1000000)
-
-            metadata = {
-                "mpris:trackid": Variant("o", track_id),
-                "mpris:length": Variant("x", length),
-                "mpris:artUrl": Variant(
-                    "s",
-                    f"https://i.ytimg.com/vi/{song_data.video_id}/maxresdefault.jpg",
-                ),
-                "xesam:title": Variant("s", song_data.title),
-                "xesam:album": Variant("s", song_data.album),
-                "xesam:artist": Variant("as", [song_data.get_formatted_artists()]),
-                "xesam:url": Variant(
-                    "s",
-                    f"https://www.youtube.com/watch?v={song_data.video_id}",
-                ),
-            }
-
-            return metadata
-        except Exception as e:
-            logger.error(f"Error getting metadata: {e}")
-            return {}
+    @signal()
+    def Seeked(self, position: int) -> "x":
+        """The position changed in a way that is not the normal playback"""
+        return position
 
     @dbus_property(access=PropertyAccess.READ)
     def Position(self) -> "x":
@@ -232,54 +244,263 @@ class MPRISPlayerInterface(ServiceInterface):
 
     @dbus_property()
     def Rate(self) -> "d":
-        return self._rate
+        return 1.0
 
     @Rate.setter
     def set_rate(self, val: "d") -> None:
-        self._rate = val
+        # Only the normal rate is supported, a rate of 0 means pause
+        if val == 0:
+            self.adapter.submit(lambda player: player.pause_song())
 
     @dbus_property()
     def Volume(self) -> "d":
-        return self._volume
+        return self.adapter.state.get("Volume", 1.0)
 
     @Volume.setter
     def set_volume(self, val: "d") -> None:
-        self._volume = val
+        self.adapter.submit(lambda player: player.set_volume(val))
 
     @dbus_property()
     def LoopStatus(self) -> "s":
-        return self._loop_status
+        return self.adapter.state.get("LoopStatus", "None")
 
     @LoopStatus.setter
     def set_loop_status(self, val: "s") -> None:
-        self._loop_status = val
+        # The player can only repeat the current track, it already moves on
+        # to the next song at the end of a track.
+        self.adapter.submit(lambda player: player.set_loop(val == "Track"))
 
     @dbus_property()
     def Shuffle(self) -> "b":
-        return self._shuffle
+        return self.adapter.state.get("Shuffle", False)
 
     @Shuffle.setter
     def set_shuffle(self, val: "b") -> None:
-        self._shuffle = val
+        self.adapter.submit(lambda player: player.set_shuffle(val))
+
+
+class MPRISTrackListInterface(ServiceInterface):
+    """MPRIS2 TrackList Interface, over a window of the play queue"""
+
+    def __init__(self, adapter: "DBusAdapter") -> None:
+        super().__init__("org.mpris.MediaPlayer2.TrackList")
+        self.adapter = adapter
+
+    @method()
+    def GetTracksMetadata(self, track_ids: "ao") -> "aa{sv}":
+        """Metadata of the requested tracks, unknown ones are left out"""
+        return self.adapter.get_tracks_metadata(track_ids)
+
+    @method()
+    def AddTrack(self, uri: "s", after_track: "o", set_as_current: "b") -> None:
+        """Not supported, CanEditTracks is False"""
+
+    @method()
+    def RemoveTrack(self, track_id: "o") -> None:
+        """Not supported, CanEditTracks is False"""
+
+    @method()
+    def GoTo(self, track_id: "o") -> None:
+        """Play a track of the list"""
+        logger.info(f"MPRIS: GoTo called with {track_id}")
+        video_id: str | None = video_id_from_track_id(track_id)
+
+        def go_to(player: PyMusicTermPlayer) -> None:
+            index: int | None = self.adapter.find(video_id)
+            if index is not None:
+                player.play_from_list(index)
+
+        self.adapter.submit(go_to)
+
+    @dbus_property(access=PropertyAccess.READ)
+    def Tracks(self) -> "ao":
+        return list(self.adapter.state.get("Tracks", ()))
+
+    @dbus_property(access=PropertyAccess.READ)
+    def CanEditTracks(self) -> "b":
+        return False
+
+    @signal()
+    def TrackListReplaced(self, tracks: list[str], current_track: str) -> "aoo":
+        return [tracks, current_track]
+
+    @signal()
+    def TrackAdded(self, metadata: dict[str, Variant], after_track: str) -> "a{sv}o":
+        return [metadata, after_track]
+
+    @signal()
+    def TrackRemoved(self, track_id: str) -> "o":
+        return track_id
+
+    @signal()
+    def TrackMetadataChanged(
+        self,
+        track_id: str,
+        metadata: dict[str, Variant],
+    ) -> "oa{sv}":
+        return [track_id, metadata]
 
 
 class DBusAdapter:
     """Adapter for dbus-next MPRIS implementation"""
 
-    def __init__(self) -> None:
+    def __init__(self, cover_dir: str | None = None) -> None:
         self.player: PyMusicTermPlayer | None = None
+        self.cover_dir: str | None = cover_dir
         self.bus: MessageBus | None = None
         self.root_interface: MPRISInterface | None = None
         self.player_interface: MPRISPlayerInterface | None = None
+        self.tracklist_interface: MPRISTrackListInterface | None = None
         self._loop: asyncio.AbstractEventLoop | None = None
         self._thread: threading.Thread | None = None
-        self._started = False
-
-    def setup(self, player: PyMusicTermPlayer) -> None:
-        """Setup the adapter with a player instance"""
+        # Resolved with True once the name is owned on the bus, or False
+        self.ready: Future[bool] = Future()
+        # Runs the commands of D-Bus clients on the thread driving the player
+        self.dispatch: Dispatch | None = None
+        # Without a dispatcher, commands run one at a time on a thread of ours
+        self._commands: queue.SimpleQueue[
+            Callable[[PyMusicTermPlayer], object] | None
+        ] = queue.SimpleQueue()
+        self._worker: threading.Thread | None = None
+        # Player state as last read from the thread driving the player, served
+        # to D-Bus clients without touching the player from the bus thread.
+        self.state: dict[str, Any] = {}
+        # Properties as last sent in PropertiesChanged
+        self._emitted: dict[str, Any] = {}
+        self._metadata_key: tuple | None = None
+        self._metadata: dict[str, Variant] = {}
+        # video_id -> index in the library, checked on use and rebuilt if stale
+        self._index: dict[str, int] = {}
+        # Songs of the Tracks window by track id, read by GetTracksMetadata
+        self._tracks: dict[str, SongData] = {}
+        # video_id -> cover file, None without a thumbnail. Covers are written
+        # by the commands, so the bus never waits on PNG encoding or the disk.
+        self._covers: dict[str, Path | None] = {}
+        self._covers_queued: set[str] = set()
+        self._covers_lock = threading.Lock()
+
+    def setup(self, player: PyMusicTermPlayer, dispatch: Dispatch | None = None) -> None:
+        """Setup the adapter with a player instance and the way to drive it"""
         self.player = player
+        self.dispatch = dispatch
+        self.state = self._snapshot()
+        self._emitted = dict(self.state)
         logger.info("DBusAdapter setup complete")
 
+    def _snapshot(self) -> dict[str, Any]:
+        """Read the properties exposed on D-Bus from the player"""
+        if not self.player:
+            return {"PlaybackStatus": "Stopped", "Metadata": {}, "Tracks": ()}
+        self._tracks = self._window()
+        return {
+            "PlaybackStatus": "Playing" if self.player.playing else "Paused",
+            "Metadata": self.get_metadata(),
+            "Tracks": tuple(self._tracks),
+            "Volume": self.player.music_player.volume,
+            "LoopStatus": "Track" if self.player.music_player.loop_at_end else "None",
+            "Shuffle": self.player.shuffled,
+        }
+
+    def get_metadata(self) -> dict[str, Variant]:
+        """Metadata of the current track, only rebuilt when the track changes"""
+        if not self.player or not self.player.list_of_downloaded_songs:
+            return {}
+
+        try:
+            index: int = self.player.current_song_index
+            song_data: SongData = self.player.list_of_downloaded_songs[index]
+            length = int(self.player.song_length * 1000000)
+            key: tuple = (song_data.video_id, length, self.cover(song_data))
+            if key == self._metadata_key:
+                return self._metadata
+
+            self._metadata = self.track_metadata(song_data, length)
+            self._metadata_key = key
+            return self._metadata
+        except Exception as e:
+            logger.error(f"Error getting metadata: {e}")
+            return {}
+
+    def track_metadata(
+        self,
+        song_data: SongData,
+        length: int | None = None,
+    ) -> dict[str, Variant]:
+        """Metadata of a track, its length in microseconds defaults to the tagged one"""
+        if length is None:
+            length = duration_to_us(song_data.duration)
+        metadata: dict[str, Variant] = {
+            "mpris:trackid": Variant("o", track_id(song_data.video_id)),
+            "mpris:length": Variant("x", length),
+            "xesam:title": Variant("s", song_data.title),
+            "xesam:album": Variant("s", song_data.album),
+            "xesam:artist": Variant("as", [song_data.get_formatted_artists()]),
+            "xesam:url": Variant(
+                "s",
+                f"https://www.youtube.com/watch?v={song_data.video_id}",
+            ),
+        }
+        # A local file, clients must not need the network to show the cover
+        cover: Path | None = self.cover(song_data)
+        if cover is not None:
+            metadata["mpris:artUrl"] = Variant("s", cover.absolute().as_uri())
+        return metadata
+
+    def cover(self, song_data: SongData) -> Path | None:
+        """Cover file of a song, None until a command has written it"""
+        video_id: str = song_data.video_id
+        with self._covers_lock:
+            if video_id in self._covers:
+                return self._covers[video_id]
+            if self.cover_dir is None or video_id in self._covers_queued:
+                return None
+            self._covers_queued.add(video_id)
+        self.submit(lambda _: self._write_cover(song_data))
+        return None
+
+    def _write_cover(self, song_data: SongData) -> None:
+        """Write a cover, then announce it for the tracks of the window"""
+        # Metadata follows with the update after each command
+        cover: Path | None = ensure_cover(song_data, self.cover_dir)
+        with self._covers_lock:
+            self._covers[song_data.video_id] = cover
+            self._covers_queued.discard(song_data.video_id)
+        path: str = track_id(song_data.video_id)
+        if cover is None or path not in self._tracks:
+            return
+        if self._loop and self.tracklist_interface:
+            self._loop.call_soon_threadsafe(
+                self.tracklist_interface.TrackMetadataChanged,
+                path,
+                self.track_metadata(song_data),
+            )
+
+    def find(self, video_id: str | None) -> int | None:
+        """Index of a song in the library"""
+        if not self.player or video_id is None:
+            return None
+        songs: list[SongData] = self.player.list_of_downloaded_songs
+        index: int | None = self._index.get(video_id)
+        if index is None or index >= len(songs) or songs[index].video_id != video_id:
+            self._index = {song.video_id: i for i, song in enumerate(songs)}
+            index = self._index.get(video_id)
+        return index
+
+    def get_tracks_metadata(self, track_ids: list[str]) -> list[dict[str, Variant]]:
+        """Metadata of the requested tracks of the window, built on demand"""
+        tracks: dict[str, SongData] = self._tracks
+        return [
+            self.track_metadata(tracks[path]) for path in track_ids if path in tracks
+        ]
+
+    def _window(self) -> dict[str, SongData]:
+        """Songs around the current one by track id, in the order of the queue"""
+        songs: list[SongData] = self.player.list_of_downloaded_songs
+        return {
+            track_id(songs[index].video_id): songs[index]
+            for index in self.player.queue.window(TRACKLIST_WINDOW, TRACKLIST_WINDOW)
+        }
+
     def _run_event_loop(self, loop: asyncio.AbstractEventLoop) -> None:
         """Run the asyncio event loop in a separate thread"""
         asyncio.set_event_loop(loop)
@@ -299,22 +520,28 @@ class DBusAdapter:
 
             self.root_interface = MPRISInterface(self)
             self.player_interface = MPRISPlayerInterface(self)
+            self.tracklist_interface = MPRISTrackListInterface(self)
 
             self.bus.export("/org/mpris/MediaPlayer2", self.root_interface)
             self.bus.export("/org/mpris/MediaPlayer2", self.player_interface)
+            self.bus.export("/org/mpris/MediaPlayer2", self.tracklist_interface)
             logger.info("Interfaces exported")
 
             await self.bus.request_name("org.mpris.MediaPlayer2.PyMusicTerm")
             logger.info("MPRIS DBus server started successfully")
 
-            self._started = True
+            self.ready.set_result(True)
 
         except Exception as e:
             logger.error(f"Failed to start DBus server: {e}")
-            self._started = False
+            self.ready.set_result(False)
 
     def start_background(self) -> None:
-        """Start the DBus server in a background thread"""
+        """
+        Start the DBus server in a background thread, without waiting for it.
+
+        Wait on or add a callback to `ready` to know when it is up.
+        """
         if self._thread is not None and self._thread.is_alive():
             logger.info("DBus server already running")
             return
@@ -329,42 +556,119 @@ class DBusAdapter:
             name="MPRIS-DBus-Thread",
         )
         self._thread.start()
+        if self.dispatch is None:
+            self._worker = threading.Thread(
+                target=self._run_commands,
+                daemon=True,
+                name="MPRIS-Commands",
+            )
+            self._worker.start()
 
         # Schedule the server start in the new loop
         asyncio.run_coroutine_threadsafe(self._start_server(), self._loop)
 
-        # Give it a moment to start
-        import time
-
-        time.sleep(0.5)
+    def stop(self) -> None:
+        """Stop the command thread and the event loop"""
+        self._commands.put(None)
+        if self._loop is not None and self._loop.is_running():
+            self._loop.call_soon_threadsafe(self._loop.stop)
 
-        if self._started:
-            logger.info("DBus server thread started successfully")
+    def submit(self, command: Callable[[PyMusicTermPlayer], object]) -> None:
+        """Queue a command to run against the player on the thread driving it"""
+        if self.player is None:
+            return
+        if self.dispatch is not None:
+            try:
+                self.dispatch(lambda: self._run(command))
+            except RuntimeError:
+                # The executor of the daemon once it is shut down
+                logger.warning("MPRIS command dropped, the player is stopping")
         else:
-            logger.warning("DBus server may not have started correctly")
+            self._commands.put(command)
+
+    def _run(self, command: Callable[[PyMusicTermPlayer], object]) -> None:
+        try:
+            command(self.player)
+        except Exception:
+            logger.exception("MPRIS command failed")
+        # Report the new state, PropertiesChanged carries what changed
+        self.schedule_update()
+
+    def _run_commands(self) -> None:
+        while (command := self._commands.get()) is not None:
+            self._run(command)
 
     def schedule_update(self) -> None:
-        """Schedule a property update in the event loop"""
+        """Snapshot the player state and schedule a property update in the event loop"""
+        self.state = self._snapshot()
         if self._loop and self.player_interface:
-            asyncio.run_coroutine_threadsafe(
-                self._emit_properties_changed(),
-                self._loop,
+            self._loop.call_soon_threadsafe(
+                self._emit_properties_changed,
+                self.state,
             )
 
-    async def _emit_properties_changed(self) -> None:
-        """Emit properties changed signal"""
+    def _emit_properties_changed(self, state: dict[str, Any]) -> None:
+        """Emit properties changed signal for the properties that changed"""
         try:
             if self.player_interface:
+                old_tracks: tuple[str, ...] = self._emitted.get("Tracks", ())
                 # Don't wrap in Variant - emit_properties_changed does that automatically
-                changed_properties = {
-                    "PlaybackStatus": self.player_interface.PlaybackStatus,
-                    "Metadata": self.player_interface.Metadata,
+                changed_properties: dict[str, Any] = {
+                    name: value
+                    for name, value in state.items()
+                    if self._emitted.get(name) != value
                 }
-                self.player_interface.emit_properties_changed(changed_properties)
+                if not changed_properties:
+                    return
+                self._emitted.update(changed_properties)
+                # Tracks is only announced through the TrackList signals
+                if "Tracks" in changed_properties:
+                    current: Variant | None = state["Metadata"].get("mpris:trackid")
+                    self._emit_tracklist_changes(
+                        old_tracks,
+                        changed_properties.pop("Tracks"),
+                        current.value if current is not None else NO_TRACK,
+                    )
+                if changed_properties:
+                    self.player_interface.emit_properties_changed(changed_properties)
                 logger.debug("Properties changed signal emitted")
         except Exception as e:
             logger.error(f"Error emitting properties changed: {e}", exc_info=True)
 
+    def _emit_tracklist_changes(
+        self,
+        old: tuple[str, ...],
+        new: tuple[str, ...],
+        current: str,
+    ) -> None:
+        """Send the tracks that left and entered the window, not the whole list"""
+        if not self.tracklist_interface:
+            return
+        old_set: set[str] = set(old)
+        new_set: set[str] = set(new)
+        kept: list[str] = [track for track in new if track in old_set]
+        if not kept or kept != [track for track in old if track in new_set]:
+            # No overlap or the order changed, e.g. after a shuffle
+            self.tracklist_interface.TrackListReplaced(list(new), current)
+            return
+        for track in old:
+            if track not in new_set:
+                self.tracklist_interface.TrackRemoved(track)
+        after: str = NO_TRACK
+        for track in new:
+            if track not in old_set:
+                metadata: list[dict[str, Variant]] = self.get_tracks_metadata([track])
+                if metadata:
+                    self.tracklist_interface.TrackAdded(metadata[0], after)
+            after = track
+
+    def on_seek(self) -> None:
+        """Called after a seek, emit Seeked so clients don't have to poll Position"""
+        if not self.player or not self._loop or not self.player_interface:
+            return
+        position = int(self.player.position * 1000000)
+        self._loop.call_soon_threadsafe(self.player_interface.Seeked, position)
+
     def on_playback(self) -> None:
         """Called when playback state changes"""
         self.schedule_update()
@@ -375,3 +679,4 @@ class DBusAdapter:
 
     def on_volume(self) -> None:
         """Called when volume changes"""
+        self.schedule_update()
@@ -1,7 +1,14 @@
+import threading
+import time
 from typing import Any, ClassVar
 
 from just_playback import Playback
 
+from log.tracing import Span, is_enabled, span, traced
+
+# Give up timing the first audio frame after this many seconds.
+FIRST_FRAME_TIMEOUT = 5
+
 
 class Singleton(type):
     _instances: ClassVar[dict[type, object]] = {}
@@ -21,11 +28,38 @@ class MusicPlayer(metaclass=Singleton):
     def unload_song(self) -> None:
         self.playback.stop()
 
+    @traced("load_song")
     def load_song(self, path: str) -> None:
         self.playback.load_file(str(path))
 
+    def cue_song(self, path: str, position: float) -> None:
+        """Load a song paused at a position, ready to be resumed."""
+        self.load_song(path)
+        # The playback must be active to seek, start it muted and pause it
+        volume: float = self.playback.volume
+        self.playback.set_volume(0)
+        self.playback.play()
+        self.playback.pause()
+        self.playback.seek(position)
+        self.playback.set_volume(volume)
+
     def play_song(self) -> None:
         self.playback.play()
+        if is_enabled():
+            threading.Thread(
+                target=self._trace_first_frame,
+                args=(span("playback.first_frame"),),
+                daemon=True,
+            ).start()
+
+    def _trace_first_frame(self, first_frame: Span) -> None:
+        """Wait until the playback position moves, the first frame was played."""
+        deadline: float = time.monotonic() + FIRST_FRAME_TIMEOUT
+        while self.playback.curr_pos <= 0:
+            if time.monotonic() > deadline:
+                return
+            time.sleep(0.002)
+        first_frame.end()
 
     def resume_song(self) -> None:
         self.playback.resume()
@@ -0,0 +1,268 @@
+import logging
+import threading
+import time
+from collections.abc import Callable, Iterable
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
+from typing import Any
+
+from player.util import FileLock
+
+from .protocols import SongData
+from .quality import TIERS
+
+logger: logging.Logger = logging.getLogger(__name__)
+
+# Resolved stream urls expire after a few hours on YouTube, keep a safe margin.
+INFO_TTL = 30 * 60
+READ_CHUNK = 1024 * 1024
+
+
+class Prefetcher:
+    """
+    Resolve, and optionally download, the tracks the user is likely to play next.
+
+    Two predictions are tracked independently: the top results of the last search
+    and the next items of the playback order. A new prediction cancels the work
+    scheduled for the previous one.
+    """
+
+    def __init__(
+        self,
+        cache_dir: str,
+        *,
+        top_n: int = 3,
+        next_k: int = 2,
+        download: bool = False,
+        disk_budget: int = 200 * 1024 * 1024,
+        rate_limit: int | None = None,
+        max_workers: int = 2,
+    ) -> None:
+        self.prefetch_dir = Path(cache_dir) / "prefetch"
+        # Downloads are written and transcoded here, then renamed into
+        # prefetch_dir so claim never hands out a half-written mp3.
+        self.partial_dir: Path = self.prefetch_dir / ".partial"
+        self.partial_dir.mkdir(parents=True, exist_ok=True)
+        self.top_n: int = top_n
+        self.next_k: int = next_k
+        self.download: bool = download
+        self.disk_budget: int = disk_budget
+        self.rate_limit: int | None = rate_limit
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers,
+            thread_name_prefix="prefetch",
+        )
+        self._lock = threading.RLock()
+        self._infos: dict[str, tuple[float, dict[str, Any]]] = {}
+        self._futures: dict[str, tuple[str, int, Future]] = {}
+        self._generations: dict[str, int] = {"search": 0, "next": 0}
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def hit_rate(self) -> float:
+        total: int = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def predict_search(self, results: list[SongData]) -> None:
+        """Prefetch the top-N results of a search."""
+        self._predict("search", results[: self.top_n], self._prefetch_remote)
+
+    def predict_next(self, songs: Iterable[SongData]) -> None:
+        """Prefetch the next K items of the playback order."""
+        songs = list(songs)[: self.next_k]
+        self._predict("next", songs, self._prefetch_local)
+
+    def _predict(
+        self,
+        slot: str,
+        songs: list[SongData],
+        task: Callable[[str, int, SongData], None],
+    ) -> None:
+        with self._lock:
+            self._generations[slot] += 1
+            generation: int = self._generations[slot]
+            wanted: set[str] = {song.video_id for song in songs}
+            for video_id, (owner, _, future) in list(self._futures.items()):
+                if owner == slot and video_id not in wanted:
+                    future.cancel()
+                    del self._futures[video_id]
+            for song in songs:
+                if song.video_id in self._futures:
+                    continue
+                future: Future = self._executor.submit(task, slot, generation, song)
+                self._futures[song.video_id] = (slot, generation, future)
+                future.add_done_callback(
+                    lambda f, video_id=song.video_id: self._forget(video_id, f),
+                )
+
+    def _forget(self, video_id: str, future: Future) -> None:
+        with self._lock:
+            entry: tuple[str, int, Future] | None = self._futures.get(video_id)
+            if entry is not None and entry[2] is future:
+                del self._futures[video_id]
+
+    def _cancelled(self, slot: str, generation: int) -> bool:
+        return self._generations[slot] != generation
+
+    def _prefetch_local(self, slot: str, generation: int, song: SongData) -> None:
+        """Warm the page cache for a track that is already on disk."""
+        if song.path is None or not Path(song.path).exists():
+            return
+        with Path(song.path).open("rb") as f:
+            while f.read(READ_CHUNK):
+                if self._cancelled(slot, generation):
+                    return
+
+    def _prefetch_remote(self, slot: str, generation: int, song: SongData) -> None:
+        """Resolve the stream info of a track, then download it if enabled."""
+        if self._cancelled(slot, generation):
+            return
+        info: dict[str, Any] | None = self._resolve(song)
+        if info is None or not self.download or self._cancelled(slot, generation):
+            return
+        if (self.prefetch_dir / f"{song.video_id}.mp3").exists():
+            return
+        if not self._make_room():
+            logger.info("Prefetch disk budget exhausted, skipping %s", song.video_id)
+            return
+        # The browser sessions share the prefetch folder
+        lock = FileLock(self.partial_dir / f"{song.video_id}.lock")
+        if not lock.acquire(blocking=False):
+            logger.info("%s is prefetched by another process", song.video_id)
+            return
+        try:
+            if not (self.prefetch_dir / f"{song.video_id}.mp3").exists():
+                self._download(slot, generation, song, info)
+        finally:
+            lock.release()
+
+    def _download(
+        self,
+        slot: str,
+        generation: int,
+        song: SongData,
+        info: dict[str, Any],
+    ) -> None:
+        import yt_dlp  # noqa: PLC0415
+        from yt_dlp.utils import DownloadCancelled  # noqa: PLC0415
+
+        def hook(_: dict) -> None:
+            if self._cancelled(slot, generation):
+                raise DownloadCancelled
+
+        ydl_opts: dict[str, Any] = {
+            "format": TIERS["high"].format,
+            "postprocessors": [
+                {
+                    "key": "FFmpegExtractAudio",
+                    "preferredcodec": "mp3",
+                    "preferredquality": TIERS["high"].bitrate,
+                },
+            ],
+            "outtmpl": str(self.partial_dir / f"{song.video_id}.%(ext)s"),
+            "progress_hooks": [hook],
+            "ratelimit": self.rate_limit,
+            "quiet": True,
+            "no_warnings": True,
+        }
+        try:
+            with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+                ydl.process_ie_result(info, download=True)
+            # The progress hook doesn't run during the transcode
+            if self._cancelled(slot, generation):
+                raise DownloadCancelled  # noqa: TRY301
+            (self.partial_dir / f"{song.video_id}.mp3").replace(
+                self.prefetch_dir / f"{song.video_id}.mp3",
+            )
+            logger.info("Prefetched %s", song.video_id)
+        except DownloadCancelled:
+            logger.info("Prefetch of %s cancelled", song.video_id)
+            self._cleanup(song.video_id)
+        except Exception:
+            logger.exception("Prefetch of %s failed", song.video_id)
+            self._cleanup(song.video_id)
+
+    def _resolve(self, song: SongData) -> dict[str, Any] | None:
+        with self._lock:
+            cached: tuple[float, dict[str, Any]] | None = self._infos.get(song.video_id)
+        if cached is not None and time.monotonic() - cached[0] < INFO_TTL:
+            return cached[1]
+        import yt_dlp  # noqa: PLC0415
+
+        try:
+            with yt_dlp.YoutubeDL({"quiet": True, "no_warnings": True}) as ydl:
+                info: dict[str, Any] = ydl.sanitize_info(
+                    ydl.extract_info(
+                        f"https://www.youtube.com/watch?v={song.video_id}",
+                        download=False,
+                    ),
+                )
+        except Exception:
+            logger.exception("Failed to resolve stream info for %s", song.video_id)
+            return None
+        with self._lock:
+            self._infos[song.video_id] = (time.monotonic(), info)
+        return info
+
+    def _make_room(self) -> bool:
+        """Evict the oldest prefetched files until the budget has some room left."""
+        files: list[Path] = sorted(
+            self.prefetch_dir.glob("*.mp3"),
+            key=lambda p: p.stat().st_mtime,
+        )
+        used: int = sum(f.stat().st_size for f in files)
+        # Assume a typical track (~5 MB) is about to be written.
+        while files and used + 5 * 1024 * 1024 > self.disk_budget:
+            oldest: Path = files.pop(0)
+            used -= oldest.stat().st_size
+            oldest.unlink(missing_ok=True)
+        return used + 5 * 1024 * 1024 <= self.disk_budget
+
+    def _cleanup(self, video_id: str) -> None:
+        for leftover in self.partial_dir.glob(f"{video_id}.*"):
+            # Removing the lock file would let another process lock a new one
+            if leftover.suffix != ".lock":
+                leftover.unlink(missing_ok=True)
+
+    def claim(self, video_id: str) -> tuple[Path | None, dict[str, Any] | None]:
+        """
+        Take what was prefetched for a track that is about to be played.
+
+        Returns:
+            tuple: The prefetched mp3 path (or None) and the resolved stream info
+            (or None).
+
+        """
+        with self._lock:
+            pending: tuple[str, int, Future] | None = self._futures.pop(video_id, None)
+            cached: tuple[float, dict[str, Any]] | None = self._infos.pop(
+                video_id,
+                None,
+            )
+            if pending is not None and not pending[2].done():
+                # The prediction is resolved: stop the rest of it and don't wait
+                # on a rate limited download, the player downloads at full speed.
+                self._generations[pending[0]] += 1
+                pending[2].cancel()
+        path: Path = self.prefetch_dir / f"{video_id}.mp3"
+        info: dict[str, Any] | None = None
+        if cached is not None and time.monotonic() - cached[0] < INFO_TTL:
+            info = cached[1]
+        if path.exists() or info is not None:
+            self.hits += 1
+        else:
+            self.misses += 1
+        logger.info(
+            "Prefetch %s for %s (hit rate: %.0f%%)",
+            "hit" if path.exists() or info is not None else "miss",
+            video_id,
+            self.hit_rate * 100,
+        )
+        return (path if path.exists() else None), info
+
+    def shutdown(self) -> None:
+        with self._lock:
+            for slot in self._generations:
+                self._generations[slot] += 1
+        self._executor.shutdown(wait=False, cancel_futures=True)
@@ -1,10 +1,17 @@
+from collections.abc import Callable
 from dataclasses import dataclass
-from typing import Protocol
+from typing import TYPE_CHECKING, Protocol
 
 from PIL import ImageFile
 
 from api.music_player import MusicPlayer
 
+if TYPE_CHECKING:
+    from player.queue import PlayQueue
+
+# Runs a callable on the thread that drives the player, without waiting for it
+Dispatch = Callable[[Callable[[], object]], object]
+
 
 @dataclass
 class SongData:
@@ -28,6 +35,8 @@ class PyMusicTermPlayer(Protocol):
     song_length: float
     playing: bool
     list_of_downloaded_songs: list[SongData]
+    queue: "PlayQueue"
+    shuffled: bool
     dict_of_lyrics: dict[str, str]
     music_player = MusicPlayer(1)
 
@@ -39,8 +48,12 @@ class PyMusicTermPlayer(Protocol):
     def seek_to(self, time: float) -> None: ...
     def seek(self, time: float = 10) -> None: ...
     def suffle(self) -> None: ...
+    def set_shuffle(self, value: bool) -> None: ...  # noqa: FBT001
     def loop_at_end(self) -> bool: ...
+    def set_loop(self, value: bool) -> None: ...  # noqa: FBT001
+    def set_volume(self, value: float) -> None: ...
     def update(self) -> None: ...
     def stop(self) -> None: ...
     def pause_song(self) -> None: ...
     def resume_song(self) -> None: ...
+    def add_listener(self, listener: Callable[[str], None]) -> None: ...
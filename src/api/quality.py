@@ -0,0 +1,83 @@
+import logging
+import threading
+from dataclasses import dataclass
+
+logger: logging.Logger = logging.getLogger(__name__)
+
+# Time we are willing to wait before a freshly picked song starts playing.
+TARGET_TIME_TO_PLAY = 8.0
+DEFAULT_DURATION = 240
+
+
+@dataclass(frozen=True)
+class QualityTier:
+    """A yt-dlp format selector and the mp3 bitrate it is transcoded to."""
+
+    name: str
+    format: str
+    bitrate: str
+    source_kbps: int
+
+
+TIERS: dict[str, QualityTier] = {
+    "low": QualityTier("low", "bestaudio[abr<=64]/worstaudio/worst", "96", 64),
+    "medium": QualityTier("medium", "bestaudio[abr<=128]/bestaudio/best", "128", 128),
+    "high": QualityTier("high", "bestaudio/best", "192", 160),
+}
+
+
+class BandwidthEstimator:
+    """Exponentially weighted moving average of the download throughput."""
+
+    def __init__(self, alpha: float = 0.3) -> None:
+        self.alpha: float = alpha
+        self._estimate: float | None = None
+        self._lock = threading.Lock()
+
+    @property
+    def estimate(self) -> float | None:
+        """The estimated bandwidth in bytes per second, None without samples."""
+        return self._estimate
+
+    def add_sample(self, size: int, seconds: float) -> None:
+        if size <= 0 or seconds <= 0:
+            return
+        throughput: float = size / seconds
+        with self._lock:
+            if self._estimate is None:
+                self._estimate = throughput
+            else:
+                self._estimate += self.alpha * (throughput - self._estimate)
+
+
+class QualityPolicy:
+    """Choose the best tier that can be downloaded within the time-to-play target."""
+
+    def __init__(self, estimator: BandwidthEstimator, pinned: str = "auto") -> None:
+        if pinned != "auto" and pinned not in TIERS:
+            logger.warning(
+                "download_quality must be 'auto' or one of %s, not %r, using auto",
+                list(TIERS),
+                pinned,
+            )
+            pinned = "auto"
+        self.estimator: BandwidthEstimator = estimator
+        self.pinned: str = pinned
+
+    def choose(self, duration: int | None) -> QualityTier:
+        if self.pinned != "auto":
+            return TIERS[self.pinned]
+        bandwidth: float | None = self.estimator.estimate
+        if bandwidth is None:
+            return TIERS["high"]
+        duration = duration or DEFAULT_DURATION
+        for name in ("high", "medium"):
+            tier: QualityTier = TIERS[name]
+            size: float = duration * tier.source_kbps * 1000 / 8
+            if size / bandwidth <= TARGET_TIME_TO_PLAY:
+                return tier
+        logger.info(
+            "Slow link (%.0f kB/s), downloading in low quality",
+            bandwidth / 1000,
+        )
+        return TIERS["low"]
@@ -1,7 +1,6 @@
 import logging
 from pathlib import Path
 
-from PIL import Image
 from winrt.windows.foundation import Uri
 from winrt.windows.media import (
     MediaPlaybackStatus,
@@ -20,23 +19,22 @@ from winrt.windows.media.playback import (
 from winrt.windows.storage import StorageFile
 from winrt.windows.storage.streams import RandomAccessStreamReference
 
-from api.protocols import PyMusicTermPlayer
-from setting import Setting
-
-setting = Setting()
+from api.covers import ensure_cover
+from api.protocols import Dispatch, PyMusicTermPlayer, SongData
 
 logger: logging.Logger = logging.getLogger(__name__)
 
 
 class MediaControlWin32:
-    def __init__(self) -> None:
+    def __init__(self, cover_dir: str) -> None:
+        self.cover_dir: str = cover_dir
         self.player: PyMusicTermPlayer | None = None
         self.media_player: MediaPlayer | None = None
         self.smtc: SystemMediaTransportControls | None = None
         self.playlist: MediaPlaybackList | None = None
 
-    def init(self, player: PyMusicTermPlayer) -> None:
-        """Attach SMTC to the PyMusicTermPlayer"""
+    def init(self, player: PyMusicTermPlayer, dispatch: Dispatch | None = None) -> None:
+        """Attach SMTC to the PyMusicTermPlayer, driven through dispatch if given"""
         self.player = player
         self.media_player = MediaPlayer()
         self.media_player.auto_play = True
@@ -56,19 +54,26 @@ class MediaControlWin32:
             args: SystemMediaTransportControlsButtonPressedEventArgs,
         ) -> None:
             logger.info("SMTC button pressed: %s", args.button)
-            if args.button == SystemMediaTransportControlsButton.PLAY:
-                self.play()
-            elif args.button == SystemMediaTransportControlsButton.PAUSE:
-                self.pause()
-            elif args.button == SystemMediaTransportControlsButton.NEXT:
-                self.player.next()
-                self.play()
-            elif args.button == SystemMediaTransportControlsButton.PREVIOUS:
-                self.player.previous()
-                self.play()
+            # Called on a WinRT thread, the player is driven from another one
+            if dispatch is not None:
+                dispatch(lambda button=args.button: self.on_button(button))
+            else:
+                self.on_button(args.button)
 
         self.smtc.add_button_pressed(button_pressed)
 
+    def on_button(self, button: SystemMediaTransportControlsButton) -> None:
+        if button == SystemMediaTransportControlsButton.PLAY:
+            self.play()
+        elif button == SystemMediaTransportControlsButton.PAUSE:
+            self.pause()
+        elif button == SystemMediaTransportControlsButton.NEXT:
+            self.player.next()
+            self.play()
+        elif button == SystemMediaTransportControlsButton.PREVIOUS:
+            self.player.previous()
+            self.play()
+
     def populate_playlist(self) -> MediaPlaybackList:
         self.playlist = MediaPlaybackList()
         for song in self.player.list_of_downloaded_songs:
@@ -85,10 +90,7 @@ class MediaControlWin32:
             )
             display_props.music_properties.album_title = ""
 
-            display_props.thumbnail = self.get_ras_from_pil(
-                song.thumbnail,
-                song.video_id,
-            )
+            display_props.thumbnail = self.get_ras_from_song(song)
 
             item.apply_display_properties(display_props)
 
@@ -96,16 +98,14 @@ class MediaControlWin32:
         self.media_player.source = self.playlist
         return self.playlist
 
-    def get_ras_from_pil(
+    def get_ras_from_song(
         self,
-        img: Image.Image,
-        video_id: str,
-    ) -> RandomAccessStreamReference:
-        """Convert PIL image to RandomAccessStreamReference for thumbnails"""
-        covers_dir = Path(setting.cover_dir)
-
-        tmp_file: Path = covers_dir / f"{video_id}_cover.png"
-        img.save(tmp_file, format="PNG")
+        song: SongData,
+    ) -> RandomAccessStreamReference | None:
+        """Get the cover of a song as a RandomAccessStreamReference for thumbnails"""
+        tmp_file: Path | None = ensure_cover(song, self.cover_dir)
+        if tmp_file is None:
+            return None
 
         storage_file: StorageFile = StorageFile.get_file_from_path_async(
             str(tmp_file.absolute()),
@@ -126,6 +126,9 @@ class MediaControlWin32:
     def on_volume(self) -> None:
         pass
 
+    def on_seek(self) -> None:
+        pass
+
     def play(self) -> None:
         if self.player:
             self.player.resume_song()
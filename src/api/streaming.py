@@ -0,0 +1,323 @@
+"""
+Local HTTP server streaming the library, as is, to browsers and the devices of
+the LAN.
+
+    GET /tracks                 the library, as JSON
+    GET /tracks/<video_id>      the mp3 of a song
+    GET /covers/<video_id>      the cover of a song, as PNG
+
+Files are sent with sendfile, honouring single Range requests, and carry an
+ETag and a Last-Modified read from the library index.
+"""
+
+import email.utils
+import logging
+import re
+import threading
+from dataclasses import dataclass
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import BinaryIO
+
+import msgspec
+
+from api.covers import cover_path
+from api.protocols import PyMusicTermPlayer, SongData
+
+logger: logging.Logger = logging.getLogger(__name__)
+
+RANGE_PATTERN: re.Pattern[str] = re.compile(r"bytes=(\d*)-(\d*)")
+CACHE_CONTROL = "no-cache"
+
+
+class TrackInfo(msgspec.Struct):
+    video_id: str
+    title: str
+    artist: list[str]
+    album: str
+    duration: str
+
+
+@dataclass(frozen=True)
+class IndexedFile:
+    path: Path
+    size: int
+    etag: str
+    last_modified: str
+    mtime: int
+
+
+def index_file(path: Path, video_id: str) -> IndexedFile | None:
+    try:
+        stat = path.stat()
+    except OSError:
+        return None
+    return IndexedFile(
+        path=path,
+        size=stat.st_size,
+        etag=f'"{video_id}-{stat.st_size:x}-{stat.st_mtime_ns:x}"',
+        last_modified=email.utils.formatdate(stat.st_mtime, usegmt=True),
+        mtime=int(stat.st_mtime),
+    )
+
+
+class LibraryIndex:
+    """
+    The songs of the library by video_id, rebuilt after each change of it.
+
+    Files are stat'ed on each request, the quality upgrades rewrite them in
+    place.
+    """
+
+    def __init__(self, player: PyMusicTermPlayer, cover_dir: str) -> None:
+        self.player: PyMusicTermPlayer = player
+        self.cover_dir: str = cover_dir
+        self._lock = threading.Lock()
+        self._songs: dict[str, SongData] | None = None
+        self._listing: bytes | None = None
+        player.add_listener(self.on_player_event)
+
+    def on_player_event(self, event: str) -> None:
+        if event == "library":
+            with self._lock:
+                self._songs = None
+
+    def _index(self) -> dict[str, SongData]:
+        with self._lock:
+            if self._songs is None:
+                self._songs = {
+                    song.video_id: song
+                    for song in list(self.player.list_of_downloaded_songs)
+                    if song.path is not None
+                }
+                self._listing = None
+            return self._songs
+
+    def listing(self) -> bytes:
+        songs: dict[str, SongData] = self._index()
+        with self._lock:
+            if self._listing is None:
+                self._listing = msgspec.json.encode(
+                    [
+                        TrackInfo(
+                            video_id=song.video_id,
+                            title=song.title,
+                            artist=list(song.artist),
+                            album=song.album,
+                            duration=song.duration,
+                        )
+                        for song in songs.values()
+                    ],
+                )
+            return self._listing
+
+    def track(self, video_id: str) -> IndexedFile | None:
+        song: SongData | None = self._index().get(video_id)
+        if song is None:
+            return None
+        return index_file(Path(song.path), video_id)
+
+    def cover(self, video_id: str) -> IndexedFile | None:
+        if video_id not in self._index():
+            return None
+        return index_file(cover_path(self.cover_dir, video_id), video_id)
+
+
+class StreamRequestHandler(BaseHTTPRequestHandler):
+    server: "StreamServer"
+    protocol_version = "HTTP/1.1"
+
+    def do_HEAD(self) -> None:  # noqa: N802
+        self.handle_request(send_body=False)
+
+    def do_GET(self) -> None:  # noqa: N802
+        self.handle_request(send_body=True)
+
+    def handle_request(self, *, send_body: bool) -> None:
+        index: LibraryIndex = self.server.index
+        kind, _, video_id = self.path.split("?", 1)[0].strip("/").partition("/")
+        if kind == "tracks" and not video_id:
+            self.send_bytes(index.listing(), "application/json", send_body=send_body)
+            return
+        if kind == "tracks":
+            self.send_indexed(index.track(video_id), "audio/mpeg", send_body=send_body)
+        elif kind == "covers":
+            self.send_indexed(index.cover(video_id), "image/png", send_body=send_body)
+        else:
+            self.send_error(HTTPStatus.NOT_FOUND)
+
+    def send_bytes(self, body: bytes, content_type: str, *, send_body: bool) -> None:
+        self.send_response(HTTPStatus.OK)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if send_body:
+            self.wfile.write(body)
+
+    def not_modified(self, indexed: IndexedFile) -> bool:
+        if_none_match: str | None = self.headers.get("If-None-Match")
+        if if_none_match is not None:
+            return indexed.etag in (tag.strip() for tag in if_none_match.split(","))
+        if_modified_since: str | None = self.headers.get("If-Modified-Since")
+        if if_modified_since is not None:
+            try:
+                since = email.utils.parsedate_to_datetime(if_modified_since)
+            except (TypeError, ValueError):
+                return False
+            return indexed.mtime <= since.timestamp()
+        return False
+
+    def requested_range(self, indexed: IndexedFile) -> tuple[int, int] | None:
+        """
+        Return the first and last byte asked by the Range header.
+
+        Returns:
+            tuple[int, int] | None: None to send the whole file
+
+        Raises:
+            ValueError: If the range can't be satisfied
+
+        """
+        header: str | None = self.headers.get("Range")
+        if header is None:
+            return None
+        if_range: str | None = self.headers.get("If-Range")
+        if if_range is not None and if_range not in (indexed.etag, indexed.last_modified):
+            return None
+        match: re.Match[str] | None = RANGE_PATTERN.fullmatch(header.strip())
+        # Several ranges are allowed to get the whole file instead
+        if match is None:
+            return None
+        first, last = match.groups()
+        if not first and not last:
+            return None
+        if not first:
+            # The last bytes of the file
+            start: int = max(indexed.size - int(last), 0)
+            end: int = indexed.size - 1
+        else:
+            start = int(first)
+            end = min(int(last), indexed.size - 1) if last else indexed.size - 1
+        if start > end or start >= indexed.size:
+            msg: str = f"Range {header} out of {indexed.size} bytes"
+            raise ValueError(msg)
+        return start, end
+
+    def send_indexed(
+        self,
+        indexed: IndexedFile | None,
+        content_type: str,
+        *,
+        send_body: bool,
+    ) -> None:
+        if indexed is None:
+            self.send_error(HTTPStatus.NOT_FOUND)
+            return
+        if self.not_modified(indexed):
+            self.send_response(HTTPStatus.NOT_MODIFIED)
+            self.send_header("ETag", indexed.etag)
+            self.end_headers()
+            return
+        try:
+            byte_range: tuple[int, int] | None = self.requested_range(indexed)
+        except ValueError:
+            self.send_response(HTTPStatus.REQUESTED_RANGE_NOT_SATISFIABLE)
+            self.send_header("Content-Range", f"bytes */{indexed.size}")
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        start, end = byte_range or (0, indexed.size - 1)
+        try:
+            file = indexed.path.open("rb")
+        except OSError:
+            self.send_error(HTTPStatus.NOT_FOUND)
+            return
+        with file:
+            if byte_range is None:
+                self.send_response(HTTPStatus.OK)
+            else:
+                self.send_response(HTTPStatus.PARTIAL_CONTENT)
+                self.send_header("Content-Range", f"bytes {start}-{end}/{indexed.size}")
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(end - start + 1))
+            self.send_header("Accept-Ranges", "bytes")
+            self.send_header("ETag", indexed.etag)
+            self.send_header("Last-Modified", indexed.last_modified)
+            self.send_header("Cache-Control", CACHE_CONTROL)
+            self.end_headers()
+            if send_body and indexed.size:
+                self.send_file(file, start, end - start + 1)
+
+    def send_file(self, file: BinaryIO, offset: int, count: int) -> None:
+        self.wfile.flush()
+        try:
+            if self.server.use_sendfile:
+                # os.sendfile where the platform has it, straight from the
+                # page cache to the socket
+                self.connection.sendfile(file, offset, count)
+            else:
+                file.seek(offset)
+                while count > 0 and (chunk := file.read(min(count, 64 * 1024))):
+                    self.wfile.write(chunk)
+                    count -= len(chunk)
+        except (BrokenPipeError, ConnectionResetError):
+            # The player went on to another part of the file
+            self.close_connection = True
+
+    def log_message(self, format: str, *args: object) -> None:  # noqa: A002
+        logger.debug("%s " + format, self.address_string(), *args)
+
+
+class StreamServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(
+        self,
+        player: PyMusicTermPlayer,
+        cover_dir: str,
+        host: str,
+        port: int,
+        use_sendfile: bool = True,  # noqa: FBT001, FBT002
+    ) -> None:
+        super().__init__((host, port), StreamRequestHandler)
+        self.index = LibraryIndex(player, cover_dir)
+        self.use_sendfile: bool = use_sendfile
+        self._thread: threading.Thread | None = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> None:
+        """Serve in the background until stop is called."""
+        self._thread = threading.Thread(
+            target=self.serve_forever,
+            daemon=True,
+            name="StreamServer",
+        )
+        self._thread.start()
+        logger.info("Streaming the library on %s", self.url)
+
+    def stop(self) -> None:
+        if self._thread is not None:
+            self.shutdown()
+            self._thread.join()
+        self.server_close()
+
+
+def start_stream_server(
+    player: PyMusicTermPlayer,
+    cover_dir: str,
+    host: str,
+    port: int,
+) -> StreamServer | None:
+    """Start streaming the library, None if the port can't be bound."""
+    try:
+        server = StreamServer(player, cover_dir, host, port)
+    except OSError as e:
+        logger.warning("Could not stream the library on %s:%s: %s", host, port, e)
+        return None
+    server.start()
+    return server
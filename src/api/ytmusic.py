@@ -1,17 +1,34 @@
 import logging
+import socket
 import ssl
 from dataclasses import dataclass
 
-import certifi
-import requests
-import ytmusicapi
 from PIL import Image
 from PIL.ImageFile import ImageFile
 
 from api.protocols import SongData
+from log.metrics import metrics
+from log.tracing import span
+from player.util import format_time
 
 logger: logging.Logger = logging.getLogger(__name__)
 
+CONNECTIVITY_CHECK = ("music.youtube.com", 443)
+CONNECTIVITY_TIMEOUT = 3
+
+
+class OfflineError(Exception):
+    """YouTube Music can't be reached, the app runs on the local library only."""
+
+
+def is_online(timeout: float = CONNECTIVITY_TIMEOUT) -> bool:
+    """Return True if YouTube Music can be reached."""
+    try:
+        socket.create_connection(CONNECTIVITY_CHECK, timeout=timeout).close()
+    except OSError:
+        return False
+    return True
+
 
 @dataclass
 class LyricsResult:
@@ -21,6 +38,10 @@ class LyricsResult:
 
 class YTMusic:
     def __init__(self) -> None:
+        import certifi  # noqa: PLC0415
+        import requests  # noqa: PLC0415
+        import ytmusicapi  # noqa: PLC0415
+
         # Create a custom session with proper SSL configuration
         try:
             session = requests.Session()
@@ -42,13 +63,20 @@ class YTMusic:
             logger.warning(f"Failed to create custom SSL session: {e}, falling back to default")
             self.client = ytmusicapi.YTMusic()
 
-    def search(self, query: str, filter: str = "songs") -> list[SongData]:  # noqa: A002
+    def search(
+        self,
+        query: str,
+        filter: str = "songs",  # noqa: A002
+        limit: int | None = None,
+    ) -> list[SongData]:
         """
         Search for a song on YTMusic.
 
         Args:
             query (str): The query to search for
             filter (str, optional): The filter to use. Defaults to "songs".
+            limit (int | None, optional): Keep only the first results, whose
+                thumbnails are the only ones downloaded. Defaults to None.
 
         Raises:
             TypeError: If query or filter is not a string
@@ -63,11 +91,11 @@ class YTMusic:
         if not isinstance(filter, str):
             msg = f"filter must be a string, not {type(filter)}"
             raise TypeError(msg)
-
-        results: list[dict] = self.client.search(query, filter)
+        with span("search", filter=filter):
+            results: list[dict] = self.client.search(query, filter)
 
         r: list[SongData] = []
-        for result in results:
+        for result in results[:limit]:
             title: str = result.get("title", "Unknown Title")
             artist: list[str] = [artist["name"] for artist in result.get("artists", [])]
             if not artist:
@@ -77,9 +105,7 @@ class YTMusic:
                 "videoId",
                 "dQw4w9WgXcQ",
             )  # Default to a dummy video id
-            thumbnail: ImageFile = Image.open(
-                requests.get(result["thumbnails"][0]["url"], stream=True).raw,  # noqa: S113
-            )
+            thumbnail: ImageFile = self._thumbnail(result["thumbnails"][0]["url"])
             x = result.get("album", None)
             album = x.get("name") if x else "Unknown Album"
             r.append(
@@ -93,3 +119,39 @@ class YTMusic:
                 ),
             )
         return r
+
+    def get_song(self, video_id: str) -> SongData | None:
+        """
+        Look a song up by its video_id.
+
+        Returns:
+            SongData | None: The song, None if YouTube Music doesn't know it
+
+        """
+        with span("get_song", video_id=video_id):
+            details: dict | None = self.client.get_song(video_id).get("videoDetails")
+        if not details or details.get("videoId") != video_id:
+            return None
+        thumbnails: list[dict] = details.get("thumbnail", {}).get("thumbnails", [])
+        return SongData(
+            title=details.get("title", "Unknown Title"),
+            artist=[details.get("author") or "Unknown Artist"],
+            duration=format_time(float(details.get("lengthSeconds", 0))),
+            video_id=video_id,
+            thumbnail=self._thumbnail(thumbnails[0]["url"]) if thumbnails else None,
+            # Only the search results tell the album
+            album="Unknown Album",
+        )
+
+    def _thumbnail(self, url: str) -> ImageFile:
+        import requests  # noqa: PLC0415
+
+        with span("search.thumbnail"):
+            response: requests.Response = requests.get(url, stream=True)  # noqa: S113
+            thumbnail: ImageFile = Image.open(response.raw)
+        # requests_cache marks the responses it served
+        if getattr(response, "from_cache", False):
+            metrics.incr("http_cache.hit")
+        else:
+            metrics.incr("http_cache.miss")
+        return thumbnail
@@ -0,0 +1,141 @@
+"""
+Command line client of the player daemon, started with `main.py --daemon`.
+
+    python src/ctl.py next
+    python src/ctl.py search "daft punk"
+    python src/ctl.py watch
+"""
+
+import argparse
+import sys
+from pathlib import Path
+
+from daemon.client import DaemonRequestError, PlayerClient
+from daemon.protocol import Event, PlayerState, socket_path
+from player.util import format_time
+from setting import SettingManager
+
+
+def print_state(state: PlayerState) -> None:
+    status: str = "playing" if state.playing else "paused"
+    print(
+        f"{status} #{state.current_index} {state.video_id or '-'} "
+        f"{format_time(state.position)}/{format_time(state.length)} "
+        f"volume {state.volume:.2f} loop {'on' if state.loop else 'off'} "
+        f"shuffle {'on' if state.shuffle else 'off'}",
+    )
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(prog="pymusicterm-ctl")
+    commands = parser.add_subparsers(dest="command", required=True)
+    for name in ("status", "library", "pause", "resume", "toggle", "next",
+                 "previous", "shuffle", "watch", "shutdown"):  # fmt: skip
+        commands.add_parser(name)
+    commands.add_parser("play").add_argument("index", type=int)
+    commands.add_parser("play-video").add_argument("video_id")
+    commands.add_parser("seek").add_argument("seconds", type=float)
+    commands.add_parser("seek-to").add_argument("seconds", type=float)
+    commands.add_parser("volume").add_argument("value", type=float)
+    commands.add_parser("loop").add_argument("value", choices=["on", "off"])
+    commands.add_parser("playlists")
+    commands.add_parser("playlist").add_argument("name")
+    commands.add_parser("playlist-delete").add_argument("name")
+    playlist_add = commands.add_parser("playlist-add")
+    playlist_add.add_argument("name")
+    playlist_add.add_argument("video_id", nargs="?", help="the current song by default")
+    playlist_import = commands.add_parser("playlist-import")
+    playlist_import.add_argument("file", type=Path)
+    playlist_import.add_argument("--name")
+    playlist_export = commands.add_parser("playlist-export")
+    playlist_export.add_argument("name")
+    playlist_export.add_argument("file", type=Path)
+    search = commands.add_parser("search")
+    search.add_argument("query")
+    search.add_argument("--filter", default="songs", choices=["songs", "videos"])
+    return parser.parse_args()
+
+
+def run(client: PlayerClient, args: argparse.Namespace) -> None:
+    match args.command:
+        case "status":
+            print_state(client.get_state())
+        case "library":
+            for index, song in enumerate(client.library().songs):
+                print(f"{index:>4} {song.title} - {', '.join(song.artist)}")
+        case "search":
+            for song in client.search(args.query, args.filter):
+                print(f"{song.video_id} {song.title} - {', '.join(song.artist)}")
+        case "play":
+            client.call("play", args.index)
+        case "play-video":
+            client.call("play_video", args.video_id)
+        case "seek" | "seek-to":
+            client.call(args.command.replace("-", "_"), args.seconds)
+        case "volume":
+            client.call("set_volume", args.value)
+        case "loop":
+            client.call("set_loop", args.value == "on")
+        case "playlists":
+            print("\n".join(client.call("playlists")))
+        case "playlist":
+            for video_id in client.call("playlist", args.name):
+                # The imported entries still searched for
+                print(video_id or "(searching)")
+        case "playlist-delete":
+            client.call("playlist_delete", args.name)
+        case "playlist-add":
+            video_id: str | None = args.video_id or client.get_state().video_id
+            if video_id is None:
+                sys.exit("No song is playing")
+            client.call("playlist_add", args.name, video_id)
+        case "playlist-import":
+            # The daemon doesn't run in the current folder
+            counts: dict[str, int] = client.call(
+                "playlist_import",
+                str(args.file.resolve()),
+                args.name,
+            )
+            print(
+                f"{counts['added']} songs added, {counts['missing']} to download "
+                f"and {counts['unresolved']} to search in the background",
+            )
+        case "playlist-export":
+            count: int = client.call(
+                "playlist_export",
+                args.name,
+                str(args.file.resolve()),
+            )
+            print(f"{count} songs written to {args.file}")
+        case "watch":
+            client.subscribe(lambda event: print_event(event))
+            # Until the daemon stops or ctrl+c
+            client.wait_closed()
+        case command:
+            client.call(command)
+
+
+def print_event(event: Event) -> None:
+    print(event.event, end=" ")
+    print_state(event.state)
+
+
+def main() -> None:
+    args: argparse.Namespace = parse_args()
+    setting = SettingManager()
+    try:
+        client = PlayerClient(socket_path(setting.app_dir))
+    except OSError:
+        sys.exit("The daemon is not running, start it with `main.py --daemon`")
+    try:
+        run(client, args)
+    except DaemonRequestError as e:
+        sys.exit(str(e))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        client.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,207 @@
+"""Thin client of the player daemon."""
+
+import contextlib
+import itertools
+import logging
+import socket
+import subprocess
+import sys
+import threading
+import time
+from collections.abc import Callable
+from concurrent.futures import Future
+from pathlib import Path
+from typing import Any
+
+import msgspec
+
+from daemon.protocol import (
+    Event,
+    Library,
+    Message,
+    PlayerState,
+    ProtocolError,
+    Reply,
+    Request,
+    encode,
+    recv_message,
+    socket_path,
+)
+from player.snapshot import SongEntry
+from player.util import FileLock
+
+logger: logging.Logger = logging.getLogger(__name__)
+
+MAIN_FILE: Path = Path(__file__).resolve().parent.parent / "main.py"
+# Held while a daemon is started, so front ends starting at once start one
+START_LOCK_FILE = "daemon.start.lock"
+# Seconds a daemon started by connect has to listen on its socket
+START_TIMEOUT = 60.0
+START_POLL_INTERVAL = 0.1
+
+
+class DaemonRequestError(Exception):
+    """The daemon answered a request with an error."""
+
+
+class PlayerClient:
+    """
+    Drive the daemon listening on a socket.
+
+    Calls block until the daemon answers them. Events are read on a
+    background thread, which is also where the listeners are called.
+    """
+
+    def __init__(self, path: Path) -> None:
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            self.sock.connect(str(path))
+        except OSError:
+            self.sock.close()
+            raise
+        self._ids = itertools.count(1)
+        self._pending: dict[int, Future[Any]] = {}
+        self._lock = threading.Lock()
+        self._listeners: list[Callable[[Event], None]] = []
+        self.state: PlayerState | None = None
+        self._state_time: float = 0.0
+        self._reader = threading.Thread(
+            target=self._read,
+            daemon=True,
+            name="PlayerClient",
+        )
+        self._reader.start()
+
+    def call(self, method: str, *params: Any, timeout: float | None = None) -> Any:
+        """
+        Call a method of the daemon and return its result.
+
+        Raises:
+            DaemonRequestError: If the method failed in the daemon
+            ConnectionError: If the connection to the daemon is lost
+
+        """
+        future: Future[Any] = Future()
+        with self._lock:
+            request_id: int = next(self._ids)
+            self._pending[request_id] = future
+            self.sock.sendall(encode(Request(request_id, method, list(params))))
+        return future.result(timeout)
+
+    def get_state(self) -> PlayerState:
+        state: PlayerState = msgspec.convert(self.call("state"), PlayerState)
+        self.state = state
+        self._state_time = time.monotonic()
+        return state
+
+    def library(self) -> Library:
+        return msgspec.convert(self.call("library"), Library)
+
+    def search(self, query: str, filter: str = "songs") -> list[SongEntry]:  # noqa: A002
+        return msgspec.convert(self.call("search", query, filter), list[SongEntry])
+
+    def subscribe(self, listener: Callable[[Event], None]) -> None:
+        """Call listener with each event of the daemon."""
+        self._listeners.append(listener)
+        if len(self._listeners) == 1:
+            self.call("subscribe")
+
+    @property
+    def position(self) -> float:
+        """The position of the current song, estimated from the last state."""
+        if self.state is None:
+            return 0.0
+        if not self.state.playing:
+            return self.state.position
+        elapsed: float = time.monotonic() - self._state_time
+        return min(self.state.position + elapsed, self.state.length)
+
+    def _read(self) -> None:
+        error: Exception = ConnectionError("Connection to the daemon closed")
+        try:
+            while (message := recv_message(self.sock)) is not None:
+                self._dispatch(message)
+        except (OSError, ProtocolError) as e:
+            error = ConnectionError(f"Connection to the daemon lost: {e}")
+        with self._lock:
+            pending: list[Future[Any]] = list(self._pending.values())
+            self._pending.clear()
+        for future in pending:
+            future.set_exception(error)
+
+    def _dispatch(self, message: Message) -> None:
+        if isinstance(message, Reply):
+            with self._lock:
+                future: Future[Any] | None = self._pending.pop(message.id, None)
+            if future is None:
+                return
+            if message.error is not None:
+                future.set_exception(DaemonRequestError(message.error))
+            else:
+                future.set_result(message.result)
+        elif isinstance(message, Event):
+            self.state = message.state
+            self._state_time = time.monotonic()
+            for listener in self._listeners:
+                try:
+                    listener(message)
+                except Exception:
+                    logger.exception("Daemon event listener failed")
+
+    @property
+    def connected(self) -> bool:
+        """False once the daemon has closed the connection."""
+        return self._reader.is_alive()
+
+    def wait_closed(self) -> None:
+        """Wait until the daemon closes the connection."""
+        self._reader.join()
+
+    def close(self) -> None:
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self.sock.close()
+        self._reader.join(timeout=1)
+
+
+def connect(app_dir: str) -> PlayerClient:
+    """
+    Connect to the daemon of app_dir, starting one if none is listening.
+
+    A daemon started here stops once its last client has disconnected.
+
+    Raises:
+        ConnectionError: If the daemon started here exits, or doesn't listen
+            in time
+
+    """
+    path: Path = socket_path(app_dir)
+    with contextlib.suppress(OSError):
+        return PlayerClient(path)
+    with FileLock(Path(app_dir) / START_LOCK_FILE):
+        # Started by another front end while this one waited for the lock
+        with contextlib.suppress(OSError):
+            return PlayerClient(path)
+        logger.info("Starting the player daemon")
+        process = subprocess.Popen(  # noqa: S603
+            [sys.executable, str(MAIN_FILE), "--daemon", "--until-idle"],
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+            start_new_session=True,
+        )
+        deadline: float = time.monotonic() + START_TIMEOUT
+        while True:
+            with contextlib.suppress(OSError):
+                return PlayerClient(path)
+            code: int | None = process.poll()
+            if code is not None:
+                msg: str = f"The player daemon exited with code {code}, see the log"
+                raise ConnectionError(msg)
+            if time.monotonic() > deadline:
+                process.terminate()
+                msg = f"The player daemon didn't listen on {path} in time"
+                raise ConnectionError(msg)
+            time.sleep(START_POLL_INTERVAL)
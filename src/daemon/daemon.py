@@ -0,0 +1,562 @@
+"""
+Headless player daemon.
+
+It owns the playback, the library and the downloads, along with the media
+controls, the lyrics lookups and the Discord presence, and serves them to any
+number of clients over the Unix socket of daemon.protocol: the app, the
+browser sessions of server.py and ctl.py. Clients that subscribe get an Event
+after each change of the player.
+"""
+
+import asyncio
+import contextlib
+import logging
+import os
+import signal
+import socket
+from collections.abc import Callable
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from pathlib import Path
+from typing import Any
+
+from api.covers import ensure_cover
+from api.discord_rpc.rich_presence import rich_presence
+from api.downloader import Downloader
+from api.lyrics import LyricsService
+from api.prefetch import Prefetcher
+from api.protocols import SongData
+from api.streaming import StreamServer, start_stream_server
+from api.ytmusic import OfflineError
+from daemon.protocol import (
+    Event,
+    Library,
+    PlayerState,
+    ProtocolError,
+    Reply,
+    Request,
+    encode,
+    read_message,
+    socket_path,
+)
+from log.metrics import metrics
+from player.player import PyMusicTermPlayer
+from player.playlists import (
+    ImportResult,
+    Playlist,
+    PlaylistResolver,
+    delete_playlist,
+    export_m3u,
+    list_playlists,
+    open_playlist,
+    playlist_name,
+)
+from player.snapshot import (
+    Snapshot,
+    SongEntry,
+    load_snapshot,
+    save_snapshot,
+    to_entry,
+)
+from setting import SettingManager
+
+logger: logging.Logger = logging.getLogger(__name__)
+
+# How often the daemon checks whether the current song has ended
+WATCH_INTERVAL = 0.5
+# A subscriber that doesn't read its events is dropped past this backlog
+MAX_WRITE_BUFFER = 1024 * 1024
+# Methods that wait on the network or on big files, kept off the thread of
+# the other commands. Searches get a thread of their own, so they never wait
+# behind a download.
+SEARCH_METHODS: frozenset[str] = frozenset({"search", "online"})
+SLOW_METHODS: frozenset[str] = frozenset(
+    {"play_video", "playlist_import", "playlist_export"},
+)
+# Methods that only read counters, answered on the event loop
+LOOP_METHODS: frozenset[str] = frozenset({"stats"})
+
+
+class DaemonError(Exception):
+    """The daemon could not start."""
+
+
+class Connection:
+    def __init__(self, writer: asyncio.StreamWriter) -> None:
+        self.writer: asyncio.StreamWriter = writer
+        self.subscribed = False
+
+    def send(self, message: Reply | Event) -> None:
+        if self.writer.is_closing():
+            return
+        if self.writer.transport.get_write_buffer_size() > MAX_WRITE_BUFFER:
+            logger.warning("Dropping a client that doesn't read its events")
+            self.writer.close()
+            return
+        self.writer.write(encode(message))
+
+
+class PlayerDaemon:
+    def __init__(self, setting: SettingManager, *, until_idle: bool = False) -> None:
+        self.setting: SettingManager = setting
+        self.path: Path = socket_path(self.setting.app_dir)
+        # Started by a front end, stopped once the last client has left
+        self.until_idle: bool = until_idle
+        if self.setting.os == "win32":
+            from player.media_control import MediaControlWin32 as MediaControl  # noqa: I001, PLC0415
+        else:
+            from player.media_control import MediaControlMPRIS as MediaControl  # noqa: I001, PLC0415
+        self.media_control = MediaControl(self.setting.cover_dir)
+        self.lyrics_service = LyricsService()
+        self.prefetcher: Prefetcher | None = None
+        if self.setting.prefetch:
+            self.prefetcher = Prefetcher(
+                self.setting.cache_dir,
+                top_n=self.setting.prefetch_top_n,
+                next_k=self.setting.prefetch_next_k,
+                download=self.setting.prefetch_download,
+                disk_budget=self.setting.prefetch_disk_budget_mb * 1024 * 1024,
+                rate_limit=self.setting.prefetch_rate_limit_kbps * 1024 or None,
+            )
+        self.downloader = Downloader(
+            self.setting.music_dir,
+            self.on_download_progress,
+            self.prefetcher,
+            quality=self.setting.download_quality,
+            upgrade=self.setting.upgrade_quality,
+            lyrics_service=self.lyrics_service,
+        )
+        # The library scan shared by the clients of the daemon, shown from the
+        # snapshot of the last exit until the music folder is scanned again
+        self.warm_start: Snapshot | None = load_snapshot(self.setting.app_dir)
+        self.player = PyMusicTermPlayer(
+            self.setting,
+            self.media_control,
+            self.downloader,
+            self.prefetcher,
+            self.warm_start,
+        )
+        # Results of the searches of every client, any of them may be played
+        self.results: dict[str, SongData] = {}
+        self.stream_server: StreamServer | None = None
+        self.resolver = PlaylistResolver(self.player, self.on_playlist_download)
+
+        self.connections: set[Connection] = set()
+        self.library_version = 0
+        self._was_playing = False
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._stopped: asyncio.Event | None = None
+        self._tasks: set[asyncio.Task[None]] = set()
+        # The player is driven from one thread, like from the UI of the app
+        self._commands = ThreadPoolExecutor(
+            max_workers=1,
+            thread_name_prefix="daemon-commands",
+        )
+        self._network = ThreadPoolExecutor(
+            max_workers=1,
+            thread_name_prefix="daemon-network",
+        )
+        self._search = ThreadPoolExecutor(
+            max_workers=1,
+            thread_name_prefix="daemon-search",
+        )
+        self.media_control.init(self.player, self._commands.submit)
+        self.lyrics_service.add_listener(self.on_lyrics)
+        self.methods: dict[str, Callable[..., Any]] = {
+            "state": self.capture_state,
+            "library": self.library,
+            "search": self.search,
+            "online": self.online,
+            "stats": self.stats,
+            "play": self.player.play_from_list,
+            "play_video": self.play_video,
+            "pause": self.player.pause_song,
+            "resume": self.player.resume_song,
+            "toggle": self.toggle,
+            "next": self.player.next,
+            "previous": self.player.previous,
+            "seek": self.player.seek,
+            "seek_to": self.player.seek_to,
+            "set_volume": self.player.set_volume,
+            "mute": self.player.toggle_mute,
+            "set_loop": self.player.set_loop,
+            "shuffle": self.player.suffle,
+            "set_shuffle": self.player.set_shuffle,
+            "delete": self.player.delete_song,
+            "lyrics": self.request_lyrics,
+            "lyrics_backfill": self.backfill_lyrics,
+            "playlists": self.playlists,
+            "playlist": self.playlist,
+            "playlist_add": self.add_to_playlist,
+            "playlist_remove": self.remove_from_playlist,
+            "playlist_delete": self.delete_playlist,
+            "playlist_import": self.import_playlist,
+            "playlist_export": self.export_playlist,
+        }
+
+    def capture_state(self) -> PlayerState:
+        """Snapshot the player, to be called on the thread that changed it."""
+        song: SongData | None = self.player.current_song
+        return PlayerState(
+            current_index=self.player.current_song_index,
+            video_id=song.video_id if song is not None else None,
+            playing=self.player.playing,
+            position=self.player.position,
+            length=self.player.song_length,
+            volume=self.player.music_player.volume,
+            loop=self.player.music_player.loop_at_end,
+            shuffle=self.player.shuffled,
+            library_version=self.library_version,
+        )
+
+    def library(self) -> Library:
+        return Library(
+            version=self.library_version,
+            songs=[to_entry(song) for song in self.player.list_of_downloaded_songs],
+        )
+
+    def search(self, query: str, filter: str = "songs") -> list[SongEntry]:  # noqa: A002
+        """Search YouTube Music, the clients read the thumbnails from cover_dir."""
+        songs: list[SongData] = self.player.query(query, filter)
+        for song in songs:
+            self.results[song.video_id] = song
+            ensure_cover(song, self.setting.cover_dir)
+        return [to_entry(song) for song in songs]
+
+    def online(self) -> bool:
+        """Whether YouTube Music can be searched, waiting for the warm-up."""
+        self.player.warm_up()
+        try:
+            return self.player.ytm_ready.result() is not None
+        except OfflineError:
+            return False
+
+    def stats(self) -> dict[str, float | None]:
+        """The figures of the performance HUD measured in the daemon."""
+        prefetch: float | None = None
+        prefetcher: Prefetcher | None = self.prefetcher
+        if prefetcher is not None and prefetcher.hits + prefetcher.misses:
+            prefetch = prefetcher.hit_rate
+        return {
+            "http_cache": metrics.ratio("http_cache.hit", "http_cache.miss"),
+            "prefetch": prefetch,
+            "downloads": metrics.get("downloads.active"),
+            "bandwidth": self.downloader.estimator.estimate,
+        }
+
+    def play_video(self, video_id: str) -> None:
+        """Download a song here, then play it on the thread of the commands."""
+        song: SongData | None = self.results.get(video_id)
+        if song is None:
+            # Not found by a search, as when played from ctl.py
+            song = self.player.ytm.get_song(video_id)
+        if song is None:
+            msg: str = f"YouTube Music doesn't know {video_id}"
+            raise ValueError(msg)
+        path: str | None = self.downloader.download(song)
+        if path is not None:
+            self._commands.submit(self.player.play_downloaded, path).result()
+
+    def request_lyrics(self, video_id: str) -> None:
+        """Look the lyrics of a song up, a "lyrics" event tells the result."""
+        song: SongData | None = self.library_by_id().get(video_id)
+        if song is not None:
+            self.lyrics_service.request(song)
+
+    def backfill_lyrics(self) -> int:
+        """
+        Look the missing lyrics of the library up.
+
+        Returns:
+            int: The number of songs looked up, each one ends with a
+                "lyrics_backfill" event
+
+        """
+        return self.lyrics_service.backfill(
+            list(self.player.list_of_downloaded_songs),
+            lambda done, count: self.publish(
+                Event("lyrics_backfill", self.capture_state(), [done, count]),
+            ),
+        )
+
+    def on_lyrics(self, video_id: str, found: bool) -> None:  # noqa: FBT001
+        self.publish(Event("lyrics", self.capture_state(), [video_id, found]))
+
+    def open_playlist(self, name: str, *, create: bool = False) -> Playlist:
+        return open_playlist(self.setting.playlist_dir, name, create=create)
+
+    def playlists(self) -> list[str]:
+        return list_playlists(self.setting.playlist_dir)
+
+    def playlist(self, name: str) -> list[str]:
+        return list(self.open_playlist(name))
+
+    def add_to_playlist(self, name: str, video_id: str) -> None:
+        self.open_playlist(name, create=True).append(video_id)
+
+    def remove_from_playlist(self, name: str, position: int) -> None:
+        self.resolver.remove(self.open_playlist(name), position)
+
+    def delete_playlist(self, name: str) -> None:
+        with contextlib.suppress(FileNotFoundError):
+            self.resolver.forget(self.open_playlist(name))
+        delete_playlist(self.setting.playlist_dir, name)
+
+    def library_by_id(self) -> dict[str, SongData]:
+        return {song.video_id: song for song in list(self.player.list_of_downloaded_songs)}
+
+    def import_playlist(self, path: str, name: str | None = None) -> dict[str, int]:
+        """Import an M3U file, what isn't downloaded yet is fetched in the background."""
+        playlist: Playlist = self.open_playlist(
+            name or playlist_name(Path(path).stem),
+            create=True,
+        )
+        result: ImportResult = self.resolver.import_m3u(
+            Path(path),
+            playlist,
+            self.library_by_id(),
+        )
+        return {
+            "added": result.added,
+            "missing": len(result.missing),
+            "unresolved": len(result.unresolved),
+        }
+
+    def export_playlist(self, name: str, path: str) -> int:
+        return export_m3u(self.open_playlist(name), self.library_by_id(), Path(path))
+
+    def on_playlist_download(self, _: str) -> None:
+        # Picks up the new file along with any other added meanwhile
+        self._commands.submit(
+            lambda: self.player.update_library(*self.player.scan_library()),
+        )
+
+    def toggle(self) -> None:
+        if self.player.playing:
+            self.player.pause_song()
+        else:
+            self.player.resume_song()
+
+    def on_player_event(self, event: str) -> None:
+        if event == "library":
+            self.library_version += 1
+        self.publish(Event(event, self.capture_state()))
+
+    def on_download_progress(self, downloaded: int, total: int) -> None:
+        self.publish(Event("download", self.capture_state(), [downloaded, total]))
+
+    def publish(self, event: Event) -> None:
+        """Send an event to the subscribers, from any thread."""
+        if self._loop is not None and not self._loop.is_closed():
+            self._loop.call_soon_threadsafe(self.broadcast, event)
+
+    def broadcast(self, event: Event) -> None:
+        for connection in list(self.connections):
+            if connection.subscribed:
+                connection.send(event)
+
+    def advance_if_ended(self) -> None:
+        """Play the next song once the current one is over."""
+        if self._was_playing and self.player.check_if_song_ended():
+            self.player.next()
+        self._was_playing = self.player.playing
+
+    async def watch(self) -> None:
+        loop: asyncio.AbstractEventLoop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(WATCH_INTERVAL)
+            await loop.run_in_executor(self._commands, self.advance_if_ended)
+
+    def reconcile_library(self) -> None:
+        """Bring the library up to date with the music folder, then write the covers."""
+        added, removed = self.player.scan_library()
+        self._commands.submit(self.player.update_library, added, removed).result()
+        for song in list(self.player.list_of_downloaded_songs):
+            if song.thumbnail is not None:
+                ensure_cover(song, self.setting.cover_dir)
+
+    def save_snapshot(self) -> None:
+        """Save the library and the position, the app saves what its UI showed."""
+        snapshot: Snapshot = load_snapshot(self.setting.app_dir) or Snapshot()
+        snapshot.songs = [
+            to_entry(song) for song in self.player.list_of_downloaded_songs
+        ]
+        snapshot.current_index = self.player.current_song_index
+        snapshot.position = self.player.position if self.player.current_song else 0.0
+        save_snapshot(self.setting.app_dir, snapshot)
+
+    def warm_up(self) -> None:
+        import requests_cache  # noqa: PLC0415
+
+        requests_cache.install_cache(
+            f"{self.setting.cache_dir}/cache",
+            expire_after=timedelta(hours=1),
+            wal=True,
+        )
+        self.player.warm_up()
+
+    async def call(self, request: Request) -> Any:
+        """Run a request on the thread of its method."""
+        method: Callable[..., Any] = self.methods[request.method]
+        if request.method in LOOP_METHODS:
+            return method(*request.params)
+        executor: ThreadPoolExecutor = self._commands
+        if request.method in SEARCH_METHODS:
+            executor = self._search
+        elif request.method in SLOW_METHODS:
+            executor = self._network
+        loop: asyncio.AbstractEventLoop = asyncio.get_running_loop()
+        return await loop.run_in_executor(executor, lambda: method(*request.params))
+
+    async def answer(self, connection: Connection, request: Request) -> None:
+        if request.method == "subscribe":
+            connection.subscribed = True
+            connection.send(Reply(request.id))
+            return
+        if request.method == "unsubscribe":
+            connection.subscribed = False
+            connection.send(Reply(request.id))
+            return
+        if request.method == "shutdown":
+            connection.send(Reply(request.id))
+            self.shutdown()
+            return
+        if request.method not in self.methods:
+            connection.send(
+                Reply(request.id, error=f"Unknown method: {request.method}"),
+            )
+            return
+        try:
+            result: Any = await self.call(request)
+        except Exception as e:
+            logger.exception("Daemon method %s failed", request.method)
+            connection.send(Reply(request.id, error=f"{type(e).__name__}: {e}"))
+        else:
+            connection.send(Reply(request.id, result))
+
+    def spawn(self, coroutine: Any) -> None:
+        task: asyncio.Task[None] = asyncio.create_task(coroutine)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def handle_client(
+        self,
+        reader: asyncio.StreamReader,
+        writer: asyncio.StreamWriter,
+    ) -> None:
+        connection = Connection(writer)
+        self.connections.add(connection)
+        logger.info("Client connected, %d in total", len(self.connections))
+        try:
+            while (message := await read_message(reader)) is not None:
+                if not isinstance(message, Request):
+                    msg: str = f"Unexpected {type(message).__name__} from a client"
+                    raise ProtocolError(msg)
+                # Answered concurrently, the id of the reply tells them apart
+                self.spawn(self.answer(connection, message))
+        except ProtocolError as e:
+            logger.warning("Closing a client: %s", e)
+        except ConnectionError:
+            pass
+        finally:
+            self.connections.discard(connection)
+            writer.close()
+            logger.info("Client disconnected, %d left", len(self.connections))
+            if self.until_idle and not self.connections:
+                self.shutdown()
+
+    def prepare_socket(self) -> None:
+        """
+        Remove the socket left by a daemon that didn't stop cleanly.
+
+        Raises:
+            DaemonError: If another daemon is listening on it
+
+        """
+        if not self.path.exists():
+            return
+        probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            probe.connect(str(self.path))
+        except OSError:
+            self.path.unlink(missing_ok=True)
+        else:
+            msg: str = f"A daemon is already listening on {self.path}"
+            raise DaemonError(msg)
+        finally:
+            probe.close()
+
+    def shutdown(self) -> None:
+        if self._stopped is not None:
+            self._stopped.set()
+
+    async def serve(self) -> None:
+        """Serve the clients until shutdown is requested or a signal is received."""
+        self._loop = asyncio.get_running_loop()
+        self._stopped = asyncio.Event()
+        self.prepare_socket()
+        # Only the user may drive the player: the socket is created with these
+        # permissions, rather than changed once others may have connected
+        umask: int = os.umask(0o177)
+        try:
+            server: asyncio.Server = await asyncio.start_unix_server(
+                self.handle_client,
+                path=str(self.path),
+            )
+        finally:
+            os.umask(umask)
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            self._loop.add_signal_handler(signum, self.shutdown)
+        self.player.add_listener(self.on_player_event)
+        if self.setting.stream_server:
+            self.stream_server = start_stream_server(
+                self.player,
+                self.setting.cover_dir,
+                self.setting.stream_host,
+                self.setting.stream_port,
+            )
+        # Searches are the first to need YouTube Music
+        self._loop.run_in_executor(self._search, self.warm_up)
+        self.resolver.resume(self.setting.playlist_dir)
+        if self.warm_start is not None:
+            self._loop.run_in_executor(
+                self._commands,
+                self.player.cue,
+                self.warm_start.position,
+            )
+            self._loop.run_in_executor(self._network, self.reconcile_library)
+        watcher: asyncio.Task[None] = asyncio.create_task(self.watch())
+        presence: asyncio.Task[None] = asyncio.create_task(rich_presence(self.player))
+        logger.info("Daemon listening on %s", self.path)
+        try:
+            async with server:
+                await self._stopped.wait()
+                # Leaving the server waits for its clients, subscribers included
+                server.close()
+                for connection in list(self.connections):
+                    connection.writer.close()
+        finally:
+            for task in (watcher, presence, *self._tasks):
+                task.cancel()
+            await asyncio.gather(watcher, presence, *self._tasks, return_exceptions=True)
+            for connection in list(self.connections):
+                connection.writer.close()
+            self.close()
+
+    def close(self) -> None:
+        self.path.unlink(missing_ok=True)
+        self.resolver.shutdown()
+        self._commands.shutdown(wait=True, cancel_futures=True)
+        self._network.shutdown(wait=False, cancel_futures=True)
+        self._search.shutdown(wait=False, cancel_futures=True)
+        self.save_snapshot()
+        self.player.stop()
+        self.player.persist_queue()
+        self.media_control.stop()
+        if self.stream_server is not None:
+            self.stream_server.stop()
+        self.lyrics_service.shutdown()
+        if self.prefetcher is not None:
+            self.prefetcher.shutdown()
+        self.setting.flush()
+        logger.info("Daemon stopped")
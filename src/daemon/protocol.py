@@ -0,0 +1,137 @@
+"""
+Protocol between the player daemon and its clients.
+
+Messages are msgpack encoded msgspec structs, each one sent after its length
+as a 4 bytes big-endian integer, over a Unix socket in the app folder.
+"""
+
+import asyncio
+import socket
+import struct
+from pathlib import Path
+from typing import Any
+
+import msgspec
+
+from player.snapshot import SongEntry
+
+SOCKET_FILE = "daemon.sock"
+HEADER = struct.Struct("!I")
+MAX_MESSAGE_SIZE = 16 * 1024 * 1024
+
+
+class ProtocolError(Exception):
+    """A message could not be read from the socket."""
+
+
+class Request(msgspec.Struct, tag="request"):
+    id: int
+    method: str
+    params: list[Any] = []
+
+
+class Reply(msgspec.Struct, tag="reply"):
+    id: int
+    result: Any = None
+    error: str | None = None
+
+
+class PlayerState(msgspec.Struct):
+    current_index: int = 0
+    video_id: str | None = None
+    playing: bool = False
+    position: float = 0.0
+    length: float = 0.0
+    volume: float = 1.0
+    loop: bool = False
+    shuffle: bool = False
+    # Bumped on each change of the library, fetch it again when it moves
+    library_version: int = 0
+
+
+class Event(msgspec.Struct, tag="event"):
+    """Sent to the subscribed clients after each change of the player."""
+
+    event: str
+    state: PlayerState
+    data: Any = None
+
+
+class Library(msgspec.Struct):
+    version: int
+    songs: list[SongEntry]
+
+
+Message = Request | Reply | Event
+
+_encoder = msgspec.msgpack.Encoder()
+_decoder = msgspec.msgpack.Decoder(Message)
+
+
+def socket_path(app_dir: str) -> Path:
+    return Path(app_dir) / SOCKET_FILE
+
+
+def encode(message: Message) -> bytes:
+    """Encode a message with its length in front of it."""
+    payload: bytes = _encoder.encode(message)
+    return HEADER.pack(len(payload)) + payload
+
+
+def decode(payload: bytes) -> Message:
+    try:
+        return _decoder.decode(payload)
+    except msgspec.DecodeError as e:
+        msg: str = f"Invalid message: {e}"
+        raise ProtocolError(msg) from e
+
+
+def _check_size(size: int) -> None:
+    if size > MAX_MESSAGE_SIZE:
+        msg: str = f"Message of {size} bytes is over the limit"
+        raise ProtocolError(msg)
+
+
+async def read_message(reader: asyncio.StreamReader) -> Message | None:
+    """
+    Read the next message of a stream.
+
+    Returns:
+        Message | None: The message, None once the peer has closed the stream
+
+    """
+    try:
+        header: bytes = await reader.readexactly(HEADER.size)
+    except asyncio.IncompleteReadError:
+        return None
+    (size,) = HEADER.unpack(header)
+    _check_size(size)
+    try:
+        return decode(await reader.readexactly(size))
+    except asyncio.IncompleteReadError as e:
+        msg = "Connection closed in the middle of a message"
+        raise ProtocolError(msg) from e
+
+
+def _recv_exactly(sock: socket.socket, size: int) -> bytes | None:
+    buffer = bytearray()
+    while len(buffer) < size:
+        chunk: bytes = sock.recv(size - len(buffer))
+        if not chunk:
+            return None
+        buffer += chunk
+    return bytes(buffer)
+
+
+def recv_message(sock: socket.socket) -> Message | None:
+    """Blocking version of read_message, for the clients."""
+    header: bytes | None = _recv_exactly(sock, HEADER.size)
+    if header is None:
+        return None
+    (size,) = HEADER.unpack(header)
+    _check_size(size)
+    payload: bytes | None = _recv_exactly(sock, size)
+    if payload is None:
+        msg = "Connection closed in the middle of a message"
+        raise ProtocolError(msg)
+    return decode(payload)
@@ -0,0 +1,181 @@
+"""The player of the daemon, as the app and the browser sessions drive it."""
+
+from collections.abc import Callable
+
+from api.lyrics import Lyrics
+from api.protocols import SongData
+from api.ytmusic import OfflineError
+from daemon.client import DaemonRequestError, PlayerClient
+from daemon.protocol import Event, Library, PlayerState
+from player.snapshot import Snapshot, SongEntry, to_song
+
+
+class RemotePlayer:
+    """
+    Mirror the part of PyMusicTermPlayer the app uses, over a PlayerClient.
+
+    The state comes with the events of the daemon and the position is
+    estimated in between, so reading them doesn't wait on the socket. The
+    library is fetched again when the version of the events moves, with
+    fetch_library off the UI thread, then set_library on it.
+    """
+
+    def __init__(self, client: PlayerClient, snapshot: Snapshot | None = None) -> None:
+        self.client: PlayerClient = client
+        self.dict_of_song_result: dict[str, SongData] = {}
+        if snapshot is not None:
+            for entry in snapshot.search_results:
+                self.dict_of_song_result[entry.video_id] = to_song(entry)
+        self.lyrics_data: Lyrics | None = None
+        self.list_of_downloaded_songs: list[SongData] = []
+        self._songs_by_id: dict[str, SongData] = {}
+        self.library_version = -1
+        self.client.get_state()
+        self.set_library(self.fetch_library())
+
+    def add_listener(self, listener: Callable[[Event], None]) -> None:
+        """Call listener with each event of the daemon, on the thread of the client."""
+        self.client.subscribe(listener)
+        # Catch up with what changed before the subscription
+        self.client.get_state()
+
+    @property
+    def state(self) -> PlayerState:
+        return self.client.state or PlayerState()
+
+    def fetch_library(self) -> Library:
+        return self.client.library()
+
+    def set_library(self, library: Library) -> set[str]:
+        """
+        Show a library fetched from the daemon.
+
+        Returns:
+            set[str]: The video ids no longer in the library
+
+        """
+        # Known songs keep the thumbnail already read for them
+        songs: list[SongData] = [
+            self._songs_by_id.get(entry.video_id) or to_song(entry)
+            for entry in library.songs
+        ]
+        songs_by_id: dict[str, SongData] = {song.video_id: song for song in songs}
+        removed: set[str] = self._songs_by_id.keys() - songs_by_id.keys()
+        self.list_of_downloaded_songs = songs
+        self._songs_by_id = songs_by_id
+        self.library_version = library.version
+        return removed
+
+    @property
+    def current_song(self) -> SongData | None:
+        video_id: str | None = self.state.video_id
+        return self._songs_by_id.get(video_id) if video_id is not None else None
+
+    @property
+    def current_song_index(self) -> int:
+        return self.state.current_index
+
+    @property
+    def playing(self) -> bool:
+        return self.state.playing
+
+    @property
+    def song_length(self) -> float:
+        return self.state.length
+
+    @property
+    def position(self) -> float:
+        return self.client.position
+
+    @property
+    def volume_level(self) -> float:
+        return self.state.volume
+
+    @property
+    def shuffled(self) -> bool:
+        return self.state.shuffle
+
+    def online(self) -> bool:
+        """Whether YouTube Music can be searched, once the daemon has tried."""
+        return self.client.call("online")
+
+    def query(self, query: str, filter: str) -> list[SongData]:  # noqa: A002
+        """
+        Search YouTube Music, the thumbnails are read from cover_dir.
+
+        Raises:
+            OfflineError: If YouTube Music can't be reached for now
+
+        """
+        try:
+            entries: list[SongEntry] = self.client.search(query, filter)
+        except DaemonRequestError as e:
+            if str(e).startswith(f"{OfflineError.__name__}:"):
+                raise OfflineError(str(e)) from e
+            raise
+        result: list[SongData] = [to_song(entry) for entry in entries]
+        self.dict_of_song_result.clear()
+        for song in result:
+            self.dict_of_song_result[song.video_id] = song
+        return result
+
+    def play_from_ytb(self, video_id: str) -> None:
+        """Download a search result in the daemon and play it, waiting for both."""
+        self.client.call("play_video", video_id)
+
+    def play_from_list(self, index: int) -> None:
+        self.client.call("play", index)
+
+    def previous(self) -> int:
+        return self.client.call("previous")
+
+    def next(self) -> int:
+        return self.client.call("next")
+
+    def seek(self, seconds: float = 10) -> None:
+        self.client.call("seek", seconds)
+
+    def seek_to(self, seconds: float) -> None:
+        self.client.call("seek_to", seconds)
+
+    def suffle(self) -> None:
+        self.client.call("shuffle")
+
+    def loop_at_end(self) -> bool:
+        """Toggle the loop at the end of the song."""
+        looping: bool = not self.state.loop
+        self.client.call("set_loop", looping)
+        return looping
+
+    def volume(self, value: float) -> None:
+        """Raise or lower the volume by value."""
+        self.client.call("set_volume", self.state.volume + value)
+
+    def toggle_mute(self) -> bool:
+        return self.client.call("mute")
+
+    def pause_song(self) -> None:
+        self.client.call("pause")
+
+    def resume_song(self) -> None:
+        self.client.call("resume")
+
+    def delete_song(self, index: int) -> None:
+        self.client.call("delete", index)
+
+    def add_to_playlist(self, name: str, video_id: str) -> None:
+        self.client.call("playlist_add", name, video_id)
+
+    def request_lyrics(self, video_id: str) -> None:
+        """Look lyrics up in the daemon, a "lyrics" event tells the result."""
+        self.client.call("lyrics", video_id)
+
+    def backfill_lyrics(self) -> int:
+        return self.client.call("lyrics_backfill")
+
+    def stats(self) -> dict[str, float | None]:
+        """The figures of the performance HUD measured in the daemon."""
+        return self.client.call("stats")
+
+    def close(self) -> None:
+        self.client.close()
@@ -0,0 +1,91 @@
+import time
+from typing import TYPE_CHECKING
+
+from PIL import Image
+from textual.timer import Timer
+from textual.widgets import ListView, Static
+
+from log.metrics import metrics, rss
+
+if TYPE_CHECKING:
+    from main import PyMusicTerm
+
+REFRESH_INTERVAL = 0.5
+
+
+def _percent(ratio: float | None) -> str:
+    return "--" if ratio is None else f"{ratio * 100:.0f}%"
+
+
+def _size(size: float | None) -> str:
+    if size is None:
+        return "--"
+    for unit in ("B", "kB", "MB"):
+        if size < 1024:
+            return f"{size:.0f} {unit}"
+        size /= 1024
+    return f"{size:.1f} GB"
+
+
+class PerfHUD(Static):
+    """Overlay showing live performance counters, refreshed while it is displayed."""
+
+    def __init__(self, **kwargs: str) -> None:
+        super().__init__("", markup=False, **kwargs)
+        self._timer: Timer | None = None
+        self._last_tick: float = 0.0
+        self._loop_lag: float = 0.0
+
+    def toggle(self) -> None:
+        self.display = not self.display
+        if self.display:
+            self._last_tick = time.perf_counter()
+            self._timer = self.set_interval(REFRESH_INTERVAL, self.refresh_stats)
+            self.refresh_stats()
+        elif self._timer is not None:
+            self._timer.stop()
+            self._timer = None
+
+    def refresh_stats(self) -> None:
+        now: float = time.perf_counter()
+        if self._timer is not None:
+            # How late the event loop ran this timer
+            self._loop_lag = max(now - self._last_tick - REFRESH_INTERVAL, 0)
+        self._last_tick = now
+
+        app: PyMusicTerm = self.app
+        lines: list[str] = [
+            f"update_time tick  {metrics.get('ui.tick_ms'):.2f} ms",
+            f"event loop lag    {self._loop_lag * 1000:.1f} ms",
+        ]
+        for listview in app.query(ListView):
+            lines.append(f"{listview.id}: {len(listview.children)} rows")
+
+        images: list[Image.Image] = [
+            song.thumbnail
+            for song in (
+                *app.player.list_of_downloaded_songs,
+                *app.player.dict_of_song_result.values(),
+            )
+            if song.thumbnail is not None
+        ]
+        thumbnails_size: int = sum(
+            image.width * image.height * len(image.getbands()) for image in images
+        )
+        lines.append(f"thumbnails        {len(images)} ({_size(thumbnails_size)})")
+
+        # Downloads, prefetches and HTTP requests are made by the daemon
+        stats: dict[str, float | None] = app.player.stats()
+        sidecar_ratio: float | None = metrics.ratio(
+            "lyrics.sidecar_hit",
+            "lyrics.sidecar_miss",
+        )
+        lines += [
+            f"http cache hits   {_percent(stats['http_cache'])}",
+            f"lyrics sidecars   {_percent(sidecar_ratio)}",
+            f"prefetch hits     {_percent(stats['prefetch'])}",
+            f"downloads         {stats['downloads']:.0f} active",
+            f"bandwidth         {_size(stats['bandwidth'])}/s",
+            f"rss               {_size(rss())}",
+        ]
+        self.update("\n".join(lines))
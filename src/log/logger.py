@@ -7,11 +7,17 @@ import atexit
 import datetime as dt
 import json
 import logging
+import random
+import threading
+import time
 from logging.config import dictConfig
+from logging.handlers import QueueListener
 from pathlib import Path
 from typing import Any, override
 
-LOG_RECORD_BUILTIN_ATTRS: set[str] = {
+import msgspec
+
+LOG_RECORD_BUILTIN_ATTRS: frozenset[str] = frozenset({
     "args",
     "asctime",
     "created",
@@ -35,7 +41,13 @@ LOG_RECORD_BUILTIN_ATTRS: set[str] = {
     "thread",
     "threadName",
     "taskName",
-}
+})
+
+# Call sites tracked by a RateLimitFilter before the idle ones are forgotten
+MAX_BUCKETS = 1024
+
+_listener: QueueListener | None = None
+_listener_lock = threading.Lock()
 
 
 class JSONFormatter(logging.Formatter):
@@ -46,11 +58,12 @@ class JSONFormatter(logging.Formatter):
     ) -> None:
         super().__init__()
         self.fmt_keys: dict[str, str] = fmt_keys if fmt_keys is not None else {}
+        self._encoder = msgspec.json.Encoder(enc_hook=str)
 
     @override
     def format(self, record: logging.LogRecord) -> str:
         message: dict[str, str | Any] = self._prepare_log_dict(record)
-        return json.dumps(message, default=str)
+        return self._encoder.encode(message).decode()
 
     def _prepare_log_dict(self, record: logging.LogRecord) -> dict[str, str | Any]:
         always_fields: dict[str, str] = {
@@ -74,13 +87,75 @@ class JSONFormatter(logging.Formatter):
         }
         message.update(always_fields)
 
-        for key, val in record.__dict__.items():
-            if key not in LOG_RECORD_BUILTIN_ATTRS:
-                message[key] = val  # noqa: PERF403
+        attrs: dict[str, Any] = record.__dict__
+        for key in attrs.keys() - LOG_RECORD_BUILTIN_ATTRS:
+            message[key] = attrs[key]
 
         return message
 
 
+class RateLimitFilter(logging.Filter):
+    """
+    Rate limit and sample the records of hot code paths.
+
+    Each logging call site (logger and line) gets a token bucket of `burst`
+    records refilled at `rate` records per second, and only a `sample`
+    fraction of the records is considered at all. Records at `level` or
+    above always pass. The number of records dropped since the last one let
+    through is added to it as `suppressed`.
+    """
+
+    def __init__(
+        self,
+        rate: float = 1.0,
+        burst: int = 5,
+        sample: float = 1.0,
+        level: int | str = logging.WARNING,
+    ) -> None:
+        super().__init__()
+        self.rate: float = rate
+        self.burst: int = burst
+        self.sample: float = sample
+        self.level: int = (
+            logging.getLevelNamesMapping()[level] if isinstance(level, str) else level
+        )
+        # (logger, line) -> (tokens, last refill, dropped)
+        self._buckets: dict[tuple[str, int], tuple[float, float, int]] = {}
+        self._lock = threading.Lock()
+
+    @override
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= self.level:
+            return True
+        # Not keyed by the message, f-strings would make one per record
+        key: tuple[str, int] = (record.name, record.lineno)
+        with self._lock:
+            now: float = time.monotonic()
+            if key not in self._buckets and len(self._buckets) >= MAX_BUCKETS:
+                self._prune(now)
+            tokens, last, dropped = self._buckets.get(key, (self.burst, now, 0))
+            tokens = min(self.burst, tokens + (now - last) * self.rate)
+            sampled_out: bool = (
+                self.sample < 1 and random.random() >= self.sample  # noqa: S311
+            )
+            if tokens < 1 or sampled_out:
+                self._buckets[key] = (tokens, now, dropped + 1)
+                return False
+            self._buckets[key] = (tokens - 1, now, 0)
+        if dropped:
+            record.suppressed = dropped
+        return True
+
+    def _prune(self, now: float) -> None:
+        """Forget the buckets refilled by now, or the oldest one (lock held)."""
+        refill: float = self.burst / self.rate if self.rate > 0 else float("inf")
+        for key, (_, last, dropped) in list(self._buckets.items()):
+            if not dropped and now - last >= refill:
+                del self._buckets[key]
+        if len(self._buckets) >= MAX_BUCKETS:
+            del self._buckets[next(iter(self._buckets))]
+
+
 def setup_logging(log_dir: str) -> None:
     config_file: Path = Path(
         Path(__file__).parent / "logging_config.json",
@@ -93,5 +168,18 @@ def setup_logging(log_dir: str) -> None:
     dictConfig(config)
     queue_handler: logging.Handler | None = logging.getHandlerByName("queue_handler")
     if queue_handler is not None:
+        global _listener  # noqa: PLW0603
         queue_handler.listener.start()
-        atexit.register(queue_handler.listener.stop)
+        with _listener_lock:
+            _listener = queue_handler.listener
+        atexit.unregister(stop_logging)
+        atexit.register(stop_logging)
+
+
+def stop_logging() -> None:
+    """Stop the log listener once, after the queued records are written."""
+    global _listener  # noqa: PLW0603
+    with _listener_lock:
+        listener, _listener = _listener, None
+    if listener is not None:
+        listener.stop()
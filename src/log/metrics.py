@@ -0,0 +1,45 @@
+import os
+import sys
+import threading
+
+
+class Metrics:
+    """In-process counters and gauges, updated by the subsystems and read by the HUD."""
+
+    def __init__(self) -> None:
+        self._values: dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def incr(self, name: str, value: float = 1) -> None:
+        with self._lock:
+            self._values[name] = self._values.get(name, 0) + value
+
+    def set(self, name: str, value: float) -> None:
+        self._values[name] = value
+
+    def get(self, name: str, default: float = 0) -> float:
+        return self._values.get(name, default)
+
+    def ratio(self, hits: str, misses: str) -> float | None:
+        """Return hits / (hits + misses), None if there was neither."""
+        total: float = self.get(hits) + self.get(misses)
+        return self.get(hits) / total if total else None
+
+
+metrics = Metrics()
+
+
+def rss() -> int | None:
+    """Return the resident set size of the process in bytes, if available."""
+    try:
+        with open("/proc/self/statm", "rb") as f:  # noqa: PTH123
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        pass
+    try:
+        import resource  # noqa: PLC0415
+    except ImportError:
+        return None
+    # Peak rather than current RSS, in kB on Linux and bytes on macOS
+    max_rss: int = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return max_rss if sys.platform == "darwin" else max_rss * 1024
@@ -0,0 +1,93 @@
+"""
+Sampling profiler for the running app.
+
+A daemon thread samples the stacks of every other thread and writes them in
+the collapsed stack format, which flamegraph.pl and speedscope.app open.
+"""
+
+import logging
+import sys
+import threading
+import time
+from collections import Counter
+from collections.abc import Callable
+from pathlib import Path
+from types import FrameType
+
+logger: logging.Logger = logging.getLogger(__name__)
+
+SAMPLE_INTERVAL = 0.005
+
+
+class SamplingProfiler:
+    def __init__(self, output_dir: str, interval: float = SAMPLE_INTERVAL) -> None:
+        self.output_dir = Path(output_dir)
+        self.interval: float = interval
+        self._thread: threading.Thread | None = None
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(
+        self,
+        seconds: float,
+        on_done: Callable[[Path], None] | None = None,
+    ) -> bool:
+        """
+        Sample for a number of seconds in the background.
+
+        Returns:
+            bool: False if a profile is already being recorded
+
+        """
+        if self.running:
+            return False
+        self._thread = threading.Thread(
+            target=self._run,
+            args=(seconds, on_done),
+            daemon=True,
+            name="SamplingProfiler",
+        )
+        self._thread.start()
+        return True
+
+    def _run(self, seconds: float, on_done: Callable[[Path], None] | None) -> None:
+        logger.info("Profiling for %s seconds", seconds)
+        own_id: int = threading.get_ident()
+        stacks: Counter[str] = Counter()
+        deadline: float = time.monotonic() + seconds
+        samples = 0
+        while time.monotonic() < deadline:
+            names: dict[int, str] = {t.ident: t.name for t in threading.enumerate()}
+            for thread_id, frame in sys._current_frames().items():  # noqa: SLF001
+                if thread_id == own_id:
+                    continue
+                stack: list[str] = _collapse(frame)
+                stack.insert(0, names.get(thread_id, str(thread_id)))
+                stacks[";".join(stack)] += 1
+            samples += 1
+            time.sleep(self.interval)
+
+        path: Path = self.output_dir / time.strftime("profile-%Y%m%d-%H%M%S.collapsed")
+        with path.open("w", encoding="utf-8") as f:
+            for stack, count in stacks.most_common():
+                f.write(f"{stack} {count}\n")
+        logger.info("Profile of %d samples written to %s", samples, path)
+        if on_done is not None:
+            try:
+                on_done(path)
+            except Exception:
+                logger.exception("Profiler callback failed")
+
+
+def _collapse(frame: FrameType | None) -> list[str]:
+    """Return the frames of a stack from the outermost to the innermost."""
+    stack: list[str] = []
+    while frame is not None:
+        code = frame.f_code
+        filename: str = Path(code.co_filename).name
+        stack.append(f"{code.co_qualname} ({filename}:{code.co_firstlineno})")
+        frame = frame.f_back
+    stack.reverse()
+    return stack
@@ -0,0 +1,73 @@
+"""
+Summarise the spans recorded in the JSONL log, per stage.
+
+    cd src && python -m log.trace_summary [LOG_FILE ...]
+"""
+
+import argparse
+import math
+from collections import defaultdict
+from pathlib import Path
+
+import msgspec
+
+from setting import LOG_DIR
+
+
+class SpanRecord(msgspec.Struct):
+    span: str | None = None
+    duration_ms: float | None = None
+
+
+def percentile(values: list[float], p: float) -> float:
+    """Nearest-rank percentile of sorted values."""
+    rank: int = max(math.ceil(p / 100 * len(values)), 1)
+    return values[rank - 1]
+
+
+def read_spans(paths: list[Path]) -> dict[str, list[float]]:
+    decoder = msgspec.json.Decoder(SpanRecord)
+    spans: dict[str, list[float]] = defaultdict(list)
+    for path in paths:
+        with path.open("rb") as f:
+            for line in f:
+                # Skip the records that can't be spans without decoding them
+                if b'"span"' not in line:
+                    continue
+                try:
+                    record: SpanRecord = decoder.decode(line)
+                except msgspec.DecodeError:
+                    continue
+                if record.span is not None and record.duration_ms is not None:
+                    spans[record.span].append(record.duration_ms)
+    return spans
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "logs",
+        nargs="*",
+        type=Path,
+        help="Log files, defaults to the app log and its rotated backups",
+    )
+    args: argparse.Namespace = parser.parse_args()
+    paths: list[Path] = args.logs or sorted(LOG_DIR.glob("pymusicterm.log.jsonl*"))
+
+    spans: dict[str, list[float]] = read_spans(paths)
+    if not spans:
+        print("No spans found, enable tracing with PYMUSICTERM_TRACE=1")
+        return
+    print(f"{'stage':<24}{'count':>8}{'p50 ms':>12}{'p95 ms':>12}{'max ms':>12}")
+    for name in sorted(spans):
+        values: list[float] = sorted(spans[name])
+        print(
+            f"{name:<24}{len(values):>8}"
+            f"{percentile(values, 50):>12.1f}"
+            f"{percentile(values, 95):>12.1f}"
+            f"{values[-1]:>12.1f}",
+        )
+
+
+if __name__ == "__main__":
+    main()
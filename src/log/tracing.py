@@ -0,0 +1,110 @@
+"""
+Lightweight spans timing the stages between picking a song and hearing it.
+
+Spans are recorded in the JSONL log with their name and duration. Tracing is
+off by default, in which case span() returns a shared no-op object. Turn it on
+with `tracing = true` in setting.toml or the PYMUSICTERM_TRACE=1 environment
+variable, then summarise the log with `python -m log.trace_summary`.
+"""
+
+import logging
+import os
+import time
+from collections.abc import Callable
+from functools import wraps
+from types import TracebackType
+from typing import Any, ParamSpec, TypeVar
+
+logger: logging.Logger = logging.getLogger(__name__)
+
+ENV_VAR = "PYMUSICTERM_TRACE"
+
+_enabled: bool = os.environ.get(ENV_VAR, "") not in ("", "0")
+
+P = ParamSpec("P")
+R = TypeVar("R")
+
+
+def enable(value: bool = True) -> None:  # noqa: FBT001, FBT002
+    global _enabled  # noqa: PLW0603
+    _enabled = value
+
+
+def is_enabled() -> bool:
+    return _enabled
+
+
+class Span:
+    """A timed stage, ended by leaving its with block or by calling end()."""
+
+    __slots__ = ("attrs", "name", "start")
+
+    def __init__(self, name: str, attrs: dict[str, Any]) -> None:
+        self.name: str = name
+        self.attrs: dict[str, Any] = attrs
+        self.start: float = time.perf_counter()
+
+    def __enter__(self) -> "Span":
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(
+        self,
+        exc_type: type[BaseException] | None,
+        exc: BaseException | None,
+        tb: TracebackType | None,
+    ) -> None:
+        self.end(error=exc_type is not None)
+
+    def end(self, **attrs: Any) -> None:  # noqa: ANN401
+        duration_ms: float = (time.perf_counter() - self.start) * 1000
+        self.attrs.update(attrs)
+        logger.info(
+            "span %s took %.1f ms",
+            self.name,
+            duration_ms,
+            extra={
+                "span": self.name,
+                "duration_ms": duration_ms,
+                "span_attrs": self.attrs,
+            },
+        )
+
+
+class NoopSpan:
+    __slots__ = ()
+
+    def __enter__(self) -> "NoopSpan":
+        return self
+
+    def __exit__(self, *_: object) -> None:
+        pass
+
+    def end(self, **attrs: Any) -> None:  # noqa: ANN401
+        pass
+
+
+NOOP_SPAN = NoopSpan()
+
+
+def span(name: str, **attrs: Any) -> Span | NoopSpan:  # noqa: ANN401
+    """Start a span, use it as a context manager or end() it yourself."""
+    if not _enabled:
+        return NOOP_SPAN
+    return Span(name, attrs)
+
+
+def traced(name: str) -> Callable[[Callable[P, R]], Callable[P, R]]:
+    """Record each call of the decorated function as a span."""
+
+    def decorator(func: Callable[P, R]) -> Callable[P, R]:
+        @wraps(func)
+        def wrapper(*args: P.args, **kwargs: P.kwargs) -> R:
+            if not _enabled:
+                return func(*args, **kwargs)
+            with Span(name, {}):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
@@ -1,16 +1,16 @@
+import argparse
 import asyncio
-import contextlib
 import logging
+import signal
+import sys
 import time
-from datetime import timedelta
-from pathlib import Path
 from typing import TYPE_CHECKING, ClassVar
 
-import requests_cache
 from textual import on, work
 from textual.app import App, ComposeResult
 from textual.binding import Binding
 from textual.containers import Center, Horizontal, Vertical
+from textual.message import Message
 from textual.widget import Widget
 from textual.widgets import (
     Button,
@@ -25,27 +25,67 @@ from textual.widgets import (
     TabPane,
 )
 from textual.worker import Worker, get_current_worker
+
+# Not deferred: textual_image queries the terminal when imported, which only
+# works before the app has started.
 from textual_image.widget import Image as WidgetImage
 
-from api.discord_rpc.rich_presence import rich_presence
-from api.downloader import Downloader
-from api.lyrics import download_lyrics, parse_lyrics
+from api.lyrics import Lyrics, has_lyrics, load_lyrics
+from api.lyrics_index import LyricsHit, LyricsIndex
 from api.protocols import SongData
-from player.player import PyMusicTermPlayer
-from player.util import format_time, string_to_seconds
+from api.ytmusic import OfflineError
+from daemon.client import PlayerClient, connect
+from daemon.protocol import Event, Library, PlayerState
+from daemon.remote import RemotePlayer
+from hud import PerfHUD
+from log.metrics import metrics
+from log.profiler import SamplingProfiler
+from player.playlists import LIKED_PLAYLIST
+from player.snapshot import (
+    Snapshot,
+    load_snapshot,
+    load_thumbnail,
+    save_snapshot,
+    to_entry,
+)
+from player.util import format_time
 from setting import SettingManager, rename_console
 
 if TYPE_CHECKING:
     from textual.widget import Widget
 
-    from player.media_control import (
-        MediaControlMPRIS,
-        MediaControlWin32,
-    )
-
 
 logger: logging.Logger = logging.getLogger(__name__)
 
+# Seconds the typing must pause before the lyrics are searched
+LYRICS_SEARCH_DELAY = 0.15
+
+
+class DaemonEvent(Message):
+    """Posted from the thread of the daemon client for each event of the player."""
+
+    def __init__(self, event: Event) -> None:
+        super().__init__()
+        self.event: Event = event
+
+
+class LyricsReady(Message):
+    """Posted from the thread of the daemon client once a lookup is done."""
+
+    def __init__(self, video_id: str, found: bool) -> None:  # noqa: FBT001
+        super().__init__()
+        self.video_id: str = video_id
+        self.found: bool = found
+
+
+class LyricsBackfillProgress(Message):
+    """Posted from the thread of the daemon client at each backfill lookup done."""
+
+    def __init__(self, done: int, total: int) -> None:
+        super().__init__()
+        self.done: int = done
+        self.total: int = total
+
 
 class PyMusicTerm(App):
     BINDINGS: ClassVar[list[Binding | tuple[str, str] | tuple[str, str, str]]] = [
@@ -67,32 +107,36 @@ class PyMusicTerm(App):
         ("mute_volume", "mute", "Mute"),
         ("m", "mute", "Mute"),
         ("ctrl+delete", "delete", "Delete the selected song"),
+        ("b", "backfill_lyrics", "Fetch missing lyrics"),
+        ("p", "like", "Add to the Liked playlist"),
+        ("f2", "toggle_hud", "Performance HUD"),
+        ("f3", "profile", "Profile the app"),
     ]
 
-    def __init__(self, setting: SettingManager) -> None:
+    def __init__(
+        self,
+        setting: SettingManager,
+        client: PlayerClient,
+        profile_seconds: float | None = None,
+    ) -> None:
         super().__init__(css_path="pymusicterm.tcss", watch_css=True)
         self.setting: SettingManager = setting
         rename_console("PyMusicTerm")
+        self.profiler = SamplingProfiler(self.setting.log_dir)
+        self.profile_on_start: float | None = profile_seconds
 
         self.timer: Widget | None = None
-
-        if self.setting.os == "win32":
-            from player.media_control import MediaControlWin32 as MediaControl  # noqa: I001, PLC0415
-        else:
-            from player.media_control import MediaControlMPRIS as MediaControl  # noqa: I001, PLC0415
-        requests_cache.install_cache(
-            f"{self.setting.cache_dir}/cache",
-            expire_after=timedelta(hours=1),
-        )
-
-        self.media_control: MediaControlMPRIS | MediaControlWin32 = MediaControl()
-        self.downloader = Downloader(self.setting.music_dir, self.progress_callback)
-        self.player = PyMusicTermPlayer(
-            self.setting,
-            self.media_control,
-            self.downloader,
-        )
-        self.media_control.init(self.player)
+        self.current_lyrics_index: int = -1
+        # What the UI showed at the last exit, the daemon keeps the rest
+        self.warm_start: Snapshot | None = load_snapshot(self.setting.app_dir)
+        self.restore_visible_ids: list[str] = []
+        # State of this exit, saved once the app has stopped
+        self.snapshot: Snapshot | None = None
+
+        self.lyrics_index = LyricsIndex(self.setting.lyrics_dir)
+        self.lyrics_hits: list[LyricsHit] = []
+        # The daemon plays, downloads and looks the lyrics up, the app shows them
+        self.player = RemotePlayer(client, self.warm_start)
 
     def compose(self) -> ComposeResult:
         with TabbedContent(classes="search_tabs", id="tabbed_content"):
@@ -121,8 +165,15 @@ class PyMusicTerm(App):
                     yield ListView(id="playlist_results")
             with TabPane("Lyrics", id="lyrics"):  # noqa: SIM117
                 with Vertical():
-                    yield Input(placeholder="Search for a song", id="lyrics_input")
+                    yield Input(placeholder="Search in the lyrics", id="lyrics_input")
+                    yield ProgressBar(
+                        100,
+                        id="lyrics_backfill_progress",
+                        show_eta=False,
+                        show_percentage=True,
+                    )
                     yield ListView(id="lyrics_viewer")
+                    yield ListView(id="lyrics_search_results")
         yield Rule()
         with Vertical(classes="info_controls"):
             with Center():
@@ -157,6 +208,187 @@ class PyMusicTerm(App):
         with Horizontal(classes="player_controls"):
             yield Button("Shuffle", id="shuffle")
             yield Button("Loop", id="loop")
+        yield PerfHUD(id="perf_hud")
+
+    def on_mount(self) -> None:
+        self.player.add_listener(self._forward_event)
+        self.check_library(self.player.state)
+        self.show_shuffle()
+        self.show_loop()
+        self.warm_up()
+        self.index_lyrics()
+        self.call_after_refresh(self.show_current_song)
+        if self.warm_start is not None:
+            self.call_after_refresh(self.restore_snapshot)
+        if self.profile_on_start:
+            self.start_profiler(self.profile_on_start)
+        if hasattr(signal, "SIGUSR1"):
+            # `kill -USR1 <pid>` profiles an app that is already running
+            asyncio.get_running_loop().add_signal_handler(
+                signal.SIGUSR1,
+                self.action_profile,
+            )
+
+    def action_profile(self) -> None:
+        """Profile the app for a few seconds, without pausing it."""
+        self.start_profiler(self.setting.profile_seconds)
+
+    def start_profiler(self, seconds: float) -> None:
+        if not self.profiler.start(
+            seconds,
+            lambda path: self.call_from_thread(
+                self.notify,
+                f"Profile written to {path}",
+                timeout=5,
+            ),
+        ):
+            self.notify("A profile is already being recorded", timeout=2)
+            return
+        self.notify(f"Profiling for {seconds:g} seconds", timeout=2)
+
+    async def restore_snapshot(self) -> None:
+        """Show the search results and the tab of the last exit."""
+        snapshot: Snapshot = self.warm_start
+        if self.player.dict_of_song_result:
+            await self.update_search_results(
+                list(self.player.dict_of_song_result.values()),
+            )
+        if snapshot.active_tab == "playlist":
+            self.restore_visible_ids = snapshot.visible_ids
+        tab: TabbedContent = self.query_one("#tabbed_content")
+        if snapshot.active_tab in ("search", "playlist", "lyrics"):
+            tab.active = snapshot.active_tab
+
+    async def show_current_song(self) -> None:
+        """Show the song of the daemon, playing or not, along with its lyrics."""
+        song: SongData | None = self.player.current_song
+        if song is not None:
+            self.query_one("#label_current_song_title").update(song.title)
+            self.query_one("#label_current_song_artist").update(
+                song.get_formatted_artists(),
+            )
+        self.query_one("#label_current_song_position").update(
+            format_time(self.player.position),
+        )
+        self.query_one("#label_song_length").update(
+            format_time(self.player.song_length),
+        )
+        try:
+            percentage: float = self.player.position / self.player.song_length
+        except ZeroDivisionError:
+            percentage = 0
+        self.query_one("#player_status").update(progress=percentage * 100)
+        await self.update_lyrics_view()
+        await self.toggle_button()
+
+    def _forward_event(self, event: Event) -> None:
+        """Hand an event of the daemon to the app, from the thread of the client."""
+        if event.event == "lyrics":
+            video_id, found = event.data
+            self._index_new_lyrics(video_id, found)
+            self.post_message(LyricsReady(video_id, found))
+        elif event.event == "lyrics_backfill":
+            self.post_message(LyricsBackfillProgress(*event.data))
+        else:
+            self.post_message(DaemonEvent(event))
+
+    @on(DaemonEvent)
+    async def on_daemon_event(self, message: DaemonEvent) -> None:
+        """Follow the player, whichever client of the daemon changed it."""
+        event: Event = message.event
+        self.check_library(event.state)
+        match event.event:
+            case "track":
+                await self.show_current_song()
+            case "shuffle":
+                self.show_shuffle()
+            case "loop":
+                self.show_loop()
+            case "download":
+                self.progress_callback(*event.data)
+
+    def check_library(self, state: PlayerState) -> None:
+        if state.library_version != self.player.library_version:
+            self.reload_library()
+
+    @work(thread=True, exclusive=True, group="library")
+    def reload_library(self) -> None:
+        """Fetch the library again, after the daemon changed it."""
+        worker: Worker = get_current_worker()
+        library: Library = self.player.fetch_library()
+        if not worker.is_cancelled:
+            self.call_from_thread(self.apply_library, library)
+
+    async def apply_library(self, library: Library) -> None:
+        removed_ids: set[str] = self.player.set_library(library)
+        playlist_results: ListView = self.query_one("#playlist_results")
+        await playlist_results.remove_children(
+            [
+                child
+                for child in playlist_results.children
+                if child.id.removeprefix("id-") in removed_ids
+            ],
+        )
+        tab: TabbedContent = self.query_one("#tabbed_content")
+        if tab.active == "playlist":
+            await self.redraw_playlist()
+
+    def capture_snapshot(self) -> Snapshot:
+        """Snapshot what the UI shows, for the next start."""
+        tab: TabbedContent = self.query_one("#tabbed_content")
+        visible_ids: list[str] = []
+        if tab.active in ("search", "playlist"):
+            listview: ListView = self.query_one(f"#{tab.active}_results")
+            visible_ids = [
+                child.id.removeprefix("id-")
+                for child in listview.children
+                if child.region.overlaps(listview.region)
+            ]
+        # The daemon saves the library and the position in the same file
+        snapshot: Snapshot = load_snapshot(self.setting.app_dir) or Snapshot()
+        snapshot.search_results = [
+            to_entry(song) for song in self.player.dict_of_song_result.values()
+        ]
+        snapshot.active_tab = tab.active
+        snapshot.visible_ids = visible_ids
+        return snapshot
+
+    async def action_quit(self) -> None:
+        """Quit the app, keeping a snapshot of its state for the next start."""
+        try:
+            self.snapshot = self.capture_snapshot()
+        except Exception:
+            logger.exception("Failed to snapshot the app")
+        await super().action_quit()
+
+    @work(thread=True, exclusive=True, group="warm_up")
+    def warm_up(self) -> None:
+        """Wait for the daemon to reach YouTube Music, after the first frame."""
+        if not self.player.online():
+            self.call_from_thread(self.show_offline)
+
+    def show_offline(self) -> None:
+        search_input: Input = self.query_one("#search_input")
+        if self.setting.offline:
+            search_input.placeholder = "Offline, only the playlist is available"
+            search_input.disabled = True
+        else:
+            # Each search tries to reach YouTube Music again
+            search_input.placeholder = "YouTube Music can't be reached, search to retry"
+
+    def show_online(self) -> None:
+        search_input: Input = self.query_one("#search_input")
+        search_input.placeholder = "Search for a song"
+
+    @work(thread=True, exclusive=True, group="lyrics_index")
+    def index_lyrics(self) -> None:
+        """Load the lyrics index and bring it up to date with lyrics_dir."""
+        self.lyrics_index.load()
+        self.lyrics_index.refresh()
+
+    def _index_new_lyrics(self, video_id: str, found: bool) -> None:  # noqa: FBT001
+        if found:
+            self.lyrics_index.add(video_id)
 
     @on(TabbedContent.TabActivated)
     async def action_select_playlist_tab(
@@ -171,15 +403,38 @@ class PyMusicTerm(App):
 
     async def redraw_playlist(self) -> None:
         playlist_results: ListView = self.query_one("#playlist_results")
-        children_id: list[str] = [
+        children_id: set[str] = {
             child.id.removeprefix("id-") for child in playlist_results.children
+        }
+        songs: list[SongData] = [
+            song
+            for song in self.player.list_of_downloaded_songs
+            if song.video_id not in children_id
         ]
-        for song in self.player.list_of_downloaded_songs:
-            if song.video_id not in children_id:
-                await playlist_results.append(await self._create_song_item(song))
+        visible: set[str] = set(self.restore_visible_ids)
+        self.restore_visible_ids = []
+        first_visible: int | None = next(
+            (i for i, song in enumerate(songs) if song.video_id in visible),
+            None,
+        )
+        await playlist_results.extend(
+            [await self._create_song_item(song) for song in songs],
+        )
+        if first_visible is not None and not children_id:
+            # Scroll back to the rows that were on screen at the last exit
+            playlist_results.scroll_to_widget(
+                playlist_results.children[first_visible],
+                animate=False,
+                top=True,
+            )
 
     async def update_time(self) -> None:
-        """Update the time label of the player, and update the player."""
+        """Update the time label of the player."""
+        tick_start: float = time.perf_counter()
+        if not self.player.client.connected:
+            self.exit(return_code=1, message="The player daemon has stopped")
+            return
+        song: SongData | None = self.player.current_song
         button: Button = self.query_one("#play_pause")
         if self.player.playing:
             button.label = "⏸"
@@ -187,10 +442,10 @@ class PyMusicTerm(App):
             button.label = "▶"
 
         playlist_results: ListView = self.query_one("#playlist_results")
-        if self.player.playing:
+        if self.player.playing and song is not None:
             for i, item in enumerate(playlist_results.children):
                 id_: str = item.id.removeprefix("id-")
-                if id_ == self.player.current_song.video_id:
+                if id_ == song.video_id:
                     playlist_results.index = i
 
         progress_bar: ProgressBar = self.query_one("#player_status")
@@ -202,23 +457,15 @@ class PyMusicTerm(App):
         current_float: float = self.player.position
         label_current_song_position.update(format_time(current_float))
         label_song_length.update(format_time(length_float))
-        if self.player.playing:
+        if self.player.playing and song is not None:
             label_current_song_title: Label = self.query_one(
                 "#label_current_song_title",
             )
             label_current_song_artist: Label = self.query_one(
                 "#label_current_song_artist",
             )
-            label_current_song_title.update(
-                self.player.list_of_downloaded_songs[
-                    self.player.current_song_index
-                ].title,
-            )
-            label_current_song_artist.update(
-                self.player.list_of_downloaded_songs[
-                    self.player.current_song_index
-                ].get_formatted_artists(),
-            )
+            label_current_song_title.update(song.title)
+            label_current_song_artist.update(song.get_formatted_artists())
         try:
             percentage: float = current_float / length_float
         except ZeroDivisionError:
@@ -226,24 +473,22 @@ class PyMusicTerm(App):
         progress_bar.update(
             progress=percentage * 100,
         )
-        if self.player.check_if_song_ended():
-            await self.action_next()
 
         if self.player.lyrics_data:
-            i = 0
-            current_index = 0
-            listview: ListView = self.query_one("#lyrics_viewer")
-            for time, lyrics in self.player.lyrics_data:
-                if time > current_float:
-                    current_index: int = i - 1 if i > 1 else 0
-                    break
-                i += 1
-
-            for idx, item in enumerate(listview.children):
-                if idx == current_index:
-                    item.add_class("current_lyrics")
-                else:
-                    item.remove_class("current_lyrics")
+            current_index: int = self.player.lyrics_data.index_at(current_float)
+            if current_index != self.current_lyrics_index:
+                listview: ListView = self.query_one("#lyrics_viewer")
+                items: list[Widget] = list(listview.children)
+                if 0 <= self.current_lyrics_index < len(items):
+                    items[self.current_lyrics_index].remove_class("current_lyrics")
+                if current_index < len(items):
+                    items[current_index].add_class("current_lyrics")
+                self.current_lyrics_index = current_index
+        metrics.set("ui.tick_ms", (time.perf_counter() - tick_start) * 1000)
+
+    async def action_toggle_hud(self) -> None:
+        """Show or hide the performance HUD."""
+        self.query_one(PerfHUD).toggle()
 
     async def action_return_on_search_tab(self) -> None:
         """Set the search tab as the active tab."""
@@ -265,7 +510,6 @@ class PyMusicTerm(App):
         """Select a song from the playlist results and play it."""
         id_: str = event.item.id.removeprefix("id-")
         await self.play_from_id(id_)
-        await self.update_lyrics_view()
 
     async def play_from_id(self, ids: str) -> None:
         for i, song in enumerate(self.player.list_of_downloaded_songs):
@@ -296,23 +540,20 @@ class PyMusicTerm(App):
 
     async def download_and_update(self) -> None:
         await self.toggle_button()
-        await self.update_lyrics_view()
         search_results: ListView = self.query_one("#search_results")
         search_results.disabled = False
         progress_bar: ProgressBar = self.query_one("#progress_bar")
         progress_bar.visible = False
 
-    async def load_lyric(self, listview: ListView, path: Path) -> None:
+    async def load_lyric(self, listview: ListView, video_id: str) -> None:
         await listview.clear()
-        with path.open() as f:
-            result: list[tuple[int, str]] = parse_lyrics(f.read())
-            i = 0
-            for _, lyric in result:
-                await listview.append(
-                    ListItem(Label(lyric, shrink=True), id=f"id-lyrics-{i}"),
-                )
-                i += 1  # noqa: SIM113
-            self.player.lyrics_data = result
+        lyrics: Lyrics = load_lyrics(video_id)
+        await listview.extend(
+            ListItem(Label(line, shrink=True), id=f"id-lyrics-{i}")
+            for i, line in enumerate(lyrics.lines)
+        )
+        self.player.lyrics_data = lyrics
+        self.current_lyrics_index = -1
 
     @on(ListView.Selected, "#lyrics_viewer")
     async def select_lyrics_viewer(self, event: ListView.Selected) -> None:
@@ -325,22 +566,89 @@ class PyMusicTerm(App):
         if not self.player.current_song:
             await listview.clear()
             return
-        path: Path = (
-            Path(self.setting.lyrics_dir) / f"{self.player.current_song.video_id}.lrc"
-        )
-        if path.exists():
-            await self.load_lyric(listview, path)
+        if has_lyrics(self.player.current_song.video_id):
+            await self.load_lyric(listview, self.player.current_song.video_id)
         else:
-            song: SongData | None = self.player.current_song
-            download_lyrics(
-                song.video_id,
-                track=song.title,
-                album=song.album,
-                artist=song.artist[0] if song.artist else "Unknown Artist",
-                duration=string_to_seconds(song.duration),
+            await listview.clear()
+            self.player.lyrics_data = None
+            self.player.request_lyrics(self.player.current_song.video_id)
+
+    @on(LyricsReady)
+    async def on_lyrics_ready(self, message: LyricsReady) -> None:
+        """Show the lyrics that just arrived if they belong to the current song."""
+        song: SongData | None = self.player.current_song
+        if message.found and song is not None and song.video_id == message.video_id:
+            await self.update_lyrics_view()
+
+    @on(Input.Changed, "#lyrics_input")
+    def search_lyrics(self) -> None:
+        """Search the phrase typed in every downloaded lyrics."""
+        lyrics_input: Input = self.query_one("#lyrics_input")
+        self.search_lyrics_thread(lyrics_input.value)
+
+    @work(thread=True, exclusive=True, group="lyrics_search")
+    def search_lyrics_thread(self, phrase: str) -> None:
+        worker: Worker = get_current_worker()
+        # Wait for the typing to pause, each keystroke cancels this worker
+        time.sleep(LYRICS_SEARCH_DELAY)
+        if worker.is_cancelled:
+            return
+        hits: list[LyricsHit] = self.lyrics_index.search(phrase)
+        if not worker.is_cancelled:
+            self.call_from_thread(self.show_lyrics_hits, phrase, hits)
+
+    async def show_lyrics_hits(self, phrase: str, hits: list[LyricsHit]) -> None:
+        lyrics_viewer: ListView = self.query_one("#lyrics_viewer")
+        search_results: ListView = self.query_one("#lyrics_search_results")
+        await search_results.clear()
+        songs: dict[str, SongData] = {
+            song.video_id: song for song in self.player.list_of_downloaded_songs
+        }
+        self.lyrics_hits = [hit for hit in hits if hit.video_id in songs]
+        searching: bool = phrase.strip() != ""
+        lyrics_viewer.display = not searching
+        search_results.display = searching
+        await search_results.extend(
+            ListItem(
+                Label(
+                    f"{format_time(hit.time_ms / 1000)}  {hit.line}  "
+                    f"({songs[hit.video_id].title} - "
+                    f"{songs[hit.video_id].get_formatted_artists()})",
+                    markup=False,
+                    shrink=True,
+                ),
+                id=f"id-hit-{i}",
             )
-            if path.exists():
-                await self.load_lyric(listview, path)
+            for i, hit in enumerate(self.lyrics_hits)
+        )
+
+    @on(ListView.Selected, "#lyrics_search_results")
+    async def select_lyrics_search_result(self, event: ListView.Selected) -> None:
+        """Play the song of the selected line, starting at that line."""
+        hit: LyricsHit = self.lyrics_hits[int(event.item.id.removeprefix("id-hit-"))]
+        await self.play_from_id(hit.video_id)
+        self.player.seek_to(hit.time_ms / 1000)
+        lyrics_input: Input = self.query_one("#lyrics_input")
+        lyrics_input.value = ""
+
+    async def action_backfill_lyrics(self) -> None:
+        """Fetch the lyrics of every song of the library that has none."""
+        total: int = self.player.backfill_lyrics()
+        if total == 0:
+            self.notify("No lyrics to fetch", timeout=2)
+            return
+        progress_bar: ProgressBar = self.query_one("#lyrics_backfill_progress")
+        progress_bar.update(total=total, progress=0)
+        progress_bar.display = True
+        self.notify(f"Fetching lyrics for {total} songs", timeout=2)
+
+    @on(LyricsBackfillProgress)
+    def on_lyrics_backfill_progress(self, message: LyricsBackfillProgress) -> None:
+        progress_bar: ProgressBar = self.query_one("#lyrics_backfill_progress")
+        progress_bar.update(progress=message.done)
+        if message.done == message.total:
+            progress_bar.display = False
+            self.notify("Lyrics backfill finished", timeout=2)
 
     @on(Button.Pressed, "#play_pause")
     async def action_play(self) -> None:
@@ -371,7 +679,6 @@ class PyMusicTerm(App):
         await self.toggle_button()
         playlist_results: ListView = self.query_one("#playlist_results")
         playlist_results.index = self.player.previous()
-        await self.update_lyrics_view()
 
     @on(Button.Pressed, "#next")
     async def action_next(self) -> None:
@@ -379,26 +686,26 @@ class PyMusicTerm(App):
         await self.toggle_button()
         playlist_results: ListView = self.query_one("#playlist_results")
         playlist_results.index = self.player.next()
-        await self.update_lyrics_view()
 
     @on(Button.Pressed, "#shuffle")
     async def action_shuffle(self) -> None:
-        """Shuffle the list of downloaded songs."""
-        playlist_results: ListView = self.query_one("#playlist_results")
-        await playlist_results.clear()
-
+        """Shuffle the play queue, or put it back in order."""
         self.player.suffle()
-        await self.action_select_playlist_tab(None)
+        self.show_shuffle()
+
+    def show_shuffle(self) -> None:
+        shuffle_button: Button = self.query_one("#shuffle")
+        shuffle_button.variant = "success" if self.player.shuffled else "default"
 
     @on(Button.Pressed, "#loop")
     async def action_loop(self) -> None:
         """Toggle the loop button."""
+        self.player.loop_at_end()
+        self.show_loop()
+
+    def show_loop(self) -> None:
         loop_button: Button = self.query_one("#loop")
-        is_looping: bool = self.player.loop_at_end()
-        if is_looping:
-            loop_button.variant = "success"
-        else:
-            loop_button.variant = "default"
+        loop_button.variant = "success" if self.player.state.loop else "default"
 
     @on(Input.Changed, "#playlist_input")
     async def search_playlist(self) -> None:
@@ -431,7 +738,13 @@ class PyMusicTerm(App):
     def search_ytb_thread(self, query: str) -> None:
         worker: Worker = get_current_worker()
         filters: Select = self.query_one("#search_sort")
-        results: list[SongData] = self.player.query(query, filters.value)
+        try:
+            results: list[SongData] = self.player.query(query, filters.value)
+        except OfflineError:
+            self.call_from_thread(self.show_offline)
+            results = []
+        else:
+            self.call_from_thread(self.show_online)
         if not worker.is_cancelled:
             self.call_from_thread(self.update_search_results, results)
 
@@ -443,6 +756,9 @@ class PyMusicTerm(App):
         search_results.loading = False
 
     async def _create_song_item(self, song: SongData) -> ListItem:
+        if song.thumbnail is None:
+            # Restored from the snapshot, read it when it is first shown
+            song.thumbnail = load_thumbnail(self.setting.cover_dir, song.video_id)
         return ListItem(
             Horizontal(
                 WidgetImage(song.thumbnail, classes="image"),
@@ -473,6 +789,13 @@ class PyMusicTerm(App):
             classes="song_item",
         )
 
+    async def action_like(self) -> None:
+        """Add the current song to the Liked playlist."""
+        if self.player.current_song is None:
+            return
+        self.player.add_to_playlist(LIKED_PLAYLIST, self.player.current_song.video_id)
+        self.notify(f"Added to {LIKED_PLAYLIST}", timeout=1)
+
     async def action_seek_back(self) -> None:
         """Seek backward 10 seconds."""
         self.player.seek(-10)
@@ -485,28 +808,23 @@ class PyMusicTerm(App):
         """Increase the volume."""
         self.player.volume(volume)
         self.notify(
-            f"Volume changed to {self.player.music_player.volume:.2f}",
+            f"Volume changed to {self.player.volume_level:.2f}",
             timeout=0.2,
         )
 
     async def action_mute(self) -> None:
         """Mute the player."""
-        if self.player.music_player.volume == 0:
-            self.player.volume(self.setting.volume)
-            self.notify("Unmuted", timeout=0.2)
-        else:
-            self.player.music_player.volume = 0
+        if self.player.toggle_mute():
             self.notify("Muted", timeout=0.2)
+        else:
+            self.notify("Unmuted", timeout=0.2)
 
     async def action_delete(self) -> None:
         """Delete the selected song."""
         if self.player.current_song:
             logger.info("Deleting song at index %s", self.player.current_song_index)
+            # Its row goes once the daemon reports the new library
             self.player.delete_song(self.player.current_song_index)
-            playlist_results: ListView = self.query_one("#playlist_results")
-            await playlist_results.clear()
-            await self.redraw_playlist()
-            await self.update_lyrics_view()
 
     def handle_exception(self, error: Exception) -> None:
         """Handle exceptions to prevent them from being displayed in UI."""
@@ -528,22 +846,62 @@ class PyMusicTerm(App):
         self.handle_exception(error)
 
 
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(prog="pymusicterm")
+    parser.add_argument(
+        "--profile",
+        type=float,
+        metavar="SECONDS",
+        help="record a sampling profile of the first SECONDS in the log folder",
+    )
+    parser.add_argument(
+        "--daemon",
+        action="store_true",
+        help="run the player headless, the app and src/ctl.py drive it over a socket",
+    )
+    parser.add_argument(
+        "--until-idle",
+        action="store_true",
+        help="with --daemon, stop once the last client has disconnected",
+    )
+    parser.add_argument(
+        "--session",
+        metavar="ID",
+        help="run as the browser session ID, with settings of its own",
+    )
+    return parser.parse_args()
+
+
 async def main() -> None:
-    setting = SettingManager()
-    app = PyMusicTerm(setting)
+    args: argparse.Namespace = parse_args()
+    setting = SettingManager(session=args.session)
+    if args.daemon:
+        from daemon.daemon import DaemonError, PlayerDaemon  # noqa: PLC0415
+
+        try:
+            daemon = PlayerDaemon(setting, until_idle=args.until_idle)
+        except DaemonError as e:
+            sys.exit(str(e))
+        await daemon.serve()
+        return
+    # The app is a client of the daemon, started here unless one is running
     try:
-        task: asyncio.Task[None] = asyncio.create_task(
-            rich_presence(app.player, start=time.time()),
-        )
-    except Exception as e:
-        logger.warning(f"Rich Presence failed: {e}")
+        client: PlayerClient = connect(setting.app_dir)
+    except OSError as e:
+        sys.exit(f"Could not reach the player daemon: {e}")
+    app = PyMusicTerm(setting, client, profile_seconds=args.profile)
     try:
         await app.run_async()
     finally:
-        app.media_control.stop()
-        task.cancel()
-        with contextlib.suppress(asyncio.CancelledError):
-            await task
+        # Sessions start from the snapshot of the terminal app, and leave it
+        if not setting.session and app.snapshot is not None:
+            save_snapshot(setting.app_dir, app.snapshot)
+        try:
+            app.lyrics_index.save()
+        except OSError:
+            logger.exception("Failed to save the lyrics index")
+        setting.flush()
+        app.player.close()
 
 
 if __name__ == "__main__":
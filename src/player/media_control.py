@@ -1,23 +1,27 @@
 import logging
 from typing import Protocol
 
-from api.protocols import PyMusicTermPlayer
-from setting import SettingManager
+from api.protocols import Dispatch, PyMusicTermPlayer
+from setting import get_platform
 
 logger: logging.Logger = logging.getLogger(__name__)
 
-setting = SettingManager()
-if setting.os == "win32":
+if get_platform() == "win32":
     from api.smtc.smtc import MediaControlWin32 as MediaControlWin
 else:
     from api.mpris.mpris import DBusAdapter
 
 
 class MediaControl(Protocol):
-    def init(self) -> None: ...
+    def init(
+        self,
+        player: PyMusicTermPlayer,
+        dispatch: Dispatch | None = None,
+    ) -> None: ...
     def on_playback(self) -> None: ...
     def on_playpause(self) -> None: ...
     def on_volume(self) -> None: ...
+    def on_seek(self) -> None: ...
     def populate_playlist(self) -> None: ...
     def set_current_song(self, index: int) -> None: ...
     def stop() -> None: ...
@@ -28,14 +32,18 @@ class Server(Protocol):
     player: str
 
 
-if setting.os == "win32":
+if get_platform() == "win32":
 
     class MediaControlWin32(MediaControlWin, MediaControl):
-        def __init__(self) -> None:
-            super().__init__()
+        def __init__(self, cover_dir: str) -> None:
+            super().__init__(cover_dir)
 
-        def init(self, player: PyMusicTermPlayer) -> None:
-            return super().init(player)
+        def init(
+            self,
+            player: PyMusicTermPlayer,
+            dispatch: Dispatch | None = None,
+        ) -> None:
+            return super().init(player, dispatch)
 
         def on_playback(self) -> None:
             return super().on_playback()
@@ -46,6 +54,9 @@ if setting.os == "win32":
         def on_volume(self) -> None:
             return super().on_volume()
 
+        def on_seek(self) -> None:
+            return super().on_seek()
+
         def populate_playlist(self) -> None:
             return super().populate_playlist()
 
@@ -60,14 +71,23 @@ else:
     class MediaControlMPRIS:
         """Drop-in replacement for mpris_server based implementation"""
 
-        def __init__(self) -> None:
-            self.adapter: DBusAdapter = DBusAdapter()
+        def __init__(self, cover_dir: str) -> None:
+            self.adapter: DBusAdapter = DBusAdapter(cover_dir)
             logger.info("MediaControlMPRIS initialized")
 
-        def init(self, player: PyMusicTermPlayer) -> None:
-            """Initialize with player and start background loop"""
+        def init(
+            self,
+            player: PyMusicTermPlayer,
+            dispatch: Dispatch | None = None,
+        ) -> None:
+            """
+            Initialize with player and start background loop.
+
+            dispatch runs the commands of D-Bus clients on the thread that
+            drives the player, they run on a thread of the adapter without it.
+            """
             logger.info("Initializing MediaControlMPRIS with player")
-            self.adapter.setup(player)
+            self.adapter.setup(player, dispatch)
             self.adapter.start_background()
 
         def on_playback(self) -> None:
@@ -82,11 +102,16 @@ else:
             """Handle volume events"""
             return self.adapter.on_volume()
 
+        def on_seek(self) -> None:
+            """Handle seek events"""
+            return self.adapter.on_seek()
+
         def populate_playlist(self) -> None:
-            """Populate playlist (no-op for MPRIS)"""
+            """Publish the new order of the track list"""
+            return self.adapter.schedule_update()
 
         def set_current_song(self, _: int) -> None:
             """Set current song (no-op for MPRIS)"""
 
         def stop(self) -> None:
-            pass
+            self.adapter.stop()
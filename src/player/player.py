@@ -1,19 +1,29 @@
 import logging
+import threading
+import time
+from collections.abc import Callable
+from concurrent.futures import Future
 from pathlib import Path
-from random import shuffle
-
-import music_tag
 
 from api.downloader import Downloader
+from api.lyrics import Lyrics
 from api.music_player import MusicPlayer
+from api.prefetch import Prefetcher
 from api.protocols import SongData
-from api.ytmusic import YTMusic
+from api.ytmusic import OfflineError, YTMusic, is_online
 from player.media_control import MediaControl
+from player.queue import PlayQueue, load_queue, save_queue
+from player.snapshot import Snapshot, to_song
 from player.util import format_time
 from setting import SettingManager, fetch_files_from_folder
 
 logger: logging.Logger = logging.getLogger(__name__)
 
+# Seconds before YouTube Music is tried again after failing to reach it,
+# doubled at each failure
+WARM_UP_RETRY_MIN = 5
+WARM_UP_RETRY_MAX = 300
+
 
 class PyMusicTermPlayer:
     def __init__(
@@ -21,36 +31,205 @@ class PyMusicTermPlayer:
         setting: SettingManager,
         media_control: MediaControl,
         downloader: Downloader,
+        prefetcher: Prefetcher | None = None,
+        snapshot: Snapshot | None = None,
     ) -> None:
         self.media_control: MediaControl = media_control
+        self.prefetcher: Prefetcher | None = prefetcher
         self.setting: SettingManager = setting
         self.music_player = MusicPlayer(self.setting.volume)
-        self.ytm = YTMusic()
+        # Resolved with the YTMusic client by warm_up, or None when offline
+        self.ytm_ready: Future[YTMusic | None] = Future()
+        self._warm_up_lock = threading.Lock()
+        self._warm_up_retry_at = 0.0
+        self._warm_up_delay: float = WARM_UP_RETRY_MIN
         self.downloader: Downloader = downloader
-        self.list_of_downloaded_songs: list[SongData] = self.get_downloaded_songs()
         self.dict_of_song_result: dict[str, SongData] = {}
         self.current_song_index = 0
         self.current_song: SongData | None = None
-        self.lyrics_data: list[tuple[int, str]] | None = None
+        if snapshot is not None and snapshot.songs:
+            # Reconciled with the music folder later by update_library
+            self.list_of_downloaded_songs: list[SongData] = [
+                to_song(entry) for entry in snapshot.songs
+            ]
+            for entry in snapshot.search_results:
+                self.dict_of_song_result[entry.video_id] = to_song(entry)
+            if 0 <= snapshot.current_index < len(self.list_of_downloaded_songs):
+                self.current_song_index = snapshot.current_index
+                self.current_song = self.list_of_downloaded_songs[
+                    self.current_song_index
+                ]
+        else:
+            self.list_of_downloaded_songs = self.get_downloaded_songs()
+        # The playback order, the library keeps the order it is shown in
+        self.queue: PlayQueue = load_queue(
+            self.setting.playlist_dir,
+            self.list_of_downloaded_songs,
+        )
+        if self.current_song is not None:
+            self.queue.jump(self.current_song_index, remember=False)
+        self.lyrics_data: Lyrics | None = None
+        self._listeners: list[Callable[[str], None]] = []
+
+    def add_listener(self, listener: Callable[[str], None]) -> None:
+        """
+        Call listener after each change of the playback.
+
+        It gets "track", "playpause", "seek", "loop", "volume", "shuffle" or
+        "library" and runs on the thread that made the change, so it can read the player
+        state safely.
+        """
+        self._listeners.append(listener)
+
+    def _notify(self, event: str) -> None:
+        for listener in self._listeners:
+            try:
+                listener(event)
+            except Exception:
+                logger.exception("Player listener failed")
+
+    def warm_up(self) -> None:
+        """
+        Create the YTMusic client, meant to run in the background at startup.
+
+        Remote initialisation is skipped entirely in offline mode. When
+        YouTube Music can't be reached, ytm_ready holds an OfflineError until
+        the next call past a backoff tries again.
+        """
+        with self._warm_up_lock:
+            if self.ytm_ready.done():
+                if (
+                    self.ytm_ready.exception() is None
+                    or time.monotonic() < self._warm_up_retry_at
+                ):
+                    return
+                self.ytm_ready = Future()
+            if self.setting.offline:
+                logger.info("Offline mode, searching YouTube Music is disabled")
+                self.ytm_ready.set_result(None)
+                return
+            client: YTMusic | None = None
+            if is_online():
+                try:
+                    client = YTMusic()
+                except Exception:
+                    logger.exception("Failed to create the YTMusic client")
+            if client is None:
+                logger.info(
+                    "YouTube Music can't be reached, next try in %.0f s",
+                    self._warm_up_delay,
+                )
+                self.ytm_ready.set_exception(
+                    OfflineError("YouTube Music can't be reached"),
+                )
+                self._warm_up_retry_at = time.monotonic() + self._warm_up_delay
+                self._warm_up_delay = min(self._warm_up_delay * 2, WARM_UP_RETRY_MAX)
+                return
+            self._warm_up_delay = WARM_UP_RETRY_MIN
+            self.ytm_ready.set_result(client)
+
+    @property
+    def ytm(self) -> YTMusic:
+        """
+        The YTMusic client, waiting for the warm-up if it is still running.
+
+        Raises:
+            OfflineError: If the app is offline, or YouTube Music can't be
+                reached for now
+
+        """
+        self.warm_up()
+        client: YTMusic | None = self.ytm_ready.result()
+        if client is None:
+            msg = "YouTube Music can't be reached"
+            raise OfflineError(msg)
+        return client
 
     def get_downloaded_songs(self) -> list[SongData]:
         songs: list[str | None] = fetch_files_from_folder(self.setting.music_dir, "mp3")
-        list_of_songs: list[SongData] = []
-        for song in songs:
-            song_metadata = music_tag.load_file(song)
-            artist = song_metadata["artist"]
-            list_of_songs.append(
-                SongData(
-                    title=str(song_metadata["title"]),
-                    artist=artist.values,
-                    duration=format_time(float(str(song_metadata["#length"]))),
-                    video_id=Path(song).stem,
-                    thumbnail=song_metadata["artwork"].first.thumbnail([128, 128]),
-                    album=str(song_metadata["album"]),
-                    path=Path(song),
-                ),
+        return [self.read_song(song) for song in songs]
+
+    @staticmethod
+    def read_song(song: str) -> SongData:
+        """Read a downloaded song from its tags."""
+        import music_tag  # noqa: PLC0415
+
+        song_metadata = music_tag.load_file(song)
+        artist = song_metadata["artist"]
+        # None for the songs downloaded without a thumbnail
+        artwork = song_metadata["artwork"].first
+        return SongData(
+            title=str(song_metadata["title"]),
+            artist=artist.values,
+            duration=format_time(float(str(song_metadata["#length"]))),
+            video_id=Path(song).stem,
+            thumbnail=artwork.thumbnail([128, 128]) if artwork is not None else None,
+            album=str(song_metadata["album"]),
+            path=Path(song),
+        )
+
+    def scan_library(self) -> tuple[list[SongData], set[str]]:
+        """
+        Compare the library with the music folder, safe to call from a worker.
+
+        Returns:
+            tuple[list[SongData], set[str]]: The songs not in the library yet
+                and the paths of the songs whose file is gone
+
+        """
+        files: list[str] = fetch_files_from_folder(self.setting.music_dir, "mp3")
+        known: set[str] = {str(song.path) for song in list(self.list_of_downloaded_songs)}
+        added: list[SongData] = []
+        for file in files:
+            if file in known:
+                continue
+            try:
+                added.append(self.read_song(file))
+            except Exception:
+                logger.exception("Failed to read %s", file)
+        return added, known.difference(files)
+
+    def update_library(self, added: list[SongData], removed: set[str]) -> None:
+        """Apply the differences found by scan_library."""
+        if not added and not removed:
+            return
+        new_index: list[int | None] = []
+        kept: list[SongData] = []
+        for song in self.list_of_downloaded_songs:
+            if str(song.path) in removed:
+                new_index.append(None)
+            else:
+                new_index.append(len(kept))
+                kept.append(song)
+        self.list_of_downloaded_songs[:] = kept
+        self.list_of_downloaded_songs.extend(added)
+        self.queue.update(new_index, len(self.list_of_downloaded_songs))
+        if self.current_song in self.list_of_downloaded_songs:
+            self.current_song_index = self.list_of_downloaded_songs.index(
+                self.current_song,
             )
-        return list_of_songs
+        else:
+            self.current_song_index = 0
+        self.media_control.populate_playlist()
+        self._notify("library")
+        logger.info("Library updated: %d added, %d removed", len(added), len(removed))
+
+    def cue(self, position: float) -> None:
+        """Load the current song paused at a position, as restored from a snapshot."""
+        if self.current_song is None or self.current_song.path is None:
+            return
+        self.downloader.set_loaded(self.current_song.path)
+        self.music_player.cue_song(self.current_song.path, position)
+        self.media_control.set_current_song(self.current_song_index)
+        self.media_control.on_playback()
+        self._notify("track")
+
+    def persist_queue(self) -> None:
+        """Save the play queue in playlist_dir."""
+        save_queue(
+            self.setting.playlist_dir,
+            self.queue.state(self.list_of_downloaded_songs),
+        )
 
     def query(self, query: str, filter: str) -> list[SongData]:  # noqa: A002
         result: list[SongData] = self.ytm.search(query, filter)
@@ -58,68 +237,78 @@ class PyMusicTermPlayer:
         self.dict_of_song_result.clear()
         for song in result:
             self.dict_of_song_result[song.video_id] = song
+        if self.prefetcher is not None:
+            self.prefetcher.predict_search(result)
         return result
 
+    def prefetch_next(self) -> None:
+        """Prefetch the songs following the current one in the playback order."""
+        if self.prefetcher is None or not self.list_of_downloaded_songs:
+            return
+        self.prefetcher.predict_next(
+            self.list_of_downloaded_songs[index]
+            for index in self.queue.upcoming(self.prefetcher.next_k)
+        )
+
     def play_from_ytb(self, video_id: str) -> None:
         """
         Play a song from the YTMusic API, it will download the song first then play it.
         """
-        song: SongData = self.dict_of_song_result[video_id]
-        path: str | None = self.downloader.download(song)
-        if path is None:
-            return
-        # BUG: dont re-fetch the songs but add it to the list
-        self.list_of_downloaded_songs = self.get_downloaded_songs()
-        self.current_song = self.list_of_downloaded_songs[
-            len(self.list_of_downloaded_songs) - 1
-        ]
-        self.current_song_index: int = len(self.list_of_downloaded_songs) - 1
-        self.media_control.populate_playlist()
-        self.music_player.load_song(str(path))
-        self.music_player.play_song()
-        self.media_control.set_current_song(self.current_song_index)
-        self.media_control.on_playback()
+        path: str | None = self.download_result(video_id)
+        if path is not None:
+            self.play_downloaded(path)
+
+    def download_result(self, video_id: str) -> str | None:
+        """Download a search result, without touching the library nor the playback."""
+        return self.downloader.download(self.dict_of_song_result[video_id])
+
+    def play_downloaded(self, path: str) -> None:
+        """Play a downloaded song, adding it to the library if it is new."""
+        index: int | None = next(
+            (
+                i
+                for i, known in enumerate(self.list_of_downloaded_songs)
+                if str(known.path) == str(path)
+            ),
+            None,
+        )
+        if index is None:
+            count: int = len(self.list_of_downloaded_songs)
+            self.list_of_downloaded_songs.append(self.read_song(str(path)))
+            self.queue.update(list(range(count)), count + 1)
+            index = count
+            self.media_control.populate_playlist()
+            self._notify("library")
+        self.queue.jump(index)
+        self._play(index)
 
     def play_from_list(self, index: int) -> None:
+        self.queue.jump(index)
+        self._play(index)
+
+    def _play(self, index: int) -> None:
         self.current_song_index: int = index
         self.current_song = self.list_of_downloaded_songs[index]
-        self.music_player.load_song(self.list_of_downloaded_songs[index].path)
+        self.downloader.set_loaded(self.current_song.path)
+        self.music_player.load_song(self.current_song.path)
         self.music_player.play_song()
         self.media_control.set_current_song(self.current_song_index)
         self.media_control.on_playback()
+        self._notify("track")
+        self.prefetch_next()
 
     def previous(self) -> int:
-        """Play the previous song."""
+        """Play the song played before, or the previous one in the queue."""
         if not self.list_of_downloaded_songs:
             return 0
-        if self.current_song_index == 0:
-            self.current_song_index = len(self.list_of_downloaded_songs) - 1
-        else:
-            self.current_song_index -= 1
-        self.current_song = self.list_of_downloaded_songs[self.current_song_index]
-        self.music_player.load_song(
-            self.list_of_downloaded_songs[self.current_song_index].path,
-        )
-        self.music_player.play_song()
-        self.media_control.set_current_song(self.current_song_index)
-        self.media_control.on_playback()
+        self._play(self.queue.previous())
         return self.current_song_index
 
     def next(self) -> int:
-        """Play the next song."""
+        """Play the next song of the queue."""
         if not self.list_of_downloaded_songs:
             return 0
-        if self.current_song_index == len(self.list_of_downloaded_songs) - 1:
-            self.current_song_index = 0
-        else:
-            self.current_song_index += 1
-        self.current_song = self.list_of_downloaded_songs[self.current_song_index]
-        self.music_player.load_song(
-            self.list_of_downloaded_songs[self.current_song_index].path,
-        )
-        self.music_player.play_song()
-        self.media_control.set_current_song(self.current_song_index)
-        self.media_control.on_playback()
+        self._play(self.queue.next())
         return self.current_song_index
 
     def seek(self, seconds: float = 10) -> None:
@@ -128,32 +317,48 @@ class PyMusicTermPlayer:
             msg: str = f"Seconds must be an integer or a float, not {type(seconds)}"
             raise TypeError(msg)
         self.music_player.position += seconds
+        self.media_control.on_seek()
+        self._notify("seek")
 
     def seek_to(self, seconds: float) -> None:
         if not isinstance(seconds, int | float):
             msg: str = f"Seconds must be an integer or a float, not {type(seconds)}"
             raise TypeError(msg)
         self.music_player.position = seconds
+        self.media_control.on_seek()
+        self._notify("seek")
 
     def suffle(self) -> None:
-        """Shuffle the list of downloaded songs."""
-        shuffle(self.list_of_downloaded_songs)
-        if self.current_song is not None:
-            self.current_song_index = self.list_of_downloaded_songs.index(
-                self.current_song,
-            )
+        """Shuffle the play queue, or put it back in order, the library is untouched."""
+        self.set_shuffle(not self.queue.shuffled)
+
+    def set_shuffle(self, value: bool) -> None:  # noqa: FBT001
+        if value:
+            self.queue.shuffle()
         else:
-            self.current_song_index = 0
-            self.current_song = self.list_of_downloaded_songs[self.current_song_index]
+            self.queue.unshuffle()
+        # Only refreshes the track list of the media controls
         self.media_control.populate_playlist()
-        self.media_control.set_current_song(self.current_song_index)
+        self._notify("shuffle")
+        self.prefetch_next()
+
+    @property
+    def shuffled(self) -> bool:
+        return self.queue.shuffled
 
     def loop_at_end(self) -> bool:
         """Loop at the end."""
         self.music_player.loop_at_end = not self.music_player.loop_at_end
         self.setting.loop = self.music_player.loop_at_end
+        self._notify("loop")
         return self.music_player.loop_at_end
 
+    def set_loop(self, value: bool) -> None:  # noqa: FBT001
+        """Loop the current song at its end or not."""
+        self.music_player.loop_at_end = value
+        self.setting.loop = value
+        self._notify("loop")
+
     def check_if_song_ended(self) -> bool:
         """Check if the song has ended and play the next song or loop it."""
         if self.music_player.loop_at_end:
@@ -165,10 +370,17 @@ class PyMusicTermPlayer:
         song: SongData = self.list_of_downloaded_songs[index]
         self.downloader.delete(song)
         self.list_of_downloaded_songs.pop(index)
+        new_index: list[int | None] = list(range(len(self.list_of_downloaded_songs)))
+        new_index.insert(index, None)
+        self.queue.update(new_index, len(self.list_of_downloaded_songs))
+        self.current_song_index = self.queue.current
+        self.media_control.populate_playlist()
+        self._notify("library")
         logger.info("Deleted song: %s", song)
 
     def stop(self) -> None:
         self.music_player.unload_song()
+        self.downloader.set_loaded(None)
 
     @property
     def song_length(self) -> float:
@@ -185,6 +397,24 @@ class PyMusicTermPlayer:
         self.music_player.volume += value
         self.media_control.on_volume()
         self.setting.volume = self.music_player.volume
+        self._notify("volume")
+
+    def set_volume(self, value: float) -> None:
+        """Set the volume, between 0 and 1."""
+        self.music_player.volume = min(max(value, 0.0), 1.0)
+        self.media_control.on_volume()
+        self.setting.volume = self.music_player.volume
+        self._notify("volume")
+
+    def toggle_mute(self) -> bool:
+        """Mute, or put the volume of the settings back, the mute isn't saved."""
+        if self.music_player.volume == 0:
+            self.music_player.volume = self.setting.volume
+        else:
+            self.music_player.volume = 0
+        self.media_control.on_volume()
+        self._notify("volume")
+        return self.music_player.volume == 0
 
     @property
     def playing(self) -> bool:
@@ -195,8 +425,10 @@ class PyMusicTermPlayer:
         """Pause the song."""
         self.music_player.pause_song()
         self.media_control.on_playpause()
+        self._notify("playpause")
 
     def resume_song(self) -> None:
         """Resume the song."""
         self.music_player.resume_song()
         self.media_control.on_playpause()
+        self._notify("playpause")
@@ -0,0 +1,494 @@
+"""
+Named playlists saved in playlist_dir, with M3U import and export.
+
+A playlist file is a short header followed by the video_ids of its songs as
+fixed-width records, so adding a song is a single append, its length comes
+from the size of the file and any entry is read without reading the others.
+M3U files are read and written line by line, whatever their size.
+"""
+
+import logging
+import re
+import threading
+from collections.abc import Callable, Iterable, Iterator, Mapping
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from pathlib import Path
+from urllib.parse import parse_qs, urlparse
+
+import msgspec
+
+from api.protocols import SongData
+from api.ytmusic import OfflineError
+from player.player import PyMusicTermPlayer
+from player.util import write_atomic
+
+logger: logging.Logger = logging.getLogger(__name__)
+
+PLAYLIST_SUFFIX = ".pmtpl"
+# Next to a playlist, the imported titles still searched for
+PENDING_SUFFIX = ".pending"
+MAGIC = b"PMTPL\x01"
+# YouTube video ids are 11 characters, shorter ids are padded with NUL bytes
+RECORD_SIZE = 11
+NAME_PATTERN: re.Pattern[str] = re.compile(r"[\w][\w .-]{0,63}")
+VIDEO_ID_PATTERN: re.Pattern[str] = re.compile(r"[A-Za-z0-9_-]{11}")
+# Where the app adds the songs liked with a key
+LIKED_PLAYLIST = "Liked"
+# Reserves the slot of an imported entry until its song is found
+PLACEHOLDER = ""
+DEFAULT_NAME = "Imported"
+# Records written at once by the M3U import
+IMPORT_BATCH = 1024
+
+
+def _record(video_id: str) -> bytes:
+    encoded: bytes = video_id.encode("ascii")
+    if len(encoded) > RECORD_SIZE:
+        msg: str = f"video_id {video_id!r} is over {RECORD_SIZE} characters"
+        raise ValueError(msg)
+    return encoded.ljust(RECORD_SIZE, b"\0")
+
+
+class Playlist:
+    def __init__(self, path: Path) -> None:
+        self.path: Path = path
+
+    @property
+    def name(self) -> str:
+        return self.path.stem
+
+    def __len__(self) -> int:
+        return (self.path.stat().st_size - len(MAGIC)) // RECORD_SIZE
+
+    def __getitem__(self, position: int) -> str:
+        if not 0 <= position < len(self):
+            raise IndexError(position)
+        with self.path.open("rb") as f:
+            f.seek(len(MAGIC) + position * RECORD_SIZE)
+            return f.read(RECORD_SIZE).rstrip(b"\0").decode("ascii")
+
+    def __iter__(self) -> Iterator[str]:
+        with self.path.open("rb") as f:
+            f.seek(len(MAGIC))
+            while record := f.read(RECORD_SIZE * IMPORT_BATCH):
+                for start in range(0, len(record) - RECORD_SIZE + 1, RECORD_SIZE):
+                    yield (
+                        record[start : start + RECORD_SIZE]
+                        .rstrip(b"\0")
+                        .decode("ascii")
+                    )
+
+    def __setitem__(self, position: int, video_id: str) -> None:
+        """Replace an entry in place, records all have the same size."""
+        if not 0 <= position < len(self):
+            raise IndexError(position)
+        with self.path.open("r+b") as f:
+            f.seek(len(MAGIC) + position * RECORD_SIZE)
+            f.write(_record(video_id))
+
+    def append(self, video_id: str) -> None:
+        self.extend((video_id,))
+
+    def extend(self, video_ids: Iterable[str]) -> None:
+        data: bytes = b"".join(_record(video_id) for video_id in video_ids)
+        with self.path.open("ab") as f:
+            f.write(data)
+
+    def remove(self, position: int) -> None:
+        """Remove an entry, which rewrites the entries after it."""
+        if not 0 <= position < len(self):
+            raise IndexError(position)
+        offset: int = len(MAGIC) + position * RECORD_SIZE
+        with self.path.open("r+b") as f:
+            f.seek(offset + RECORD_SIZE)
+            rest: bytes = f.read()
+            f.seek(offset)
+            f.write(rest)
+            f.truncate()
+
+
+def playlist_path(playlist_dir: str, name: str) -> Path:
+    """
+    Return the file of a playlist.
+
+    Raises:
+        ValueError: If the name can't be used as a file name
+
+    """
+    if not NAME_PATTERN.fullmatch(name):
+        msg: str = f"Invalid playlist name {name!r}"
+        raise ValueError(msg)
+    return Path(playlist_dir) / f"{name}{PLAYLIST_SUFFIX}"
+
+
+def playlist_name(text: str) -> str:
+    """A valid playlist name made from any text, like the name of an M3U file."""
+    name: str = re.sub(r"[^\w .-]", "_", text).lstrip(" .-")[:64].rstrip()
+    return name if NAME_PATTERN.fullmatch(name) else DEFAULT_NAME
+
+
+def open_playlist(playlist_dir: str, name: str, *, create: bool = False) -> Playlist:
+    """
+    Open a playlist, creating it if asked to.
+
+    Raises:
+        FileNotFoundError: If the playlist doesn't exist and create is False
+
+    """
+    path: Path = playlist_path(playlist_dir, name)
+    if create and not path.exists():
+        path.write_bytes(MAGIC)
+    elif not path.exists():
+        raise FileNotFoundError(path)
+    with path.open("rb") as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            msg: str = f"{path} is not a playlist"
+            raise ValueError(msg)
+    return Playlist(path)
+
+
+def list_playlists(playlist_dir: str) -> list[str]:
+    return sorted(path.stem for path in Path(playlist_dir).glob(f"*{PLAYLIST_SUFFIX}"))
+
+
+def delete_playlist(playlist_dir: str, name: str) -> None:
+    playlist_path(playlist_dir, name).unlink(missing_ok=True)
+
+
+@dataclass
+class M3UEntry:
+    location: str
+    # From the #EXTINF line before the location, "Artist - Title" by convention
+    title: str | None = None
+
+
+@dataclass
+class ImportResult:
+    added: int = 0
+    # Entries whose video_id is known but that aren't downloaded
+    missing: list[str] = field(default_factory=list)
+    # Entries that only have a title, to search on YouTube Music, with the
+    # position of the placeholder keeping their slot in the playlist
+    unresolved: list[tuple[int, M3UEntry]] = field(default_factory=list)
+
+
+def iter_m3u(path: Path) -> Iterator[M3UEntry]:
+    """Read the entries of an M3U or M3U8 file, one line at a time."""
+    title: str | None = None
+    with path.open(encoding="utf-8-sig", errors="replace") as f:
+        for raw_line in f:
+            line: str = raw_line.strip()
+            if not line:
+                continue
+            if line.startswith("#EXTINF:"):
+                _, _, title = line.partition(",")
+                title = title.strip() or None
+            elif not line.startswith("#"):
+                yield M3UEntry(line, title)
+                title = None
+
+
+def video_id_of(location: str, library: Mapping[str, SongData]) -> str | None:
+    """The video_id of a YouTube URL or of a file of the library, if any."""
+    url = urlparse(location)
+    video_id: str | None = None
+    if url.scheme in ("http", "https"):
+        if url.hostname == "youtu.be":
+            video_id = url.path.strip("/")
+        elif url.hostname and url.hostname.endswith("youtube.com"):
+            video_id = parse_qs(url.query).get("v", [None])[0]
+        if video_id is not None and VIDEO_ID_PATTERN.fullmatch(video_id):
+            return video_id
+        return None
+    # The files of the library are named after their video_id
+    stem: str = Path(location).stem
+    return stem if stem in library else None
+
+
+def import_m3u(
+    path: Path,
+    playlist: Playlist,
+    library: Mapping[str, SongData],
+) -> ImportResult:
+    """
+    Append the entries of an M3U file to a playlist, in batches.
+
+    Entries are added in their order. The ones with only a title get a
+    placeholder, replaced by their song once a PlaylistResolver finds it.
+    """
+    result = ImportResult()
+    start: int = len(playlist)
+    batch: list[str] = []
+    for entry in iter_m3u(path):
+        video_id: str | None = video_id_of(entry.location, library)
+        if video_id is None:
+            if entry.title is None:
+                continue
+            result.unresolved.append((start + result.added + len(batch), entry))
+            video_id = PLACEHOLDER
+        batch.append(video_id)
+        if video_id != PLACEHOLDER and video_id not in library:
+            result.missing.append(video_id)
+        if len(batch) >= IMPORT_BATCH:
+            playlist.extend(batch)
+            result.added += len(batch)
+            batch.clear()
+    playlist.extend(batch)
+    result.added += len(batch)
+    logger.info(
+        "Imported %d entries of %s into %s, %d to download, %d to search",
+        result.added,
+        path,
+        playlist.name,
+        len(result.missing),
+        len(result.unresolved),
+    )
+    return result
+
+
+def _seconds(duration: str) -> int:
+    seconds = 0
+    for part in duration.split(":"):
+        if not part.isdigit():
+            return -1
+        seconds = seconds * 60 + int(part)
+    return seconds
+
+
+def export_m3u(playlist: Playlist, library: Mapping[str, SongData], path: Path) -> int:
+    """
+    Write a playlist as an extended M3U file, one entry at a time.
+
+    Songs that aren't downloaded point to YouTube Music, and the entries
+    that are still searched for are left out.
+
+    Returns:
+        int: The number of entries written
+
+    """
+    count = 0
+    tmp: Path = path.with_name(path.name + ".tmp")
+    with tmp.open("w", encoding="utf-8") as f:
+        f.write("#EXTM3U\n")
+        for video_id in playlist:
+            if video_id == PLACEHOLDER:
+                continue
+            song: SongData | None = library.get(video_id)
+            if song is not None and song.path is not None:
+                f.write(
+                    f"#EXTINF:{_seconds(song.duration)},"
+                    f"{song.get_formatted_artists()} - {song.title}\n"
+                    f"{Path(song.path).resolve()}\n",
+                )
+            else:
+                f.write(f"https://music.youtube.com/watch?v={video_id}\n")
+            count += 1
+    tmp.replace(path)
+    return count
+
+
+class PendingTitle(msgspec.Struct, array_like=True):
+    """An imported entry still searched for, and the position of its placeholder."""
+
+    position: int
+    title: str
+
+
+def pending_path(playlist: Playlist) -> Path:
+    return playlist.path.with_suffix(PENDING_SUFFIX)
+
+
+class PlaylistResolver:
+    """
+    Resolve the imported entries that aren't in the library, one at a time.
+
+    Title-only entries are searched on YouTube Music and replace their
+    placeholder once found, the placeholder is removed when nothing is found.
+    The others are looked up by their video_id. Songs are then downloaded and
+    handed to on_downloaded with their path, to be added to the library by
+    the thread that owns it.
+
+    The titles still searched for are saved next to their playlist, so a
+    search cut short by a restart or by YouTube Music being unreachable is
+    made again by resume. Entries are removed with remove, which keeps these
+    titles on their placeholder.
+    """
+
+    def __init__(
+        self,
+        player: PyMusicTermPlayer,
+        on_downloaded: Callable[[str], None],
+    ) -> None:
+        self.player: PyMusicTermPlayer = player
+        self.on_downloaded: Callable[[str], None] = on_downloaded
+        self._executor = ThreadPoolExecutor(
+            max_workers=1,
+            thread_name_prefix="playlist-resolver",
+        )
+        self._stopped = threading.Event()
+        # Titles still searched for, by playlist. Their positions only change
+        # with the lock held, along with the playlist and the saved titles.
+        self._pending: dict[Path, list[PendingTitle]] = {}
+        self._lock = threading.Lock()
+
+    def import_m3u(
+        self,
+        path: Path,
+        playlist: Playlist,
+        library: Mapping[str, SongData],
+    ) -> ImportResult:
+        """Import an M3U file, what the library lacks is resolved in the background."""
+        with self._lock:
+            result: ImportResult = import_m3u(path, playlist, library)
+            titles: list[PendingTitle] = [
+                PendingTitle(position, entry.title)
+                for position, entry in result.unresolved
+            ]
+            if titles:
+                self._pending.setdefault(playlist.path, []).extend(titles)
+                self._save(playlist)
+        if result.missing or titles:
+            self._executor.submit(self._resolve, playlist, titles, result.missing)
+        return result
+
+    def resume(self, playlist_dir: str) -> None:
+        """Search again for the titles left unresolved by the last run."""
+        for path in Path(playlist_dir).glob(f"*{PENDING_SUFFIX}"):
+            playlist = Playlist(path.with_suffix(PLAYLIST_SUFFIX))
+            if not playlist.path.exists():
+                path.unlink(missing_ok=True)
+                continue
+            try:
+                titles: list[PendingTitle] = msgspec.json.decode(
+                    path.read_bytes(),
+                    type=list[PendingTitle],
+                )
+            except Exception:
+                logger.exception("Ignoring the unreadable %s", path)
+                continue
+            with self._lock:
+                self._pending[playlist.path] = titles
+            logger.info("Searching %d titles of %s again", len(titles), playlist.name)
+            self._executor.submit(self._resolve, playlist, list(titles), [])
+
+    def remove(self, playlist: Playlist, position: int) -> None:
+        """Remove an entry, the titles searched for keep their placeholder."""
+        with self._lock:
+            playlist.remove(position)
+            titles: list[PendingTitle] | None = self._pending.get(playlist.path)
+            if titles is not None:
+                self._shift(playlist, titles, position)
+
+    def forget(self, playlist: Playlist) -> None:
+        """Stop resolving the titles of a playlist, before it is deleted."""
+        with self._lock:
+            self._pending.pop(playlist.path, None)
+            pending_path(playlist).unlink(missing_ok=True)
+
+    def _shift(
+        self,
+        playlist: Playlist,
+        titles: list[PendingTitle],
+        removed: int,
+    ) -> None:
+        """Follow the removal of an entry (lock held)."""
+        titles[:] = [title for title in titles if title.position != removed]
+        for title in titles:
+            if title.position > removed:
+                title.position -= 1
+        self._save(playlist)
+
+    def _save(self, playlist: Playlist) -> None:
+        """Save the titles still searched for in a playlist (lock held)."""
+        titles: list[PendingTitle] = self._pending.get(playlist.path, [])
+        try:
+            if titles:
+                write_atomic(pending_path(playlist), msgspec.json.encode(titles))
+            else:
+                self._pending.pop(playlist.path, None)
+                pending_path(playlist).unlink(missing_ok=True)
+        except OSError:
+            logger.exception("Failed to save the titles of %s", playlist.name)
+
+    def _search(self, query: str) -> SongData | None:
+        songs: list[SongData] = self.player.ytm.search(query, "songs", limit=1)
+        return songs[0] if songs else None
+
+    def _download(self, song: SongData) -> None:
+        path: str | None = self.player.downloader.download(song)
+        if path is not None:
+            self.on_downloaded(path)
+
+    def _resolve(
+        self,
+        playlist: Playlist,
+        titles: list[PendingTitle],
+        missing: list[str],
+    ) -> None:
+        try:
+            self._resolve_titles(playlist, titles)
+            for video_id in missing:
+                if self._stopped.is_set():
+                    return
+                song = self.player.ytm.get_song(video_id)
+                if song is None:
+                    logger.info("Could not find %s of %s", video_id, playlist.name)
+                    continue
+                self._download(song)
+        except OfflineError:
+            logger.warning("Offline, the songs of %s are left for later", playlist.name)
+        except Exception:
+            logger.exception("Failed to resolve the songs of %s", playlist.name)
+
+    def _resolve_titles(self, playlist: Playlist, titles: list[PendingTitle]) -> None:
+        for title in titles:
+            if self._stopped.is_set():
+                return
+            with self._lock:
+                if self._index(playlist, title) is None:
+                    # Its entry was removed before it was searched for
+                    continue
+            try:
+                song: SongData | None = self._search(title.title)
+            except OfflineError:
+                raise
+            except Exception:
+                # Kept for the next resume, like the titles not searched yet
+                logger.exception("Failed to search %r", title.title)
+                continue
+            with self._lock:
+                index: int | None = self._index(playlist, title)
+                if index is None:
+                    # Its entry was removed meanwhile
+                    continue
+                del self._pending[playlist.path][index]
+                # Unless the playlist was deleted and made again since the import
+                if not (
+                    title.position < len(playlist)
+                    and playlist[title.position] == PLACEHOLDER
+                ):
+                    logger.info("Slot of %r in %s gone", title.title, playlist.name)
+                    self._save(playlist)
+                    continue
+                if song is None:
+                    logger.info("Nothing found for %r", title.title)
+                    # Removed rather than left as an empty entry for good
+                    playlist.remove(title.position)
+                    self._shift(playlist, self._pending[playlist.path], title.position)
+                    continue
+                playlist[title.position] = song.video_id
+                self._save(playlist)
+            self._download(song)
+
+    def _index(self, playlist: Playlist, title: PendingTitle) -> int | None:
+        """Where a title is among the pending ones, None if it isn't (lock held)."""
+        titles: list[PendingTitle] = self._pending.get(playlist.path, [])
+        return next(
+            (index for index, pending in enumerate(titles) if pending is title),
+            None,
+        )
+
+    def shutdown(self) -> None:
+        self._stopped.set()
+        self._executor.shutdown(wait=False, cancel_futures=True)
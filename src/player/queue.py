@@ -0,0 +1,200 @@
+"""
+Order in which the library is played, kept apart from the library itself.
+
+The queue is a permutation of the indices of the library with a cursor on
+the current song, so shuffling never reorders the library nor the playlist
+shown by the app. It is saved in playlist_dir by video_id, as the indices of
+the library change from one launch to the next.
+"""
+
+import logging
+import random
+from collections import deque
+from collections.abc import Iterator
+from pathlib import Path
+
+import msgspec
+
+from api.protocols import SongData
+
+logger: logging.Logger = logging.getLogger(__name__)
+
+QUEUE_FILE = "queue.msgpack"
+# Songs remembered for previous
+HISTORY_SIZE = 200
+
+
+class QueueState(msgspec.Struct):
+    order: list[str] = []
+    cursor: int = 0
+    shuffled: bool = False
+    history: list[str] = []
+
+
+class PlayQueue:
+    def __init__(self, size: int) -> None:
+        # Position in the queue -> index in the library, and the inverse
+        self.order: list[int] = list(range(size))
+        self._position: list[int] = list(range(size))
+        self.cursor = 0
+        self.shuffled = False
+        # Indices in the library of the songs played before the current one
+        self.history: deque[int] = deque(maxlen=HISTORY_SIZE)
+
+    def __len__(self) -> int:
+        return len(self.order)
+
+    @property
+    def current(self) -> int:
+        """Index in the library of the current song."""
+        return self.order[self.cursor] if self.order else 0
+
+    def _reindex(self) -> None:
+        self._position = [0] * len(self.order)
+        for position, index in enumerate(self.order):
+            self._position[index] = position
+
+    def jump(self, index: int, *, remember: bool = True) -> int:
+        """Move the cursor to a song of the library."""
+        if remember and self.order and index != self.current:
+            self.history.append(self.current)
+        self.cursor = self._position[index]
+        return index
+
+    def next(self) -> int:
+        """Move to the next song, back to the first one after the last."""
+        if not self.order:
+            return 0
+        self.history.append(self.current)
+        self.cursor = (self.cursor + 1) % len(self.order)
+        return self.current
+
+    def previous(self) -> int:
+        """Move back to the song played before, or the one before in the queue."""
+        if not self.order:
+            return 0
+        if self.history:
+            self.cursor = self._position[self.history.pop()]
+        else:
+            self.cursor = (self.cursor - 1) % len(self.order)
+        return self.current
+
+    def upcoming(self, count: int) -> Iterator[int]:
+        """Indices in the library of the songs following the current one."""
+        for offset in range(1, min(count, len(self.order) - 1) + 1):
+            yield self.order[(self.cursor + offset) % len(self.order)]
+
+    def window(self, before: int, after: int) -> list[int]:
+        """Indices in the library of the songs around the current one."""
+        start: int = max(self.cursor - before, 0)
+        return self.order[start : self.cursor + after + 1]
+
+    def shuffle(self) -> None:
+        """Play the other songs in a random order after the current one."""
+        if not self.order:
+            self.shuffled = True
+            return
+        current: int = self.current
+        rest: list[int] = [index for index in self.order if index != current]
+        random.shuffle(rest)
+        self.order = [current, *rest]
+        self.cursor = 0
+        self.shuffled = True
+        self._reindex()
+
+    def unshuffle(self) -> None:
+        """Play the library in its order again, from the current song."""
+        current: int = self.current
+        self.order = list(range(len(self.order)))
+        self.cursor = current if self.order else 0
+        self.shuffled = False
+        self._reindex()
+
+    def update(self, new_index: list[int | None], size: int) -> None:
+        """
+        Follow a change of the library.
+
+        Args:
+            new_index (list[int | None]): The new index of each song of the old
+                library, None for the removed ones
+            size (int): The number of songs in the new library, the ones past
+                the kept songs were added and go at the end of the queue
+
+        """
+        current: int | None = new_index[self.current] if self.order else None
+        order: list[int] = [
+            new for index in self.order if (new := new_index[index]) is not None
+        ]
+        kept: int = len(order)
+        added: list[int] = list(range(kept, size))
+        if self.shuffled:
+            random.shuffle(added)
+        self.order = order + added
+        self._reindex()
+        self.history = deque(
+            (new for index in self.history if (new := new_index[index]) is not None),
+            maxlen=HISTORY_SIZE,
+        )
+        if current is not None:
+            self.cursor = self._position[current]
+        else:
+            self.cursor = min(self.cursor, max(len(self.order) - 1, 0))
+
+    def state(self, songs: list[SongData]) -> QueueState:
+        return QueueState(
+            order=[songs[index].video_id for index in self.order],
+            cursor=self.cursor,
+            shuffled=self.shuffled,
+            history=[songs[index].video_id for index in self.history],
+        )
+
+    @classmethod
+    def from_state(cls, state: QueueState, songs: list[SongData]) -> "PlayQueue":
+        """Rebuild a saved queue over the library, which may have changed since."""
+        queue = cls(len(songs))
+        index_of: dict[str, int] = {song.video_id: i for i, song in enumerate(songs)}
+        order: list[int] = []
+        seen: set[int] = set()
+        cursor = 0
+        for position, video_id in enumerate(state.order):
+            index: int | None = index_of.get(video_id)
+            if index is None or index in seen:
+                continue
+            if position <= state.cursor:
+                cursor = len(order)
+            order.append(index)
+            seen.add(index)
+        # Songs downloaded since the queue was saved
+        order.extend(index for index in range(len(songs)) if index not in seen)
+        queue.order = order
+        queue.cursor = cursor
+        queue.shuffled = state.shuffled
+        queue.history.extend(
+            index_of[video_id] for video_id in state.history if video_id in index_of
+        )
+        queue._reindex()  # noqa: SLF001
+        return queue
+
+
+def load_queue(playlist_dir: str, songs: list[SongData]) -> PlayQueue:
+    """Load the saved queue, or a queue in the order of the library."""
+    path: Path = Path(playlist_dir) / QUEUE_FILE
+    try:
+        state: QueueState = msgspec.msgpack.decode(path.read_bytes(), type=QueueState)
+    except FileNotFoundError:
+        return PlayQueue(len(songs))
+    except Exception:
+        logger.exception("Ignoring the unreadable queue %s", path)
+        return PlayQueue(len(songs))
+    return PlayQueue.from_state(state, songs)
+
+
+def save_queue(playlist_dir: str, state: QueueState) -> None:
+    path: Path = Path(playlist_dir) / QUEUE_FILE
+    tmp: Path = path.with_suffix(".tmp")
+    try:
+        tmp.write_bytes(msgspec.msgpack.encode(state))
+        tmp.replace(path)
+    except OSError:
+        logger.exception("Failed to save the queue")
+        tmp.unlink(missing_ok=True)
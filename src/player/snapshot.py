@@ -0,0 +1,96 @@
+"""
+Warm-start snapshot of the player and the UI.
+
+Written to app_dir on exit, it lets the next launch show the library, the
+last track and the search results before the music folder is scanned again,
+which then happens in the background. Thumbnails are not part of it, they are
+read back from the cover files.
+"""
+
+import logging
+from pathlib import Path
+
+import msgspec
+from PIL import Image
+
+from api.covers import cover_path
+from api.protocols import SongData
+
+logger: logging.Logger = logging.getLogger(__name__)
+
+SNAPSHOT_FILE = "snapshot.msgpack"
+
+
+class SongEntry(msgspec.Struct, array_like=True):
+    video_id: str
+    title: str
+    artist: list[str]
+    duration: str
+    album: str
+    path: str | None = None
+
+
+class Snapshot(msgspec.Struct):
+    songs: list[SongEntry] = []
+    current_index: int = 0
+    position: float = 0.0
+    search_results: list[SongEntry] = []
+    active_tab: str = "search"
+    # Rows that were on screen in the list of the active tab
+    visible_ids: list[str] = []
+
+
+def to_entry(song: SongData) -> SongEntry:
+    return SongEntry(
+        video_id=song.video_id,
+        title=song.title,
+        artist=list(song.artist),
+        duration=song.duration,
+        album=song.album,
+        path=str(song.path) if song.path is not None else None,
+    )
+
+
+def to_song(entry: SongEntry) -> SongData:
+    """Rebuild a song, its thumbnail is loaded when it is first shown."""
+    return SongData(
+        title=entry.title,
+        artist=entry.artist,
+        duration=entry.duration,
+        video_id=entry.video_id,
+        thumbnail=None,
+        album=entry.album,
+        path=Path(entry.path) if entry.path is not None else None,
+    )
+
+
+def load_thumbnail(cover_dir: str, video_id: str) -> Image.Image | None:
+    """Read a thumbnail back from its cover file, None if there is none."""
+    try:
+        with Image.open(cover_path(cover_dir, video_id)) as image:
+            image.load()
+            return image
+    except OSError:
+        return None
+
+
+def load_snapshot(app_dir: str) -> Snapshot | None:
+    path: Path = Path(app_dir) / SNAPSHOT_FILE
+    try:
+        return msgspec.msgpack.decode(path.read_bytes(), type=Snapshot)
+    except FileNotFoundError:
+        return None
+    except Exception:
+        logger.exception("Ignoring the unreadable snapshot %s", path)
+        return None
+
+
+def save_snapshot(app_dir: str, snapshot: Snapshot) -> None:
+    path: Path = Path(app_dir) / SNAPSHOT_FILE
+    tmp: Path = path.with_suffix(".tmp")
+    try:
+        tmp.write_bytes(msgspec.msgpack.encode(snapshot))
+        tmp.replace(path)
+    except OSError:
+        logger.exception("Failed to save the snapshot")
+        tmp.unlink(missing_ok=True)
@@ -1,4 +1,16 @@
+import os
+import sys
+import tempfile
+import time
 from datetime import timedelta
+from pathlib import Path
+from types import TracebackType
+from typing import IO, Self
+
+if sys.platform == "win32":
+    import msvcrt
+else:
+    import fcntl
 
 
 def format_time(seconds: float) -> str:
@@ -41,3 +53,85 @@ def string_to_seconds(time_str: str) -> int:
 
     h, m, s = parts
     return h * 3600 + m * 60 + s
+
+
+def write_atomic(path: Path, data: bytes) -> None:
+    """
+    Write a file through a temporary file renamed over it.
+
+    The temporary file has a unique name, so processes writing the same file
+    never write over each other's, and a crash never leaves a truncated file.
+
+    Raises:
+        OSError: If the file could not be written
+
+    """
+    fd, tmp = tempfile.mkstemp(
+        dir=path.parent,
+        prefix=f".{path.name}.",
+        suffix=".tmp",
+    )
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+    except BaseException:
+        Path(tmp).unlink(missing_ok=True)
+        raise
+
+
+class FileLock:
+    """
+    An exclusive lock on a file, shared by every process of the user.
+
+    The lock goes away with the process holding it, a crash never leaves a
+    stale lock behind.
+    """
+
+    def __init__(self, path: Path) -> None:
+        self.path: Path = path
+        self._file: IO[bytes] | None = None
+
+    def acquire(self, *, blocking: bool = True) -> bool:
+        """
+        Take the lock, waiting for the process holding it unless not blocking.
+
+        Returns:
+            bool: True if the lock was taken
+
+        """
+        lock_file: IO[bytes] = self.path.open("a+b")
+        while True:
+            try:
+                if sys.platform == "win32":
+                    lock_file.seek(0)
+                    msvcrt.locking(lock_file.fileno(), msvcrt.LK_NBLCK, 1)
+                else:
+                    fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                if not blocking:
+                    lock_file.close()
+                    return False
+                time.sleep(0.1)
+            else:
+                self._file = lock_file
+                return True
+
+    def release(self) -> None:
+        if self._file is None:
+            return
+        # Closing the file releases the lock
+        self._file.close()
+        self._file = None
+
+    def __enter__(self) -> Self:
+        self.acquire()
+        return self
+
+    def __exit__(
+        self,
+        exc_type: type[BaseException] | None,
+        exc: BaseException | None,
+        traceback: TracebackType | None,
+    ) -> None:
+        self.release()
@@ -1,12 +1,15 @@
+import atexit
 import logging
 import os
 import sys
+import threading
 from dataclasses import dataclass
 from pathlib import Path
 
 from msgspec import toml
 
 from log.logger import setup_logging
+from log.tracing import enable as enable_tracing
 
 logger: logging.Logger = logging.getLogger(__name__)
 
@@ -19,6 +22,10 @@ LYRICS_DIR = Path(APP_DIR / "lyrics")
 LOG_DIR = Path(APP_DIR / "logs")
 CACHE_DIR = Path(APP_DIR / "cache")
 COVER_DIR = Path(APP_DIR / "covers")
+SESSION_DIR = Path(APP_DIR / "sessions")
+
+# Setting changes are written at most this often (in seconds).
+SAVE_DELAY = 1.0
 
 
 def is_android() -> bool:
@@ -97,16 +104,43 @@ class Setting:
     log_dir: str = str(LOG_DIR)
     cache_dir: str = str(CACHE_DIR)
     cover_dir: str = str(COVER_DIR)
+    prefetch: bool = True
+    prefetch_download: bool = False
+    prefetch_top_n: int = 3
+    prefetch_next_k: int = 2
+    prefetch_disk_budget_mb: int = 200
+    prefetch_rate_limit_kbps: int = 1024
+    download_quality: str = "auto"
+    upgrade_quality: bool = False
+    tracing: bool = False
+    profile_seconds: int = 10
+    offline: bool = False
+    stream_server: bool = False
+    stream_host: str = "127.0.0.1"
+    stream_port: int = 8001
 
 
 class SettingManager:
     """Manages the settings of the app."""
 
-    def __init__(self) -> None:
+    def __init__(self, session: str | None = None) -> None:
         self._setting = None
+        self._dirty = False
+        self._save_timer: threading.Timer | None = None
+        self._save_lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        # A browser session reads the shared settings but writes its own copy,
+        # so sessions never overwrite each other nor the terminal app.
+        self.session: str | None = session
+        self.save_file: Path = (
+            SESSION_DIR / f"{self.session}.toml" if self.session else SETTING_FILE
+        )
         self.check_and_create_paths()
         self._setting: Setting = self.load_setting()
         setup_logging(self.log_dir)
+        if self.tracing:
+            enable_tracing()
+        atexit.register(self.flush)
 
     @property
     def os(self) -> str:
@@ -115,7 +149,7 @@ class SettingManager:
     @os.setter
     def os(self, value: str) -> None:
         self._setting.os = value
-        self.save_setting()
+        self.mark_dirty()
 
     @property
     def volume(self) -> float:
@@ -124,7 +158,7 @@ class SettingManager:
     @volume.setter
     def volume(self, value: float) -> None:
         self._setting.volume = round(value, 3)
-        self.save_setting()
+        self.mark_dirty()
 
     @property
     def loop(self) -> bool:
@@ -133,7 +167,7 @@ class SettingManager:
     @loop.setter
     def loop(self, value: bool) -> None:
         self._setting.loop = value
-        self.save_setting()
+        self.mark_dirty()
 
     @property
     def app_dir(self) -> str:
@@ -167,14 +201,75 @@ class SettingManager:
     def cover_dir(self) -> str:
         return self._setting.cover_dir
 
+    @property
+    def prefetch(self) -> bool:
+        return self._setting.prefetch
+
+    @property
+    def prefetch_download(self) -> bool:
+        return self._setting.prefetch_download
+
+    @property
+    def prefetch_top_n(self) -> int:
+        return self._setting.prefetch_top_n
+
+    @property
+    def prefetch_next_k(self) -> int:
+        return self._setting.prefetch_next_k
+
+    @property
+    def prefetch_disk_budget_mb(self) -> int:
+        return self._setting.prefetch_disk_budget_mb
+
+    @property
+    def prefetch_rate_limit_kbps(self) -> int:
+        return self._setting.prefetch_rate_limit_kbps
+
+    @property
+    def download_quality(self) -> str:
+        """The pinned quality tier (low, medium or high), or auto."""
+        return self._setting.download_quality
+
+    @property
+    def upgrade_quality(self) -> bool:
+        return self._setting.upgrade_quality
+
+    @property
+    def tracing(self) -> bool:
+        return self._setting.tracing
+
+    @property
+    def profile_seconds(self) -> int:
+        return self._setting.profile_seconds
+
+    @property
+    def offline(self) -> bool:
+        return self._setting.offline
+
+    @property
+    def stream_server(self) -> bool:
+        return self._setting.stream_server
+
+    @property
+    def stream_host(self) -> str:
+        """Set to 0.0.0.0 to stream to the other devices of the LAN."""
+        return self._setting.stream_host
+
+    @property
+    def stream_port(self) -> int:
+        return self._setting.stream_port
+
     def load_setting(self) -> Setting:
-        """Load settings from the setting.toml file."""
-        if not SETTING_FILE.exists():
+        """Load settings from the setting.toml file, or from the session file."""
+        # A session starts from the shared settings, then reads back its own
+        path: Path = self.save_file if self.save_file.exists() else SETTING_FILE
+        if not path.exists():
             self._setting = Setting()
             self.save_setting()
+            path = self.save_file
 
         try:
-            with SETTING_FILE.open("rb") as f:
+            with path.open("rb") as f:
                 return toml.decode(f.read(), type=Setting)
         except Exception:
             logger.exception("Error loading settings")
@@ -183,12 +278,45 @@ class SettingManager:
     def save_setting(self) -> None:
         """Save the current settings to the setting.toml file."""
         try:
-            with SETTING_FILE.open("wb") as f:
-                encoded: bytes = toml.encode(self._setting)
-                f.write(encoded)
+            self._write(toml.encode(self._setting))
         except Exception:
             logger.exception("Error saving settings")
 
+    def _write(self, encoded: bytes) -> None:
+        # Write a temporary file then rename it, so a crash never leaves a
+        # truncated setting.toml behind.
+        tmp_file: Path = self.save_file.with_suffix(".toml.tmp")
+        with tmp_file.open("wb") as f:
+            f.write(encoded)
+            f.flush()
+            os.fsync(f.fileno())
+        tmp_file.replace(self.save_file)
+
+    def mark_dirty(self) -> None:
+        """Schedule a save, coalescing the changes made until it runs."""
+        with self._save_lock:
+            self._dirty = True
+            if self._save_timer is None:
+                self._save_timer = threading.Timer(SAVE_DELAY, self.flush)
+                self._save_timer.daemon = True
+                self._save_timer.start()
+
+    def flush(self) -> None:
+        """Save the settings now if they changed since the last save."""
+        with self._write_lock:
+            with self._save_lock:
+                if self._save_timer is not None:
+                    self._save_timer.cancel()
+                    self._save_timer = None
+                if not self._dirty:
+                    return
+                self._dirty = False
+                encoded: bytes = toml.encode(self._setting)
+            try:
+                self._write(encoded)
+            except Exception:
+                logger.exception("Error saving settings")
+
     def check_and_create_paths(self) -> None:
         """Check and create necessary directories and files."""
         APP_DIR.mkdir(exist_ok=True)
@@ -198,6 +326,8 @@ class SettingManager:
         LOG_DIR.mkdir(exist_ok=True)
         CACHE_DIR.mkdir(exist_ok=True)
         COVER_DIR.mkdir(exist_ok=True)
+        if self.session:
+            SESSION_DIR.mkdir(exist_ok=True)
 
 
 @dataclass
@@ -0,0 +1,124 @@
+import time
+from pathlib import Path
+from types import SimpleNamespace
+
+import pytest
+
+from api import lyrics
+from api.lyrics import (
+    ERROR_RETRY_AFTER,
+    MISS_MAX_RETRY_AFTER,
+    MISS_RETRY_AFTER,
+    NegativeCache,
+    download_lyrics,
+)
+
+
+@pytest.fixture
+def negative_cache(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> NegativeCache:
+    cache = NegativeCache(tmp_path / "negative_cache.json")
+    monkeypatch.setattr(lyrics, "negative_cache", cache)
+    monkeypatch.setattr(lyrics, "LYRICS_DIR", tmp_path)
+    return cache
+
+
+@pytest.fixture
+def clock(monkeypatch: pytest.MonkeyPatch) -> SimpleNamespace:
+    """The time of the lyrics module, moved forward by the tests."""
+    clock = SimpleNamespace(now=1_000_000.0)
+    fake_time = SimpleNamespace(time=lambda: clock.now)
+    monkeypatch.setattr(lyrics, "time", fake_time)
+    return clock
+
+
+def lrclib(synced: str | None, plain: str | None) -> SimpleNamespace:
+    track = SimpleNamespace(syncedLyrics=synced, plainLyrics=plain)
+    return SimpleNamespace(get=lambda *_: track)
+
+
+def test_download_instrumental_is_a_miss(
+    negative_cache: NegativeCache,
+    tmp_path: Path,
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    monkeypatch.setattr(lyrics, "get_lrclib", lambda: lrclib(None, None))
+    assert not download_lyrics("aaaaaaaaaaa", "Track")
+    assert not (tmp_path / "aaaaaaaaaaa.lrc").exists()
+    assert not negative_cache.is_due("aaaaaaaaaaa")
+    # Not found rather than failed, so retried a day later, not an hour
+    miss: lyrics.Miss = negative_cache._load()["aaaaaaaaaaa"]  # noqa: SLF001
+    assert miss.retry_after > time.time() + MISS_RETRY_AFTER - 60
+
+
+def test_download_writes_the_lyrics(
+    negative_cache: NegativeCache,
+    tmp_path: Path,
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    monkeypatch.setattr(lyrics, "get_lrclib", lambda: lrclib(None, "Hello"))
+    negative_cache.record_miss("aaaaaaaaaaa", transient=True)
+    assert download_lyrics("aaaaaaaaaaa", "Track")
+    assert (tmp_path / "aaaaaaaaaaa.lrc").read_text() == "Hello"
+    assert negative_cache.is_due("aaaaaaaaaaa")
+
+
+def test_miss_is_due_after_a_day(
+    negative_cache: NegativeCache,
+    clock: SimpleNamespace,
+) -> None:
+    assert negative_cache.is_due("aaaaaaaaaaa")
+    negative_cache.record_miss("aaaaaaaaaaa")
+    clock.now += MISS_RETRY_AFTER - 1
+    assert not negative_cache.is_due("aaaaaaaaaaa")
+    clock.now += 1
+    assert negative_cache.is_due("aaaaaaaaaaa")
+    assert negative_cache.is_due("bbbbbbbbbbb")
+
+
+def test_misses_back_off_up_to_a_month(
+    negative_cache: NegativeCache,
+    clock: SimpleNamespace,
+) -> None:
+    delays: list[float] = []
+    for _ in range(7):
+        negative_cache.record_miss("aaaaaaaaaaa")
+        miss: lyrics.Miss = negative_cache._load()["aaaaaaaaaaa"]  # noqa: SLF001
+        delays.append(miss.retry_after - clock.now)
+        clock.now = miss.retry_after
+    assert delays == [MISS_RETRY_AFTER * 2**n for n in range(5)] + [
+        MISS_MAX_RETRY_AFTER,
+    ] * 2
+
+
+def test_error_is_due_after_an_hour(
+    negative_cache: NegativeCache,
+    clock: SimpleNamespace,
+) -> None:
+    negative_cache.record_miss("aaaaaaaaaaa")
+    negative_cache.record_miss("aaaaaaaaaaa", transient=True)
+    clock.now += ERROR_RETRY_AFTER - 1
+    assert not negative_cache.is_due("aaaaaaaaaaa")
+    clock.now += 1
+    assert negative_cache.is_due("aaaaaaaaaaa")
+
+
+def test_clear_makes_it_due(negative_cache: NegativeCache) -> None:
+    negative_cache.record_miss("aaaaaaaaaaa")
+    negative_cache.clear("aaaaaaaaaaa")
+    assert negative_cache.is_due("aaaaaaaaaaa")
+    # Backing off from the start again
+    negative_cache.record_miss("aaaaaaaaaaa")
+    miss: lyrics.Miss = negative_cache._load()["aaaaaaaaaaa"]  # noqa: SLF001
+    assert miss.attempts == 1
+
+
+def test_misses_are_kept_until_due(
+    negative_cache: NegativeCache,
+    clock: SimpleNamespace,
+) -> None:
+    negative_cache.record_miss("aaaaaaaaaaa")
+    negative_cache.flush()
+    reloaded = NegativeCache(negative_cache.path)
+    assert not reloaded.is_due("aaaaaaaaaaa")
+    clock.now += MISS_RETRY_AFTER
+    assert reloaded.is_due("aaaaaaaaaaa")
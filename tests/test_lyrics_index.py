@@ -0,0 +1,121 @@
+from pathlib import Path
+
+import pytest
+
+from api import lyrics
+from api.lyrics_index import LyricsIndex
+
+
+@pytest.fixture
+def index(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> LyricsIndex:
+    monkeypatch.setattr(lyrics, "LYRICS_DIR", tmp_path)
+    return LyricsIndex(str(tmp_path))
+
+
+def write_lyrics(index: LyricsIndex, video_id: str, *lines: str) -> None:
+    lrc: str = "\n".join(
+        f"[00:{second:02d}.00]{line}" for second, line in enumerate(lines)
+    )
+    (index.lyrics_dir / f"{video_id}.lrc").write_text(lrc, encoding="utf-8")
+    index.add(video_id)
+
+
+def found(index: LyricsIndex, phrase: str) -> list[tuple[str, int, str]]:
+    return [(hit.video_id, hit.time_ms, hit.line) for hit in index.search(phrase)]
+
+
+def test_prefix_of_the_last_word(index: LyricsIndex) -> None:
+    write_lyrics(index, "aaaaaaaaaaa", "Hello darkness", "my old friend")
+    write_lyrics(index, "bbbbbbbbbbb", "Help me", "hell no")
+    assert found(index, "hel") == [
+        ("aaaaaaaaaaa", 0, "Hello darkness"),
+        ("bbbbbbbbbbb", 0, "Help me"),
+        ("bbbbbbbbbbb", 1000, "hell no"),
+    ]
+    assert found(index, "hello") == [("aaaaaaaaaaa", 0, "Hello darkness")]
+    # A prefix, not a substring
+    assert found(index, "ello") == []
+
+
+def test_phrase(index: LyricsIndex) -> None:
+    write_lyrics(
+        index,
+        "aaaaaaaaaaa",
+        "my old friend",
+        "old my friend",
+        "an old friendship",
+        "my old",
+    )
+    assert found(index, "old friend") == [
+        ("aaaaaaaaaaa", 0, "my old friend"),
+        ("aaaaaaaaaaa", 2000, "an old friendship"),
+    ]
+    # The words in the order of the phrase, whole but for the last one
+    assert found(index, "My, old FRIEND") == [("aaaaaaaaaaa", 0, "my old friend")]
+    assert found(index, "y old") == []
+    assert found(index, "unknown old") == []
+
+
+def test_limit(index: LyricsIndex) -> None:
+    write_lyrics(index, "aaaaaaaaaaa", *["la la la"] * 10)
+    assert len(index.search("la", limit=3)) == 3
+
+
+def test_remove_cleans_the_postings(index: LyricsIndex) -> None:
+    write_lyrics(index, "aaaaaaaaaaa", "shared words", "only here")
+    write_lyrics(index, "bbbbbbbbbbb", "shared words")
+    assert len(found(index, "only")) == 1
+    index.remove("aaaaaaaaaaa")
+    assert found(index, "only") == []
+    assert found(index, "shared") == [("bbbbbbbbbbb", 0, "shared words")]
+    postings: dict[str, dict[str, list[int]]] = index._postings  # noqa: SLF001
+    assert "only" not in postings
+    assert "here" not in postings
+    assert postings["shared"] == {"bbbbbbbbbbb": [0]}
+
+
+def test_add_again_replaces_the_lines(index: LyricsIndex) -> None:
+    write_lyrics(index, "aaaaaaaaaaa", "first version")
+    write_lyrics(index, "aaaaaaaaaaa", "second version")
+    assert found(index, "first") == []
+    assert found(index, "version") == [("aaaaaaaaaaa", 0, "second version")]
+
+
+def test_save_and_load(index: LyricsIndex) -> None:
+    write_lyrics(index, "aaaaaaaaaaa", "Hello darkness", "my old friend")
+    index.save()
+    loaded = LyricsIndex(str(index.lyrics_dir))
+    loaded.load()
+    assert found(loaded, "old fr") == [("aaaaaaaaaaa", 1000, "my old friend")]
+    assert found(loaded, "hel") == [("aaaaaaaaaaa", 0, "Hello darkness")]
+
+
+def test_save_only_when_changed(index: LyricsIndex) -> None:
+    index.save()
+    assert not index.path.exists()
+    write_lyrics(index, "aaaaaaaaaaa", "Hello")
+    index.save()
+    assert index.path.exists()
+    # Not written again until something changes
+    index.path.write_bytes(b"")
+    index.save()
+    assert index.path.read_bytes() == b""
+
+
+def test_load_of_a_broken_index_starts_empty(index: LyricsIndex) -> None:
+    index.path.write_bytes(b"not msgpack")
+    index.load()
+    assert found(index, "hello") == []
+
+
+def test_refresh_follows_the_files(index: LyricsIndex) -> None:
+    write_lyrics(index, "aaaaaaaaaaa", "Hello")
+    (index.lyrics_dir / "bbbbbbbbbbb.lrc").write_text("[00:01.00]Goodbye")
+    (index.lyrics_dir / "aaaaaaaaaaa.lrc").unlink()
+    index.refresh()
+    assert found(index, "hello") == []
+    assert found(index, "goodbye") == [("bbbbbbbbbbb", 1000, "Goodbye")]
+    # Persisted by the refresh
+    loaded = LyricsIndex(str(index.lyrics_dir))
+    loaded.load()
+    assert found(loaded, "goodbye") == [("bbbbbbbbbbb", 1000, "Goodbye")]
@@ -0,0 +1,304 @@
+import threading
+from collections.abc import Callable
+from pathlib import Path
+from types import SimpleNamespace
+
+import pytest
+
+from api.protocols import SongData
+from api.ytmusic import OfflineError
+from player.playlists import (
+    DEFAULT_NAME,
+    MAGIC,
+    PLACEHOLDER,
+    RECORD_SIZE,
+    Playlist,
+    PlaylistResolver,
+    export_m3u,
+    import_m3u,
+    iter_m3u,
+    list_playlists,
+    open_playlist,
+    pending_path,
+    playlist_name,
+    video_id_of,
+)
+
+IDS: list[str] = ["aaaaaaaaaaa", "bbbbbbbbbbb", "ccccccccccc"]
+
+
+def song(video_id: str, path: str | None = None) -> SongData:
+    return SongData(
+        title=f"Title {video_id}",
+        artist=["Artist"],
+        duration="3:05",
+        video_id=video_id,
+        thumbnail=None,
+        album="Album",
+        path=path,
+    )
+
+
+@pytest.fixture
+def playlist(tmp_path: Path) -> Playlist:
+    return open_playlist(str(tmp_path), "Mix", create=True)
+
+
+def test_record_format(playlist: Playlist) -> None:
+    playlist.extend([IDS[0], "short"])
+    data: bytes = playlist.path.read_bytes()
+    assert data == MAGIC + IDS[0].encode() + b"short".ljust(RECORD_SIZE, b"\0")
+    assert len(playlist) == 2
+    assert list(playlist) == [IDS[0], "short"]
+    assert playlist[1] == "short"
+
+
+def test_record_too_long(playlist: Playlist) -> None:
+    with pytest.raises(ValueError, match="over"):
+        playlist.append("x" * (RECORD_SIZE + 1))
+    assert len(playlist) == 0
+
+
+def test_index_out_of_range(playlist: Playlist) -> None:
+    playlist.append(IDS[0])
+    with pytest.raises(IndexError):
+        playlist[1]
+    with pytest.raises(IndexError):
+        playlist[-1]
+    with pytest.raises(IndexError):
+        playlist.remove(1)
+
+
+def test_setitem_and_remove(playlist: Playlist) -> None:
+    playlist.extend(IDS)
+    playlist[1] = "short"
+    assert list(playlist) == [IDS[0], "short", IDS[2]]
+    playlist.remove(0)
+    assert list(playlist) == ["short", IDS[2]]
+    playlist.remove(1)
+    assert list(playlist) == ["short"]
+
+
+def test_open_playlist(tmp_path: Path) -> None:
+    with pytest.raises(FileNotFoundError):
+        open_playlist(str(tmp_path), "Missing")
+    with pytest.raises(ValueError, match="Invalid"):
+        open_playlist(str(tmp_path), "../escape", create=True)
+    (tmp_path / "Bad.pmtpl").write_bytes(b"garbage")
+    with pytest.raises(ValueError, match="not a playlist"):
+        open_playlist(str(tmp_path), "Bad")
+    open_playlist(str(tmp_path), "B", create=True)
+    open_playlist(str(tmp_path), "A", create=True)
+    assert list_playlists(str(tmp_path)) == ["A", "B", "Bad"]
+
+
+@pytest.mark.parametrize(
+    ("text", "expected"),
+    [
+        ("Road Trip", "Road Trip"),
+        ("Rock & Roll", "Rock _ Roll"),
+        ("../../etc/passwd", "_.._etc_passwd"),
+        (" .-", DEFAULT_NAME),
+        ("x" * 100, "x" * 64),
+    ],
+)
+def test_playlist_name(text: str, expected: str) -> None:
+    assert playlist_name(text) == expected
+
+
+def test_iter_m3u(tmp_path: Path) -> None:
+    path: Path = tmp_path / "list.m3u8"
+    path.write_text(
+        "﻿#EXTM3U\n"
+        "#EXTINF:185,Artist - First\n"
+        "first.mp3\n"
+        "\n"
+        "# a comment\n"
+        "second.mp3\n"
+        "#EXTINF:-1,\n"
+        "third.mp3\n",
+        encoding="utf-8",
+    )
+    assert [(entry.location, entry.title) for entry in iter_m3u(path)] == [
+        ("first.mp3", "Artist - First"),
+        ("second.mp3", None),
+        ("third.mp3", None),
+    ]
+
+
+@pytest.mark.parametrize(
+    ("location", "expected"),
+    [
+        (f"https://music.youtube.com/watch?v={IDS[0]}", IDS[0]),
+        (f"https://www.youtube.com/watch?v={IDS[0]}&list=x", IDS[0]),
+        (f"https://youtu.be/{IDS[0]}", IDS[0]),
+        ("https://youtu.be/too-short", None),
+        (f"https://example.com/watch?v={IDS[0]}", None),
+        (f"/music/{IDS[1]}.mp3", IDS[1]),
+        ("/music/Unknown Song.mp3", None),
+    ],
+)
+def test_video_id_of(location: str, expected: str | None) -> None:
+    assert video_id_of(location, {IDS[1]: song(IDS[1])}) == expected
+
+
+def test_import_keeps_the_order(tmp_path: Path, playlist: Playlist) -> None:
+    playlist.append(IDS[2])
+    path: Path = tmp_path / "list.m3u"
+    path.write_text(
+        f"/music/{IDS[0]}.mp3\n"
+        "#EXTINF:200,Someone - Searched\n"
+        "/elsewhere/song.mp3\n"
+        "/elsewhere/untitled.mp3\n"
+        f"https://youtu.be/{IDS[1]}\n",
+        encoding="utf-8",
+    )
+    result = import_m3u(path, playlist, {IDS[0]: song(IDS[0])})
+    assert result.added == 3
+    assert list(playlist) == [IDS[2], IDS[0], PLACEHOLDER, IDS[1]]
+    assert result.missing == [IDS[1]]
+    assert [(position, entry.title) for position, entry in result.unresolved] == [
+        (2, "Someone - Searched"),
+    ]
+
+
+def test_import_over_several_batches(
+    tmp_path: Path,
+    playlist: Playlist,
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    monkeypatch.setattr("player.playlists.IMPORT_BATCH", 2)
+    path: Path = tmp_path / "list.m3u"
+    path.write_text(
+        "".join(f"#EXTINF:1,Song {index}\nsong{index}.mp3\n" for index in range(5)),
+        encoding="utf-8",
+    )
+    result = import_m3u(path, playlist, {})
+    assert len(playlist) == result.added == 5
+    assert [position for position, _ in result.unresolved] == list(range(5))
+
+
+def test_export_m3u(tmp_path: Path, playlist: Playlist) -> None:
+    local: Path = tmp_path / f"{IDS[0]}.mp3"
+    playlist.extend([IDS[0], PLACEHOLDER, IDS[1]])
+    path: Path = tmp_path / "out.m3u"
+    count: int = export_m3u(playlist, {IDS[0]: song(IDS[0], str(local))}, path)
+    assert count == 2
+    assert path.read_text(encoding="utf-8") == (
+        "#EXTM3U\n"
+        f"#EXTINF:185,Artist - Title {IDS[0]}\n"
+        f"{local.resolve()}\n"
+        f"https://music.youtube.com/watch?v={IDS[1]}\n"
+    )
+    # Exporting and importing again gives back the same songs
+    copy: Playlist = open_playlist(str(tmp_path), "Copy", create=True)
+    import_m3u(path, copy, {IDS[0]: song(IDS[0], str(local))})
+    assert list(copy) == [IDS[0], IDS[1]]
+
+
+def resolver_of(search: Callable[[str], list[SongData]]) -> PlaylistResolver:
+    player = SimpleNamespace(
+        ytm=SimpleNamespace(search=lambda query, _, limit: search(query)),
+        downloader=SimpleNamespace(download=lambda found_song: found_song.video_id),
+    )
+    return PlaylistResolver(player, lambda _: None)
+
+
+def write_m3u(tmp_path: Path, *titles: str) -> Path:
+    path: Path = tmp_path / "list.m3u"
+    path.write_text(
+        f"https://youtu.be/{IDS[0]}\n"
+        + "".join(f"#EXTINF:200,{title}\nsong.mp3\n" for title in titles),
+        encoding="utf-8",
+    )
+    return path
+
+
+def test_resolver_replaces_the_placeholder(tmp_path: Path, playlist: Playlist) -> None:
+    searching = threading.Event()
+    found = threading.Event()
+
+    def search(_: str) -> list[SongData]:
+        searching.set()
+        found.wait(5)
+        return [song(IDS[1])]
+
+    resolver: PlaylistResolver = resolver_of(search)
+    path: Path = write_m3u(tmp_path, "Someone - Searched")
+    resolver.import_m3u(path, playlist, {IDS[0]: song(IDS[0])})
+    assert searching.wait(5)
+    # The title is saved until it is resolved
+    assert pending_path(playlist).exists()
+    found.set()
+    resolver._executor.shutdown(wait=True)  # noqa: SLF001
+    assert list(playlist) == [IDS[0], IDS[1]]
+    assert not pending_path(playlist).exists()
+
+
+def test_resolver_removes_what_is_not_found(tmp_path: Path, playlist: Playlist) -> None:
+    resolver: PlaylistResolver = resolver_of(
+        lambda query: [song(IDS[2])] if query == "Found" else [],
+    )
+    path: Path = write_m3u(tmp_path, "Missing", "Found")
+    resolver.import_m3u(path, playlist, {IDS[0]: song(IDS[0])})
+    resolver._executor.shutdown(wait=True)  # noqa: SLF001
+    # The title after the one removed follows its placeholder
+    assert list(playlist) == [IDS[0], IDS[2]]
+
+
+def test_resolver_follows_removals(tmp_path: Path, playlist: Playlist) -> None:
+    searching = threading.Event()
+    found = threading.Event()
+
+    def search(_: str) -> list[SongData]:
+        searching.set()
+        found.wait(5)
+        return [song(IDS[2])]
+
+    resolver: PlaylistResolver = resolver_of(search)
+    path: Path = write_m3u(tmp_path, "Searched")
+    resolver.import_m3u(path, playlist, {IDS[0]: song(IDS[0])})
+    assert searching.wait(5)
+    resolver.remove(playlist, 0)
+    found.set()
+    resolver._executor.shutdown(wait=True)  # noqa: SLF001
+    assert list(playlist) == [IDS[2]]
+
+
+def test_resolver_skips_a_slot_that_is_gone(tmp_path: Path, playlist: Playlist) -> None:
+    searching = threading.Event()
+    found = threading.Event()
+
+    def search(_: str) -> list[SongData]:
+        searching.set()
+        found.wait(5)
+        return [song(IDS[2])]
+
+    resolver: PlaylistResolver = resolver_of(search)
+    path: Path = write_m3u(tmp_path, "Searched")
+    resolver.import_m3u(path, playlist, {IDS[0]: song(IDS[0])})
+    assert searching.wait(5)
+    # Written over from outside the resolver
+    playlist[1] = IDS[1]
+    found.set()
+    resolver._executor.shutdown(wait=True)  # noqa: SLF001
+    assert list(playlist) == [IDS[0], IDS[1]]
+
+
+def test_resolver_resumes_the_titles_left(tmp_path: Path, playlist: Playlist) -> None:
+    def offline(_: str) -> list[SongData]:
+        msg = "YouTube Music can't be reached"
+        raise OfflineError(msg)
+
+    resolver: PlaylistResolver = resolver_of(offline)
+    path: Path = write_m3u(tmp_path, "First", "Second")
+    resolver.import_m3u(path, playlist, {IDS[0]: song(IDS[0])})
+    resolver._executor.shutdown(wait=True)  # noqa: SLF001
+    assert list(playlist) == [IDS[0], PLACEHOLDER, PLACEHOLDER]
+
+    # The next run searches them again
+    resolver = resolver_of(lambda query: [song(IDS[1 if query == "First" else 2])])
+    resolver.resume(str(playlist.path.parent))
+    resolver._executor.shutdown(wait=True)  # noqa: SLF001
+    assert list(playlist) == IDS
+    assert not pending_path(playlist).exists()
@@ -0,0 +1,88 @@
+import pytest
+
+from api.quality import (
+    DEFAULT_DURATION,
+    TARGET_TIME_TO_PLAY,
+    TIERS,
+    BandwidthEstimator,
+    QualityPolicy,
+)
+
+
+def estimator_at(bandwidth: float) -> BandwidthEstimator:
+    estimator = BandwidthEstimator()
+    estimator.add_sample(round(bandwidth), 1.0)
+    return estimator
+
+
+def needed(tier: str, duration: int = DEFAULT_DURATION) -> float:
+    """The bandwidth downloading a tier within the time-to-play target."""
+    return duration * TIERS[tier].source_kbps * 1000 / 8 / TARGET_TIME_TO_PLAY
+
+
+def test_first_sample_is_the_estimate() -> None:
+    estimator = BandwidthEstimator()
+    assert estimator.estimate is None
+    estimator.add_sample(1000, 2.0)
+    assert estimator.estimate == 500
+
+
+def test_samples_are_averaged() -> None:
+    estimator = BandwidthEstimator(alpha=0.25)
+    estimator.add_sample(1000, 1.0)
+    estimator.add_sample(2000, 1.0)
+    assert estimator.estimate == pytest.approx(1250)
+    estimator.add_sample(250, 1.0)
+    assert estimator.estimate == pytest.approx(1000)
+
+
+@pytest.mark.parametrize(("size", "seconds"), [(0, 1.0), (-1, 1.0), (1000, 0.0)])
+def test_empty_samples_are_ignored(size: int, seconds: float) -> None:
+    estimator = BandwidthEstimator()
+    estimator.add_sample(size, seconds)
+    assert estimator.estimate is None
+    estimator.add_sample(1000, 1.0)
+    estimator.add_sample(size, seconds)
+    assert estimator.estimate == 1000
+
+
+def test_high_without_estimate() -> None:
+    assert QualityPolicy(BandwidthEstimator()).choose(DEFAULT_DURATION).name == "high"
+
+
+@pytest.mark.parametrize(
+    ("bandwidth", "tier"),
+    [
+        (needed("high"), "high"),
+        (needed("high") - 1, "medium"),
+        (needed("medium"), "medium"),
+        (needed("medium") - 1, "low"),
+        (1, "low"),
+    ],
+)
+def test_tier_boundaries(bandwidth: float, tier: str) -> None:
+    policy = QualityPolicy(estimator_at(bandwidth))
+    assert policy.choose(DEFAULT_DURATION).name == tier
+
+
+def test_unknown_duration_is_the_default_one() -> None:
+    policy = QualityPolicy(estimator_at(needed("high")))
+    assert policy.choose(None).name == "high"
+    assert policy.choose(DEFAULT_DURATION + 1).name == "medium"
+
+
+def test_shorter_songs_get_a_better_tier() -> None:
+    policy = QualityPolicy(estimator_at(needed("medium")))
+    assert policy.choose(DEFAULT_DURATION).name == "medium"
+    assert policy.choose(DEFAULT_DURATION // 2).name == "high"
+
+
+def test_pinned_tier() -> None:
+    policy = QualityPolicy(estimator_at(1), pinned="high")
+    assert policy.choose(DEFAULT_DURATION).name == "high"
+
+
+def test_unknown_pinned_tier_is_auto() -> None:
+    policy = QualityPolicy(estimator_at(1), pinned="lossless")
+    assert policy.pinned == "auto"
+    assert policy.choose(DEFAULT_DURATION).name == "low"
@@ -0,0 +1,176 @@
+from pathlib import Path
+
+import pytest
+
+from api.protocols import SongData
+from player.queue import PlayQueue, QueueState, load_queue, save_queue
+
+
+def songs(*video_ids: str) -> list[SongData]:
+    return [
+        SongData(
+            title=video_id,
+            artist=["Artist"],
+            duration="3:00",
+            video_id=video_id,
+            thumbnail=None,
+            album="Album",
+        )
+        for video_id in video_ids
+    ]
+
+
+def is_permutation(queue: PlayQueue, size: int) -> bool:
+    return sorted(queue.order) == list(range(size)) and all(
+        queue.order[queue._position[index]] == index for index in range(size)  # noqa: SLF001
+    )
+
+
+def test_next_wraps_around() -> None:
+    queue = PlayQueue(3)
+    assert [queue.next() for _ in range(4)] == [1, 2, 0, 1]
+
+
+def test_previous_follows_history() -> None:
+    queue = PlayQueue(5)
+    queue.jump(3)
+    queue.next()
+    assert queue.current == 4
+    assert queue.previous() == 3
+    assert queue.previous() == 0
+
+
+def test_previous_without_history_goes_back_in_queue() -> None:
+    queue = PlayQueue(3)
+    assert queue.previous() == 2
+
+
+def test_jump_without_remember() -> None:
+    queue = PlayQueue(3)
+    queue.jump(2, remember=False)
+    assert not queue.history
+
+
+def test_empty_queue() -> None:
+    queue = PlayQueue(0)
+    assert queue.current == 0
+    assert queue.next() == 0
+    assert queue.previous() == 0
+    queue.shuffle()
+    assert queue.shuffled
+
+
+def test_shuffle_keeps_current_first() -> None:
+    queue = PlayQueue(50)
+    queue.jump(7)
+    queue.shuffle()
+    assert queue.current == 7
+    assert queue.cursor == 0
+    assert is_permutation(queue, 50)
+
+
+def test_unshuffle_restores_library_order() -> None:
+    queue = PlayQueue(10)
+    queue.shuffle()
+    queue.jump(4)
+    queue.unshuffle()
+    assert queue.order == list(range(10))
+    assert queue.current == 4
+
+
+def test_upcoming_and_window() -> None:
+    queue = PlayQueue(5)
+    queue.jump(3)
+    assert list(queue.upcoming(3)) == [4, 0, 1]
+    assert list(PlayQueue(1).upcoming(3)) == []
+    assert queue.window(1, 1) == [2, 3, 4]
+
+
+def test_update_removes_songs() -> None:
+    queue = PlayQueue(5)
+    queue.jump(1)
+    queue.jump(3)
+    # Song 1 is removed, songs after it move down by one
+    queue.update([0, None, 1, 2, 3], 4)
+    assert queue.order == [0, 1, 2, 3]
+    assert queue.current == 2
+    assert list(queue.history) == [0]
+
+
+def test_update_removing_current_song() -> None:
+    queue = PlayQueue(3)
+    queue.jump(2)
+    queue.update([0, 1, None], 2)
+    assert queue.cursor == 1
+    assert queue.current == 1
+    queue.update([None, None], 0)
+    assert queue.cursor == 0
+    assert queue.order == []
+
+
+def test_update_adds_songs_at_the_end_while_shuffled() -> None:
+    queue = PlayQueue(10)
+    queue.shuffle()
+    kept: list[int] = list(queue.order)
+    current: int = queue.current
+    queue.update(list(range(10)), 15)
+    assert queue.order[:10] == kept
+    assert sorted(queue.order[10:]) == list(range(10, 15))
+    assert queue.current == current
+    assert is_permutation(queue, 15)
+
+
+def test_state_round_trip() -> None:
+    library: list[SongData] = songs("a", "b", "c", "d")
+    queue = PlayQueue(4)
+    queue.shuffle()
+    queue.next()
+    restored: PlayQueue = PlayQueue.from_state(queue.state(library), library)
+    assert restored.order == queue.order
+    assert restored.cursor == queue.cursor
+    assert restored.shuffled
+    assert list(restored.history) == list(queue.history)
+
+
+def test_from_state_over_a_changed_library() -> None:
+    state = QueueState(order=["c", "gone", "a", "c", "b"], cursor=2, history=["gone", "b"])
+    library: list[SongData] = songs("a", "b", "c", "new")
+    queue: PlayQueue = PlayQueue.from_state(state, library)
+    # Unknown and repeated ids are dropped, new songs go at the end
+    assert [library[index].video_id for index in queue.order] == ["c", "a", "b", "new"]
+    assert library[queue.current].video_id == "a"
+    assert list(queue.history) == [1]
+    assert is_permutation(queue, 4)
+
+
+@pytest.mark.parametrize(
+    ("order", "expected"),
+    [
+        # The current song is gone, the one before it in the queue is current
+        (["a", "b", "gone", "c"], "b"),
+        # Nothing is left before it, the queue starts over
+        (["gone", "c", "a", "b"], "c"),
+    ],
+)
+def test_from_state_cursor_on_a_removed_song(order: list[str], expected: str) -> None:
+    library: list[SongData] = songs("a", "b", "c")
+    cursor: int = order.index("gone")
+    queue: PlayQueue = PlayQueue.from_state(QueueState(order=order, cursor=cursor), library)
+    assert library[queue.current].video_id == expected
+
+
+def test_save_and_load(tmp_path: Path) -> None:
+    library: list[SongData] = songs("a", "b", "c")
+    queue = PlayQueue(3)
+    queue.jump(2)
+    save_queue(str(tmp_path), queue.state(library))
+    loaded: PlayQueue = load_queue(str(tmp_path), library)
+    assert loaded.current == 2
+    assert list(loaded.history) == [0]
+
+
+def test_load_missing_or_unreadable(tmp_path: Path) -> None:
+    library: list[SongData] = songs("a", "b")
+    assert load_queue(str(tmp_path), library).order == [0, 1]
+    (tmp_path / "queue.msgpack").write_bytes(b"not msgpack")
+    assert load_queue(str(tmp_path), library).order == [0, 1]
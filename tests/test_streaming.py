@@ -0,0 +1,148 @@
+import http.client
+from collections.abc import Iterator
+from pathlib import Path
+from types import SimpleNamespace
+
+import pytest
+
+from api.protocols import SongData
+from api.streaming import StreamServer
+
+BODY: bytes = bytes(range(100))
+
+
+@pytest.fixture(scope="module")
+def server(tmp_path_factory: pytest.TempPathFactory) -> Iterator[StreamServer]:
+    tmp_path: Path = tmp_path_factory.mktemp("library")
+    track: Path = tmp_path / "aaaaaaaaaaa.mp3"
+    track.write_bytes(BODY)
+    song = SongData(
+        title="Track",
+        artist=["Artist"],
+        duration="3:00",
+        video_id="aaaaaaaaaaa",
+        thumbnail=None,
+        album="Album",
+        path=str(track),
+    )
+    player = SimpleNamespace(
+        list_of_downloaded_songs=[song],
+        add_listener=lambda _: None,
+    )
+    server = StreamServer(player, str(tmp_path), "127.0.0.1", 0)
+    server.start()
+    yield server
+    server.stop()
+
+
+def get(
+    server: StreamServer,
+    headers: dict[str, str] | None = None,
+) -> tuple[http.client.HTTPResponse, bytes]:
+    host, port = server.server_address[:2]
+    connection = http.client.HTTPConnection(host, port, timeout=5)
+    try:
+        connection.request("GET", "/tracks/aaaaaaaaaaa", headers=headers or {})
+        response: http.client.HTTPResponse = connection.getresponse()
+        return response, response.read()
+    finally:
+        connection.close()
+
+
+def test_whole_file(server: StreamServer) -> None:
+    response, body = get(server)
+    assert response.status == 200
+    assert body == BODY
+    assert response.getheader("Accept-Ranges") == "bytes"
+
+
+def test_range(server: StreamServer) -> None:
+    response, body = get(server, {"Range": "bytes=10-19"})
+    assert response.status == 206
+    assert body == BODY[10:20]
+    assert response.getheader("Content-Range") == "bytes 10-19/100"
+
+
+def test_open_ended_range(server: StreamServer) -> None:
+    response, body = get(server, {"Range": "bytes=90-"})
+    assert response.status == 206
+    assert body == BODY[90:]
+    assert response.getheader("Content-Range") == "bytes 90-99/100"
+
+
+def test_range_past_the_end_is_clamped(server: StreamServer) -> None:
+    response, body = get(server, {"Range": "bytes=95-200"})
+    assert response.status == 206
+    assert body == BODY[95:]
+
+
+def test_suffix_range(server: StreamServer) -> None:
+    response, body = get(server, {"Range": "bytes=-5"})
+    assert response.status == 206
+    assert body == BODY[-5:]
+    assert response.getheader("Content-Range") == "bytes 95-99/100"
+
+
+def test_suffix_range_longer_than_the_file(server: StreamServer) -> None:
+    response, body = get(server, {"Range": "bytes=-500"})
+    assert response.status == 206
+    assert body == BODY
+
+
+@pytest.mark.parametrize("byte_range", ["bytes=100-", "bytes=150-160", "bytes=20-10"])
+def test_unsatisfiable_range(server: StreamServer, byte_range: str) -> None:
+    response, body = get(server, {"Range": byte_range})
+    assert response.status == 416
+    assert body == b""
+    assert response.getheader("Content-Range") == "bytes */100"
+
+
+@pytest.mark.parametrize("byte_range", ["bytes=0-9,20-29", "bytes=-", "items=0-9"])
+def test_other_ranges_send_the_whole_file(
+    server: StreamServer,
+    byte_range: str,
+) -> None:
+    response, body = get(server, {"Range": byte_range})
+    assert response.status == 200
+    assert body == BODY
+
+
+def test_if_range_of_an_old_version_sends_the_whole_file(
+    server: StreamServer,
+) -> None:
+    response, body = get(server, {"Range": "bytes=0-9", "If-Range": '"stale"'})
+    assert response.status == 200
+    assert body == BODY
+
+
+def test_if_range_of_this_version(server: StreamServer) -> None:
+    etag: str = get(server)[0].getheader("ETag")
+    response, body = get(server, {"Range": "bytes=0-9", "If-Range": etag})
+    assert response.status == 206
+    assert body == BODY[:10]
+
+
+def test_if_none_match(server: StreamServer) -> None:
+    etag: str = get(server)[0].getheader("ETag")
+    response, body = get(server, {"If-None-Match": f'"other", {etag}'})
+    assert response.status == 304
+    assert body == b""
+    assert response.getheader("ETag") == etag
+    assert get(server, {"If-None-Match": '"other"'})[0].status == 200
+
+
+def test_if_modified_since(server: StreamServer) -> None:
+    last_modified: str = get(server)[0].getheader("Last-Modified")
+    assert get(server, {"If-Modified-Since": last_modified})[0].status == 304
+    earlier: str = "Thu, 01 Jan 1970 00:00:00 GMT"
+    assert get(server, {"If-Modified-Since": earlier})[0].status == 200
+    assert get(server, {"If-Modified-Since": "yesterday"})[0].status == 200
+
+
+def test_if_none_match_wins_over_if_modified_since(server: StreamServer) -> None:
+    last_modified: str = get(server)[0].getheader("Last-Modified")
+    headers: dict[str, str] = {
+        "If-None-Match": '"other"',
+        "If-Modified-Since": last_modified,
+    }
+    assert get(server, headers)[0].status == 200